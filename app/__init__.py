@@ -46,9 +46,53 @@ def create_app(config_name='default'):
     # 4. 初始化数据库
     db_helper.init_app(app)
 
+    # [新增] 订单库存预留的后台清理线程与 'flask sweep-reservations' 命令
+    from . import orders
+    orders.init_app(app)
+
+    # [新增] 分类的后台分批删除与 'flask delete-categories' 命令
+    from . import category_deletion
+    category_deletion.init_app(app)
+
+    # [新增] 相关商品的离线计算命令 'flask build-related'
+    from . import related
+    related.init_app(app)
+
+    # [新增] 小写入的单写者队列与 'flask writer' 写进程命令
+    from . import writer
+    writer.init_app(app)
+
+    # [新增] 目录变更日志的清理命令 'flask prune-changes'
+    from . import change_log
+    change_log.init_app(app)
+
+    # [新增] 数据库维护命令 'flask db-maintain'
+    from . import maintenance
+    maintenance.init_app(app)
+
+    # [新增] 在线备份与快照恢复命令 'flask backup' / 'flask restore'
+    from . import backup
+    backup.init_app(app)
+
+    # [新增] HTTP 缓存：CDN 缓存清除器
+    from . import http_cache
+    http_cache.init_app(app)
+
+    # [新增] 静态导出命令 'flask freeze-catalog'
+    from . import freeze
+    freeze.init_app(app)
+
     # 5. 注册 Jinja 过滤器
     app.jinja_env.filters['nl2br'] = utils.nl2br_filter
 
+    # [新增] Jinja 字节码缓存与 'flask compile-templates' 命令
+    from . import warmup
+    warmup.init_app(app)
+
+    # [新增] 按需的单请求性能剖析（PROFILING_ENABLED 为真时才注册钩子；先于蓝图的钩子执行）
+    from . import profiling
+    profiling.init_app(app)
+
     # 6. 注册蓝图
     from .main import main_bp
     app.register_blueprint(main_bp)
@@ -8,4 +8,5 @@ admin_bp = Blueprint('admin',
                      static_folder='../static')
 
 # 导入路由
-from . import routes
\ No newline at end of file
+# [新增] uploads：分块、可续传的图片上传接口；profiles：性能剖析记录
+from . import routes, uploads, profiles
\ No newline at end of file
@@ -0,0 +1,34 @@
+from flask import current_app, render_template, request, send_file, abort
+
+from . import admin_bp
+from .routes import login_required
+from app import profiling
+
+# [新增] 性能剖析记录（见 app/profiling.py）：列表、文本报告与 .prof 下载
+
+@admin_bp.route('/profiles')
+@login_required
+def admin_profiles():
+    captures = profiling.list_captures(current_app.config['PROFILE_DIR'])
+    return render_template('profiles.html', captures=captures, enabled=current_app.config.get('PROFILING_ENABLED'),
+                           sample_rate=current_app.config.get('PROFILE_SAMPLE_RATE', 0))
+
+@admin_bp.route('/profiles/<name>')
+@login_required
+def admin_profile_detail(name):
+    path = profiling.capture_path(current_app.config['PROFILE_DIR'], name)
+    if path is None:
+        abort(404)
+    sort = request.args.get('sort', 'cumulative')
+    capture = next((item for item in profiling.list_captures(current_app.config['PROFILE_DIR']) if item['name'] == name),
+                   {'name': name})
+    return render_template('profile_detail.html', capture=capture, sort=sort, sort_keys=profiling.SORT_KEYS,
+                           report=profiling.summary(path, sort))
+
+@admin_bp.route('/profiles/<name>/download')
+@login_required
+def admin_profile_download(name):
+    path = profiling.capture_path(current_app.config['PROFILE_DIR'], name)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=f'{name}.prof')
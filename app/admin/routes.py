@@ -1,7 +1,8 @@
 import os
 import uuid
-import math
+import asyncio
 import sqlite3
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from flask import (
     render_template, request, redirect, url_for, session, flash, 
@@ -11,8 +12,9 @@ from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from . import admin_bp
-from app.db import query_db, get_db
+from app.db import query_db, get_db, LOW_STOCK_THRESHOLD
 from app.utils import allowed_file
+from app import search, http_cache, category_deletion, catalog
 
 # --- 权限保护装饰器 ---
 def login_required(f):
@@ -25,9 +27,32 @@ def login_required(f):
         if not session.get('admin_logged_in'):
             flash('请先登录才能访问管理面板。', 'warning')
             return redirect(url_for('admin.admin_login'))
-        return f(*args, **kwargs)
+        # ensure_sync 使装饰器同时支持同步与 async 视图
+        return current_app.ensure_sync(f)(*args, **kwargs)
     return decorated_function
 
+# --- [新增] 上传文件保存 ---
+async def save_uploads(files, upload_folder):
+    """
+    并发保存上传的图片文件（磁盘写入在线程池中执行），
+    返回数据库中使用的相对路径列表，顺序与 files 一致。
+    同步视图通过 current_app.ensure_sync(save_uploads)(...) 调用：只有这里的文件写入被并发执行，
+    视图其余部分（表单解析、数据库写入、模板渲染）仍在请求线程中，不占用 ASGI 服务器的事件循环。
+    """
+    targets = []
+    for file in files:
+        if file and allowed_file(file.filename):
+            filename = secure_filename(file.filename)
+            # 使用 UUID 确保文件名唯一
+            unique_filename = f"{uuid.uuid4().hex}_{filename}"
+            # 使用 config 中的绝对路径保存
+            targets.append((file, os.path.join(upload_folder, unique_filename), unique_filename))
+
+    await asyncio.gather(*(asyncio.to_thread(file.save, file_path) for file, file_path, _ in targets))
+
+    # 数据库中只存相对路径
+    return [os.path.join('uploads', unique_filename).replace('\\', '/') for _, _, unique_filename in targets]
+
 # --- 管理面板：登录/注销 ---
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def admin_login():
@@ -74,41 +99,16 @@ def admin_index():
     search_query = request.args.get('query', '', type=str).strip()
     per_page = 10
     
-    where_clauses = []
-    params = []
-    
+    # [修改] 筛选与分页使用 catalog 中与前台首页共用的实现
+    product_filter = catalog.ProductFilter(search_query=search_query, search_description=True)
     if category_id:
-        where_clauses.append('p.category_id = ?')
-        params.append(category_id)
+        product_filter.add('p.category_id = ?', category_id)
 
-    if search_query:
-        where_clauses.append('(p.name LIKE ? OR p.description LIKE ?)')
-        params.extend([f'%{search_query}%', f'%{search_query}%'])
-    
-    where_sql = 'WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+    total_products = catalog.count_products(product_filter)
+    total_pages = catalog.page_count(total_products, per_page)
 
-    count_sql = f'SELECT COUNT(p.id) FROM products p {where_sql}'
-    total_products_result = query_db(count_sql, params, one=True)
-    total_products = total_products_result['COUNT(p.id)'] if total_products_result else 0
-    total_pages = math.ceil(total_products / per_page)
-    
-    offset = (page - 1) * per_page
-    
-    products_sql = f"""
-        SELECT 
-            p.*, 
-            c.name AS category_name,
-            (SELECT image_url FROM product_images WHERE product_id = p.id ORDER BY id ASC LIMIT 1) AS primary_image_url
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        {where_sql}
-        ORDER BY p.id DESC 
-        LIMIT ? OFFSET ?
-    """
-    
-    product_params = params + [per_page, offset]
-    products = query_db(products_sql, product_params)
-    categories = query_db('SELECT * FROM categories ORDER BY name')
+    products = catalog.list_products(product_filter, 'p.id DESC', per_page, catalog.page_offset(page, per_page))
+    categories = catalog.list_categories()
 
     return render_template('index.html', 
                            products=products, 
@@ -118,6 +118,46 @@ def admin_index():
                            current_page=page, 
                            total_pages=total_pages)
 
+# --- [新增] 仪表盘：只读取触发器维护的汇总表，耗时与商品数量无关 ---
+@admin_bp.route('/dashboard')
+@login_required
+def admin_dashboard():
+    """
+    管理后台概览：商品总数、缺货/低库存数量、库存总值、各分类统计与近期留言量。
+    """
+    totals = query_db('SELECT * FROM catalog_stats WHERE id = 1', one=True)
+
+    category_stats = query_db('''
+        SELECT c.id, c.name, c.deleted_at, s.product_count, s.out_of_stock_count, s.low_stock_count, s.inventory_value
+        FROM category_stats s JOIN categories c ON c.id = s.category_id
+        ORDER BY s.product_count DESC, c.name
+    ''')
+    uncategorized = (totals['product_count'] if totals else 0) - sum(row['product_count'] for row in category_stats)
+
+    # 部分索引 idx_products_low_stock 只包含低库存的行
+    low_stock_products = query_db(f'''
+        SELECT id, name, stock FROM products
+        WHERE stock > 0 AND stock <= {LOW_STOCK_THRESHOLD}
+        ORDER BY stock, id LIMIT 10
+    ''')
+
+    recent_days = 7
+    daily_comments = {row['day']: row['comment_count'] for row in query_db(
+        "SELECT day, comment_count FROM comment_daily_stats WHERE day > date('now', ?)",
+        [f'-{recent_days} days'])}
+    today = datetime.now(timezone.utc).date()  # created_at 为 UTC 时间
+    comment_volume = [(day.isoformat(), daily_comments.get(day.isoformat(), 0))
+                      for day in (today - timedelta(days=offset) for offset in range(recent_days - 1, -1, -1))]
+
+    return render_template('dashboard.html',
+                           totals=totals,
+                           category_stats=category_stats,
+                           uncategorized=uncategorized,
+                           low_stock_products=low_stock_products,
+                           low_stock_threshold=LOW_STOCK_THRESHOLD,
+                           comment_volume=comment_volume,
+                           recent_comment_total=sum(count for _, count in comment_volume))
+
 @admin_bp.route('/categories', methods=['GET', 'POST'])
 @login_required
 def admin_categories():
@@ -138,8 +178,10 @@ def admin_categories():
 
         db = get_db()
         try:
-            db.execute('INSERT INTO categories (name) VALUES (?)', (category_name,))
+            cursor = db.execute('INSERT INTO categories (name) VALUES (?)', (category_name,))
             db.commit()
+            search.index_category(cursor.lastrowid, category_name)
+            http_cache.purge('listing')
             flash(f'分类 "{category_name}" 添加成功!', 'success')
         except sqlite3.IntegrityError:
             db.rollback()
@@ -150,8 +192,11 @@ def admin_categories():
             
         return redirect(url_for('admin.admin_categories'))
     
-    categories = query_db('SELECT * FROM categories ORDER BY name')
-    return render_template('categories.html', categories=categories)
+    categories = catalog.list_categories()
+    # [新增] 后台删除任务的进度（正在进行的与最近完成的）
+    deletions = query_db('SELECT * FROM category_deletions ORDER BY started_at DESC LIMIT 10')
+    return render_template('categories.html', categories=categories, deletions=deletions,
+                           deletions_running=any(job['status'] == 'running' for job in deletions))
 
 @admin_bp.route('/categories/edit/<int:category_id>', methods=['POST'])
 @login_required
@@ -174,6 +219,8 @@ def admin_edit_category(category_id):
     try:
         db.execute('UPDATE categories SET name = ? WHERE id = ?', (new_name, category_id))
         db.commit()
+        search.index_category(category_id, new_name)
+        http_cache.purge('listing', f'category-{category_id}')
         flash('分类名称更新成功！', 'success')
     except sqlite3.Error as e:
         db.rollback()
@@ -186,59 +233,25 @@ def admin_edit_category(category_id):
 def admin_delete_category(category_id):
     """
     彻底删除分类及其所有相关数据
+    [修改] 请求内只隐藏分类并登记任务，商品、图片和评论由后台线程分批删除。
     """
     db = get_db()
     try:
-        # 1. 获取该分类下的所有商品ID
-        products = query_db('SELECT id FROM products WHERE category_id = ?', [category_id])
-        product_ids = [product['id'] for product in products]
-        
-        # 2. 删除这些商品的所有图片文件
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        
-        if product_ids:
-            # 获取所有相关图片
-            placeholders = ','.join('?' for _ in product_ids)
-            images_to_delete = query_db(
-                f'SELECT image_url FROM product_images WHERE product_id IN ({placeholders})',
-                product_ids
-            )
-            
-            # 删除物理图片文件
-            for image in images_to_delete:
-                filename = os.path.basename(image['image_url'])
-                image_path = os.path.join(upload_folder, filename)
-                if os.path.exists(image_path):
-                    try:
-                        os.remove(image_path)
-                    except OSError as e:
-                        print(f"无法删除图片文件 {image_path}: {e}")
-            
-            # 3. 先删除商品图片记录（避免外键约束问题）
-            db.execute(f'DELETE FROM product_images WHERE product_id IN ({placeholders})', product_ids)
-            
-            # 4. 再删除商品评论（避免外键约束问题）
-            db.execute(f'DELETE FROM comments WHERE product_id IN ({placeholders})', product_ids)
-            
-            # 5. 最后删除商品
-            db.execute(f'DELETE FROM products WHERE category_id = ?', [category_id])
-        
-        # 6. 删除分类
-        db.execute('DELETE FROM categories WHERE id = ?', (category_id,))
-        db.commit()
-        flash('分类及所有相关商品、图片和评论已彻底删除!', 'success')
+        total = category_deletion.soft_delete_category(db, category_id)
     except sqlite3.Error as e:
         db.rollback()
         flash(f'删除分类失败: {e}', 'danger')
-        print(f"数据库错误: {e}")
-        import traceback
-        traceback.print_exc()
-    except Exception as e:
-        db.rollback()
-        flash(f'删除过程中发生错误: {e}', 'danger')
-        print(f"一般错误: {e}")
-        import traceback
-        traceback.print_exc()
+        return redirect(url_for('admin.admin_categories'))
+
+    if total is None:
+        flash('分类不存在或正在删除中。', 'warning')
+        return redirect(url_for('admin.admin_categories'))
+
+    # 分类及其商品已对前台隐藏
+    search.unindex_category(category_id)
+    http_cache.purge('listing', f'category-{category_id}')
+    category_deletion.start_worker(current_app._get_current_object())
+    flash(f'分类已隐藏，正在后台删除 {total} 个商品及其图片和评论。', 'success')
     return redirect(url_for('admin.admin_categories'))
 
 @admin_bp.route('/add', methods=['GET', 'POST'])
@@ -247,6 +260,7 @@ def admin_add_product():
     """
     添加商品。
     **重构修复**：使用绝对路径配置来保存文件。
+    [修改] 图片文件并发写入磁盘（见 save_uploads）。
     """
     if request.method == 'POST':
         name = request.form['name']
@@ -268,24 +282,14 @@ def admin_add_product():
             
             is_primary = 1
             
-            for file in files:
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    # 使用 UUID 确保文件名唯一
-                    unique_filename = f"{uuid.uuid4().hex}_{filename}"
-                    
-                    # 使用 config 中的绝对路径保存
-                    file_path = os.path.join(upload_folder, unique_filename)
-                    file.save(file_path)
-                    
-                    # 数据库中只存相对路径
-                    image_url = os.path.join('uploads', unique_filename).replace('\\', '/') 
-
-                    db.execute('INSERT INTO product_images (product_id, image_url, is_primary) VALUES (?, ?, ?)',
-                               (product_id, image_url, is_primary))
-                    is_primary = 0
+            for image_url in current_app.ensure_sync(save_uploads)(files, upload_folder):
+                db.execute('INSERT INTO product_images (product_id, image_url, is_primary) VALUES (?, ?, ?)',
+                           (product_id, image_url, is_primary))
+                is_primary = 0
             
             db.commit()
+            search.index_product(product_id, name)
+            http_cache.purge('listing')
             flash('商品及图片添加成功！', 'success')
             return redirect(url_for('admin.admin_index'))
             
@@ -294,7 +298,7 @@ def admin_add_product():
             flash(f'添加商品时出错: {e}', 'danger')
             print(f"Error in admin_add_product: {e}")
     
-    categories = query_db('SELECT * FROM categories')
+    categories = catalog.list_categories()
     return render_template('add_product.html', categories=categories)
 
 @admin_bp.route('/edit/<int:product_id>', methods=['GET', 'POST'])
@@ -303,15 +307,16 @@ def admin_edit_product(product_id):
     """
     编辑商品。
     **重构修复**：使用绝对路径配置来保存文件。
+    [修改] 图片文件并发写入磁盘（见 save_uploads）。
     """
-    product_row = query_db('SELECT * FROM products WHERE id = ?', [product_id], one=True)
+    # [修改] 商品与图片一次查询取回
+    product_row = catalog.get_product_for_edit(product_id)
     if not product_row:
         flash(f'商品ID {product_id} 未找到。', 'danger')
         return redirect(url_for('admin.admin_index')) 
     
-    product = dict(product_row)
-    images = query_db('SELECT id, image_url, is_primary FROM product_images WHERE product_id = ? ORDER BY is_primary DESC, id ASC', 
-                      [product_id])
+    product = product_row._asdict()
+    images = product.pop('images')
 
     if request.method == 'POST':
         db = get_db()
@@ -330,23 +335,16 @@ def admin_edit_product(product_id):
             upload_folder = current_app.config['UPLOAD_FOLDER']
 
             if any(f.filename for f in new_files):
-                current_image_count = query_db('SELECT COUNT(id) FROM product_images WHERE product_id = ?', [product_id], one=True)['COUNT(id)']
-                is_primary = current_image_count == 0
-
-                for file in new_files:
-                    if file and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-                        
-                        file_path = os.path.join(upload_folder, unique_filename)
-                        file.save(file_path)
-                        image_url = os.path.join('uploads', unique_filename).replace('\\', '/')
-                        
-                        db.execute('INSERT INTO product_images (product_id, image_url, is_primary) VALUES (?, ?, ?)',
-                                   (product_id, image_url, is_primary))
-                        is_primary = False 
+                is_primary = not images
+
+                for image_url in current_app.ensure_sync(save_uploads)(new_files, upload_folder):
+                    db.execute('INSERT INTO product_images (product_id, image_url, is_primary) VALUES (?, ?, ?)',
+                               (product_id, image_url, is_primary))
+                    is_primary = False 
             
             db.commit()
+            search.index_product(product_id, name)
+            http_cache.purge('listing', f'product-{product_id}')
             flash('商品信息更新成功！', 'success')
             return redirect(url_for('admin.admin_index'))
 
@@ -364,7 +362,7 @@ def admin_edit_product(product_id):
             db.rollback()
             flash(f'更新时发生严重错误: {e}', 'danger')
 
-    categories = query_db('SELECT * FROM categories')
+    categories = catalog.list_categories()
     return render_template('edit_product.html', 
                            product=product, 
                            categories=categories, 
@@ -410,6 +408,7 @@ def admin_delete_image(image_id):
                 db.execute('UPDATE product_images SET is_primary = 1 WHERE id = ?', [other_image['id']])
         
         db.commit()
+        http_cache.purge(f'product-{product_id}')
         flash('图片删除成功!', 'success')
         
     except Exception as e:
@@ -442,6 +441,8 @@ def admin_delete_product(product_id):
         # 3. 删除商品记录 (ON DELETE CASCADE 会自动删除 product_images)
         db.execute('DELETE FROM products WHERE id = ?', [product_id])
         db.commit()
+        search.unindex_product(product_id)
+        http_cache.purge('listing', f'product-{product_id}')
         flash('商品已删除!', 'success')
         
     except Exception as e:
@@ -0,0 +1,235 @@
+import hashlib
+import os
+import uuid
+from flask import request, jsonify, current_app, url_for
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError: # Windows 开发环境：不做跨进程文件锁
+    fcntl = None
+
+from . import admin_bp
+from .routes import login_required
+from app.db import get_db, begin_immediate, NOW_SQL
+from app.utils import allowed_file
+from app import http_cache
+
+# [新增] 大图片的分块、可续传上传（管理后台）：
+# 1. POST   /admin/uploads                 登记上传：product_id、filename、size，可选整个文件的 sha256
+# 2. PATCH  /admin/uploads/<id>            上传一块：请求体为原始字节（不经表单解析，边读边写入临时文件），
+#           Upload-Offset 头必须等于服务器已接收的字节数，可选 Upload-Checksum: sha256 <十六进制>
+# 3. GET    /admin/uploads/<id>            查询已接收的字节数（连接中断后从这里继续）
+# 4. DELETE /admin/uploads/<id>            放弃上传
+# 最后一块写入后校验整个文件，移动到 UPLOAD_FOLDER，并像表单上传一样写入 product_images。
+
+_READ_SIZE = 64 * 1024
+
+def _partial_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial', f'{upload_id}.part')
+
+def _error(message, status, **extra):
+    return jsonify(error=message, **extra), status
+
+def _state(upload):
+    return {'id': upload['id'], 'offset': upload['received'], 'size': upload['size'],
+            'chunk_size': current_app.config.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)}
+
+def _expire_sessions(db):
+    """ 删除超过 UPLOAD_SESSION_TTL 秒没有进展的上传及其临时文件 """
+    ttl = current_app.config.get('UPLOAD_SESSION_TTL', 24 * 3600)
+    expired = [row['id'] for row in db.execute(
+        "SELECT id FROM upload_sessions WHERE updated_at < datetime('now', ?)", (f'-{ttl} seconds',))]
+    for upload_id in expired:
+        _remove(_partial_path(upload_id))
+    if expired:
+        db.executemany('DELETE FROM upload_sessions WHERE id = ?', [(upload_id,) for upload_id in expired])
+        db.commit()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"无法删除临时文件 {path}: {e}")
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@admin_bp.route('/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    data = request.get_json(silent=True) or request.form
+    original_filename = str(data.get('filename', ''))
+    sha256 = (data.get('sha256') or '').lower() or None
+    try:
+        product_id = int(data.get('product_id'))
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return _error('product_id 与 size 必须为整数。', 400)
+
+    if not allowed_file(original_filename):
+        return _error('不支持的文件类型。', 400)
+    # secure_filename 会去掉非 ASCII 字符（例如中文文件名），此时只保留扩展名
+    filename = secure_filename(original_filename)
+    if '.' not in filename:
+        filename = 'image.' + original_filename.rsplit('.', 1)[1].lower()
+    max_size = current_app.config.get('UPLOAD_MAX_SIZE', 64 * 1024 * 1024)
+    if not 0 < size <= max_size:
+        return _error(f'文件大小必须在 1 到 {max_size} 字节之间。', 413)
+
+    db = get_db()
+    if db.execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone() is None:
+        return _error('商品不存在。', 404)
+    _expire_sessions(db)
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(os.path.dirname(_partial_path(upload_id)), exist_ok=True)
+    open(_partial_path(upload_id), 'wb').close()
+    db.execute('INSERT INTO upload_sessions (id, product_id, filename, size, sha256) VALUES (?, ?, ?, ?, ?)',
+               (upload_id, product_id, filename, size, sha256))
+    db.commit()
+
+    upload = db.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    response = jsonify(_state(upload))
+    response.status_code = 201
+    response.headers['Location'] = url_for('admin.upload_status', upload_id=upload_id)
+    return response
+
+@admin_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    upload = get_db().execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    if upload is None:
+        return _error('上传不存在或已过期。', 404)
+    return jsonify(_state(upload))
+
+@admin_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    db = get_db()
+    db.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+    db.commit()
+    _remove(_partial_path(upload_id))
+    return '', 204
+
+def _received(db, upload_id):
+    row = db.execute('SELECT received FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    return row['received'] if row else None
+
+def _write_chunk(db, upload_id, path, offset, limit, expected_sha256):
+    """
+    从请求体读取至多 limit 个字节写入 path 的 offset 处，并把已接收的字节数推进到 offset + 写入的字节数。
+    返回 (写入的字节数, 错误响应或 None)；校验失败时把文件截断回 offset，不留下半块数据。
+    文件锁一直持有到数据库中的 offset 更新之后：同一 offset 的两个并发请求只有一个成功，另一个返回 409。
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0, _error('该上传的另一块正在写入。', 409, offset=offset)
+        # 拿到锁之后再确认一次：另一个请求可能刚刚写完同一块并推进了 offset
+        current = _received(db, upload_id)
+        if current != offset:
+            return 0, _error('Upload-Offset 与服务器已接收的字节数不一致。', 409, offset=current)
+        # 上一次中断的请求可能写入了未确认的数据：以数据库中的 offset 为准
+        f.truncate(offset)
+        f.seek(offset)
+        while True:
+            block = request.stream.read(min(_READ_SIZE, limit - written + 1))
+            if not block:
+                break
+            written += len(block)
+            if written > limit:
+                f.truncate(offset)
+                return 0, _error('数据块超出文件大小或单块上限。', 413, offset=offset)
+            digest.update(block)
+            f.write(block)
+        if expected_sha256 and digest.hexdigest() != expected_sha256:
+            f.truncate(offset)
+            return 0, _error('数据块校验失败。', 400, offset=offset)
+        f.flush()
+        os.fsync(f.fileno())
+
+        # 只有 offset 未被并发修改时才前进
+        updated = db.execute(
+            f'UPDATE upload_sessions SET received = ?, updated_at = {NOW_SQL} WHERE id = ? AND received = ?',
+            (offset + written, upload_id, offset)).rowcount
+        db.commit()
+        if updated != 1:
+            return 0, _error('Upload-Offset 与服务器已接收的字节数不一致。', 409, offset=_received(db, upload_id))
+    return written, None
+
+@admin_bp.route('/uploads/<upload_id>', methods=['PATCH'])
+@login_required
+def upload_chunk(upload_id):
+    db = get_db()
+    upload = db.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    if upload is None:
+        return _error('上传不存在或已过期。', 404)
+
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset != upload['received']:
+        # 客户端应先 GET 当前进度，再从服务器确认的位置继续
+        return _error('Upload-Offset 与服务器已接收的字节数不一致。', 409, offset=upload['received'])
+
+    expected_sha256 = None
+    checksum = request.headers.get('Upload-Checksum', '')
+    if checksum:
+        algorithm, _, value = checksum.partition(' ')
+        if algorithm.lower() != 'sha256' or not value:
+            return _error('Upload-Checksum 仅支持 "sha256 <十六进制摘要>"。', 400)
+        expected_sha256 = value.strip().lower()
+
+    chunk_limit = current_app.config.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+    path = _partial_path(upload_id)
+    if not os.path.exists(path):
+        return _error('临时文件丢失，请重新上传。', 410)
+    written, error = _write_chunk(db, upload_id, path, offset, min(chunk_limit, upload['size'] - offset),
+                                  expected_sha256)
+    if error:
+        return error
+
+    received = offset + written
+
+    if received < upload['size']:
+        return jsonify(id=upload_id, offset=received, size=upload['size'], complete=False)
+    return _complete(db, upload, path)
+
+def _complete(db, upload, path):
+    """ 校验整个文件，移入上传目录并挂到商品上 """
+    if upload['sha256'] and _file_sha256(path) != upload['sha256']:
+        # 整个文件不一致：只能从头重传
+        db.execute(f'UPDATE upload_sessions SET received = 0, updated_at = {NOW_SQL} WHERE id = ?', (upload['id'],))
+        db.commit()
+        open(path, 'wb').close()
+        return _error('文件校验失败，请重新上传。', 422, offset=0)
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    unique_filename = f"{uuid.uuid4().hex}_{upload['filename']}"
+    os.replace(path, os.path.join(upload_folder, unique_filename))
+    image_url = os.path.join('uploads', unique_filename).replace('\\', '/')
+
+    begin_immediate(db)
+    try:
+        has_images = db.execute('SELECT 1 FROM product_images WHERE product_id = ? LIMIT 1',
+                                (upload['product_id'],)).fetchone()
+        db.execute('INSERT INTO product_images (product_id, image_url, is_primary) VALUES (?, ?, ?)',
+                   (upload['product_id'], image_url, 0 if has_images else 1))
+        db.execute('DELETE FROM upload_sessions WHERE id = ?', (upload['id'],))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _remove(os.path.join(upload_folder, unique_filename))
+        return _error(f'保存图片记录失败: {e}', 500)
+
+    http_cache.purge('listing', f"product-{upload['product_id']}")
+    return jsonify(id=upload['id'], offset=upload['size'], size=upload['size'], complete=True, image_url=image_url)
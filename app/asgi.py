@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+# asgiref 的 WsgiToAsgi 默认以 thread_sensitive=True 调用 WSGI 应用，
+# 即所有请求都排队在同一个线程里执行，并发度为 1。
+# 这里改为在有界线程池中执行，等待 I/O（邮件、文件写入）的请求互不阻塞。
+# async 视图并不因此额外获得并发：Flask 在请求线程中等待视图结束（asgiref 把协程调度回服务器的事件循环），
+# 视图中的 asyncio.to_thread 使用该循环的默认线程池，默认只有 min(32, CPU 数 + 4) 个线程，
+# 会把 /contact 等视图的并发限制在这个数目。因此同时把循环的默认线程池换成同样大小的独立线程池
+# （不能与请求线程池共用：请求线程在等待这些任务）。
+
+# 父类中被 @sync_to_async 包装的原始同步函数。这是 asgiref 的内部实现（没有公开的替代接口），
+# 因此 requirements.txt 固定了 asgiref 的版本；升级前需确认 run_wsgi_app 仍是这样包装的。
+try:
+    _run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+except (KeyError, AttributeError):
+    raise ImportError('app.asgi 与当前 asgiref 版本不兼容：WsgiToAsgiInstance.run_wsgi_app 的实现已变化')
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=self.executor)
+        await run(self, body)
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """
+    将 Flask (WSGI) 应用包装为 ASGI 应用，每个请求在线程池中执行。
+    """
+
+    def __init__(self, wsgi_application, max_threads=32, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi')
+        self.offload_executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-offload')
+        self._loop = None
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            loop.set_default_executor(self.offload_executor)
+            self._loop = loop
+        instance = _ThreadPoolWsgiInstance(self.wsgi_application, self.executor, self.duplicate_header_limit)
+        await instance(scope, receive, send)
+
+def make_asgi_app(app):
+    """
+    由 Flask 应用创建 ASGI 应用，线程数由 ASGI_THREADS 配置。
+    """
+    return ThreadPoolWsgiToAsgi(app, max_threads=app.config.get('ASGI_THREADS', 32))
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+try:
+    import fcntl
+except ImportError: # Windows 开发环境：不做跨进程文件锁
+    fcntl = None
+
+from app.db import connect, begin_immediate
+from app import cache, http_cache
+
+# 在线热备份与快照恢复（'flask backup' / 'flask restore'）。
+# 每个快照是 BACKUP_DIR 下的一个目录：
+#   products.db     用 SQLite 在线备份 API 分步复制（每步 BACKUP_PAGES_PER_STEP 页，步与步之间让出时间），
+#                   得到某一时刻的一致副本，备份期间网站照常读写；
+#   uploads/        上传目录的增量快照：与上一个快照相同（大小、修改时间一致）的文件以硬链接共享，只复制新文件；
+#   manifest.json   数据库与每个文件的大小和 sha256，恢复前据此校验。
+# 快照先写入 .<名称>.tmp，完成后改名，因此 BACKUP_DIR 中只会出现完整的快照。
+
+_READ_SIZE = 1024 * 1024
+_MANIFEST = 'manifest.json'
+_DB_NAME = 'products.db'
+
+class _BackupRestarted(Exception):
+    """ 备份期间源数据库被其它连接写入的次数过多 """
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _copy_file(source, target):
+    """ 复制文件（保留修改时间）并返回 sha256 """
+    digest = hashlib.sha256()
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        for block in iter(lambda: src.read(_READ_SIZE), b''):
+            digest.update(block)
+            dst.write(block)
+    shutil.copystat(source, target)
+    return digest.hexdigest()
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:  # 跨文件系统或文件系统不支持硬链接
+        shutil.copy2(source, target)
+
+def _walk_files(root):
+    """ root 下的普通文件（相对路径，'/' 分隔）；跳过隐藏文件与目录，例如分块上传的 .partial """
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for name in sorted(filenames):
+            if not name.startswith('.'):
+                path = os.path.join(directory, name)
+                yield os.path.relpath(path, root).replace(os.sep, '/'), path
+
+def _read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, _MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+def list_snapshots(backup_dir):
+    """ 已完成的快照名称，按时间从旧到新 """
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names
+                  if not name.startswith('.') and os.path.isfile(os.path.join(backup_dir, name, _MANIFEST)))
+
+# --- 备份 ---
+def backup_database(database, target, pages, step_sleep, max_restarts):
+    """
+    用在线备份 API 把 database 复制到 target。每步复制 pages 页后休眠 step_sleep 秒；
+    其它连接在备份过程中写入时 SQLite 会从头重新开始，超过 max_restarts 次后改为一步完成
+    （WAL 模式下一步复制只持有读快照，不阻塞写入）。
+    """
+    source = connect(database)
+    try:
+        state = {'remaining': None, 'restarts': 0}
+
+        def progress(status, remaining, total):
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > max_restarts:
+                    raise _BackupRestarted()
+            state['remaining'] = remaining
+            if remaining and step_sleep:
+                time.sleep(step_sleep)
+
+        for attempt_pages in (pages, -1):
+            state['remaining'] = None
+            destination = sqlite3.connect(target)
+            try:
+                source.backup(destination, pages=attempt_pages, progress=progress)
+                break
+            except _BackupRestarted:
+                print(f"备份期间数据库被写入 {state['restarts']} 次，改为一步复制。")
+            finally:
+                destination.close()
+        # 快照不需要 -wal 文件：改回 DELETE 日志模式，恢复时再由目标库的设置决定
+        destination = sqlite3.connect(target)
+        try:
+            destination.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            destination.close()
+    finally:
+        source.close()
+    return state['restarts']
+
+def snapshot_uploads(upload_folder, target, previous_dir):
+    """
+    把上传目录快照到 target：与上一个快照中大小、修改时间相同的文件建立硬链接，其余复制。
+    返回 (manifest 中的文件表, 复制的文件数, 链接的文件数)。
+    """
+    previous = {}
+    if previous_dir:
+        previous = _read_manifest(previous_dir).get('files', {})
+    files, copied, linked = {}, 0, 0
+    for rel, path in _walk_files(upload_folder):
+        stat = os.stat(path)
+        destination = os.path.join(target, *rel.split('/'))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        entry = previous.get(rel)
+        previous_path = os.path.join(previous_dir, 'uploads', *rel.split('/')) if entry else None
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns \
+                and os.path.exists(previous_path):
+            _link_or_copy(previous_path, destination)
+            files[rel] = entry
+            linked += 1
+        else:
+            files[rel] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': _copy_file(path, destination)}
+            copied += 1
+    return files, copied, linked
+
+def create_snapshot(app, log=print):
+    """ 创建一个完整快照并按 BACKUP_KEEP 清理旧快照，返回快照目录 """
+    config = app.config
+    backup_dir = config['BACKUP_DIR']
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, '.lock'), 'w') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise click.ClickException('另一个备份或恢复正在进行。')
+
+        # 上一次中断的备份留下的临时目录
+        for name in os.listdir(backup_dir):
+            if name.startswith('.') and name.endswith('.tmp'):
+                shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+
+        snapshots = list_snapshots(backup_dir)
+        name = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        temp_dir = os.path.join(backup_dir, f'.{name}.tmp')
+        os.makedirs(os.path.join(temp_dir, 'uploads'))
+
+        started = time.monotonic()
+        database_path = os.path.join(temp_dir, _DB_NAME)
+        restarts = backup_database(config['DATABASE'], database_path,
+                                   config.get('BACKUP_PAGES_PER_STEP', 1024),
+                                   config.get('BACKUP_STEP_SLEEP', 0.01),
+                                   config.get('BACKUP_MAX_RESTARTS', 3))
+        problems = _check_database(database_path)
+        if problems:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise click.ClickException(f'备份的数据库未通过校验: {problems[:5]}')
+        log(f'database: {os.path.getsize(database_path)} bytes, {restarts} restart(s), '
+            f'{time.monotonic() - started:.1f}s')
+
+        previous_dir = os.path.join(backup_dir, snapshots[-1]) if snapshots else None
+        files, copied, linked = {}, 0, 0
+        if os.path.isdir(config['UPLOAD_FOLDER']):
+            files, copied, linked = snapshot_uploads(config['UPLOAD_FOLDER'], os.path.join(temp_dir, 'uploads'),
+                                                     previous_dir)
+        log(f'uploads: {copied} file(s) copied, {linked} hard-linked from the previous snapshot')
+
+        manifest = {
+            'created_at': name,
+            'database': {'name': _DB_NAME, 'size': os.path.getsize(database_path), 'sha256': _sha256(database_path)},
+            'files': files,
+        }
+        with open(os.path.join(temp_dir, _MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        snapshot_dir = os.path.join(backup_dir, name)
+        os.rename(temp_dir, snapshot_dir)
+
+        # 硬链接共享的文件在删除旧快照后仍保留在较新的快照中
+        keep = config.get('BACKUP_KEEP', 14)
+        for old in list_snapshots(backup_dir)[:-keep] if keep > 0 else []:
+            shutil.rmtree(os.path.join(backup_dir, old), ignore_errors=True)
+            log(f'removed old snapshot {old}')
+    return snapshot_dir
+
+# --- 校验与恢复 ---
+def _check_database(path):
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        problems = [row[0] for row in db.execute('PRAGMA quick_check')]
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        db.close()
+    return [] if problems == ['ok'] else problems
+
+def verify_snapshot(snapshot_dir):
+    """ 按 manifest 校验数据库与每个文件（大小与 sha256），返回问题列表（空列表表示通过） """
+    try:
+        manifest = _read_manifest(snapshot_dir)
+    except (OSError, ValueError) as e:
+        return [f'manifest: {e}']
+    problems = []
+    database = manifest.get('database', {})
+    database_path = os.path.join(snapshot_dir, database.get('name', _DB_NAME))
+    if not os.path.isfile(database_path):
+        problems.append('database: missing')
+    elif _sha256(database_path) != database.get('sha256'):
+        problems.append('database: sha256 mismatch')
+    else:
+        problems += [f'database: {problem}' for problem in _check_database(database_path)]
+    for rel, entry in manifest.get('files', {}).items():
+        path = os.path.join(snapshot_dir, 'uploads', *rel.split('/'))
+        if not os.path.isfile(path):
+            problems.append(f'{rel}: missing')
+        elif os.path.getsize(path) != entry['size'] or _sha256(path) != entry['sha256']:
+            problems.append(f'{rel}: content mismatch')
+    return problems
+
+def _swap_uploads(snapshot_dir, upload_folder, files):
+    """
+    在上传目录旁准备好恢复后的目录（硬链接快照中的文件），再用两次 rename 换入；
+    目录不存在的窗口只有两次 rename 之间的一瞬。上传的文件写入后不再修改（新图片总是新文件名），
+    因此与快照共享 inode 是安全的。进行中的分块上传（.partial）不保留。
+    """
+    upload_folder = upload_folder.rstrip(os.sep)
+    staging = f'{upload_folder}.restoring'
+    retired = f'{upload_folder}.replaced'
+    for path in (staging, retired):
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(staging)
+    for rel in files:
+        destination = os.path.join(staging, *rel.split('/'))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        _link_or_copy(os.path.join(snapshot_dir, 'uploads', *rel.split('/')), destination)
+    if os.path.isdir(upload_folder):
+        os.rename(upload_folder, retired)
+    os.rename(staging, upload_folder)
+    shutil.rmtree(retired, ignore_errors=True)
+
+def restore_database(snapshot_path, database):
+    """
+    用在线备份 API 一步写回线上数据库：写入在一个事务中完成，其它连接要么看到旧数据、要么看到恢复后的数据。
+    之后把缓存版本号与变更日志序号推进到恢复前的值之后，避免进程内缓存与 CDC 消费者误用旧状态。
+    """
+    live = connect(database)
+    try:
+        versions = dict(live.execute('SELECT scope, version FROM cache_versions').fetchall())
+        row = live.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        latest_change = row[0] if row else 0
+        product_ids = {row[0] for row in live.execute('SELECT id FROM products')}
+
+        snapshot = sqlite3.connect(f'file:{snapshot_path}?mode=ro', uri=True)
+        try:
+            snapshot.backup(live, pages=-1)
+        finally:
+            snapshot.close()
+
+        # 较旧的快照可能还没有这些表（恢复后运行 'flask init-db' 迁移）
+        tables = {row[0] for row in live.execute("SELECT name FROM sqlite_schema WHERE type = 'table'")}
+        begin_immediate(live)
+        try:
+            if 'cache_versions' in tables:
+                for scope, version in versions.items():
+                    live.execute('UPDATE cache_versions SET version = MAX(version, ?) + 1 WHERE scope = ?',
+                                 (version, scope))
+            if 'change_log' in tables:
+                # 恢复后的变更日志与消费者已处理的序号对不上：清空并让序号越过恢复前的值，消费者会收到 410 并重新同步
+                live.execute('DELETE FROM change_log')
+                if not live.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) + 1 WHERE name = 'change_log'",
+                                    (latest_change,)).rowcount:
+                    live.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (latest_change + 1,))
+            live.commit()
+        except sqlite3.Error:
+            live.rollback()
+            raise
+        product_ids |= {row[0] for row in live.execute('SELECT id FROM products')}
+        live.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        live.close()
+    return product_ids
+
+@click.command('backup')
+@with_appcontext
+def backup_command():
+    """
+    Flask CLI 命令：flask backup
+    在线备份数据库（不停机）并增量快照上传目录。
+    """
+    snapshot_dir = create_snapshot(current_app._get_current_object(), log=click.echo)
+    click.echo(f'Created snapshot {snapshot_dir}')
+
+@click.command('restore')
+@click.argument('snapshot', required=False)
+@click.option('--yes', is_flag=True, help='不再确认。')
+@click.option('--no-safety-backup', is_flag=True, help='恢复前不为当前数据创建快照。')
+@with_appcontext
+def restore_command(snapshot, yes, no_safety_backup):
+    """
+    Flask CLI 命令：flask restore [SNAPSHOT]
+    校验快照（默认最新的一个）后换入数据库与上传目录。
+    """
+    app = current_app._get_current_object()
+    backup_dir = app.config['BACKUP_DIR']
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        raise click.ClickException(f'{backup_dir} 中没有快照。')
+    snapshot = snapshot or snapshots[-1]
+    if snapshot not in snapshots:
+        raise click.ClickException(f'快照 {snapshot} 不存在；可用的快照: {", ".join(snapshots[-5:])}')
+    snapshot_dir = os.path.join(backup_dir, snapshot)
+
+    click.echo(f'Verifying snapshot {snapshot} ...')
+    problems = verify_snapshot(snapshot_dir)
+    if problems:
+        for problem in problems[:20]:
+            click.echo(f'  {problem}')
+        raise click.ClickException(f'快照 {snapshot} 未通过校验（{len(problems)} 个问题），未做任何修改。')
+    if not yes:
+        click.confirm(f'Replace the live database and uploads with snapshot {snapshot}?', abort=True)
+
+    if not no_safety_backup:
+        safety_dir = create_snapshot(app, log=click.echo)
+        click.echo(f'Saved the current data as snapshot {os.path.basename(safety_dir)}')
+
+    manifest = _read_manifest(snapshot_dir)
+    _swap_uploads(snapshot_dir, app.config['UPLOAD_FOLDER'], manifest['files'])
+    product_ids = restore_database(os.path.join(snapshot_dir, manifest['database']['name']), app.config['DATABASE'])
+
+    cache.clear()
+    keys = ['listing', 'sitemap'] + [f'product-{product_id}' for product_id in sorted(product_ids)]
+    for start in range(0, len(keys), 30):  # Cloudflare 每次最多 30 个标签
+        http_cache.purge(*keys[start:start + 30])
+    click.echo(f'Restored snapshot {snapshot} ({len(manifest["files"])} upload(s)).')
+
+def init_app(app):
+    app.cli.add_command(backup_command)
+    app.cli.add_command(restore_command)
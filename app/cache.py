@@ -0,0 +1,37 @@
+import threading
+from app.db import query_db
+
+# 进程内缓存：{(scope, key): (version, value)}
+_cache = {}
+_lock = threading.Lock()
+
+def get_version(scope):
+    """
+    读取某个数据范围 ('products' / 'categories') 的当前版本号。
+    版本号由 cache_versions 表上的触发器在每次写入时递增。
+    """
+    row = query_db('SELECT version FROM cache_versions WHERE scope = ?', [scope], one=True)
+    return row['version'] if row else 0
+
+def cached(scope, key, loader):
+    """
+    返回缓存值；若 scope 的版本号已变化（即数据有写入），则调用 loader 重新加载。
+    loader 返回的值应与数据库连接无关（例如 dict / list），以便跨请求复用。
+    """
+    version = get_version(scope)
+    with _lock:
+        entry = _cache.get((scope, key))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    value = loader()
+    with _lock:
+        _cache[(scope, key)] = (version, value)
+    return value
+
+def clear():
+    """
+    清空进程内缓存（例如在 fork 之后或测试中）。
+    """
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,186 @@
+import json
+import math
+from collections import namedtuple
+
+from app.db import get_db
+
+# 商品目录的查询集中在这里：
+# - 每条 SQL 都是固定文本（筛选条件只由固定片段拼接，取值全部走绑定参数），
+#   同一种筛选组合在同一个连接上总是命中 sqlite3 的预编译语句缓存（连接跨请求复用，见 db.get_db）；
+# - 详情页的商品、图片与相关商品在一次查询中取回（图片与相关商品以 json_group_array 聚合）；
+# - 结果为 namedtuple（字段即 SELECT 列表的顺序），Python 中用属性访问 row.name；
+#   注意 row['name'] 在 Python 中会抛出 TypeError，只在 Jinja 模板中因其 getattr 回退而可用。
+
+# --- 行类型 ---
+ProductSummary = namedtuple('ProductSummary', (
+    'id', 'name', 'price', 'stock', 'category_id', 'comment_count', 'last_comment_at',
+    'category_name', 'primary_image_url',
+))
+ProductDetail = namedtuple('ProductDetail', (
+    'id', 'name', 'description', 'price', 'stock', 'category_id', 'comment_count',
+    'category_name', 'images', 'related',
+))
+ProductImage = namedtuple('ProductImage', ('id', 'image_url', 'is_primary'))
+RelatedProduct = namedtuple('RelatedProduct', ('id', 'name', 'price', 'category_name', 'primary_image_url'))
+
+# --- SQL ---
+_PRIMARY_IMAGE_SQL = '(SELECT image_url FROM product_images WHERE product_id = p.id ORDER BY id ASC LIMIT 1)'
+
+LISTING_SQL = f'''
+    SELECT p.id, p.name, p.price, p.stock, p.category_id, p.comment_count, p.last_comment_at,
+           c.name AS category_name,
+           {_PRIMARY_IMAGE_SQL} AS primary_image_url
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    WHERE {{where}}
+    ORDER BY {{order_by}}
+    LIMIT ? OFFSET ?
+'''
+
+# 条件未引用分类时，SQLite 会省去这里的 LEFT JOIN（按主键连接且不使用其列）
+COUNT_SQL = 'SELECT COUNT(p.id) FROM products p LEFT JOIN categories c ON p.category_id = c.id WHERE {where}'
+
+FACETS_SQL = '''
+    SELECT p.category_id, COUNT(p.id) FROM products p LEFT JOIN categories c ON p.category_id = c.id
+    WHERE {where} GROUP BY p.category_id
+'''
+
+# json_group_array 不保证聚合顺序（SQLite 3.44 之前不支持聚合内 ORDER BY），排序键一并取回，解码后排序
+_IMAGES_SQL = '''
+    (SELECT json_group_array(json_array(i.id, i.image_url, i.is_primary, i.sort_order))
+     FROM product_images i WHERE i.product_id = d.id)
+'''
+
+_RELATED_SQL = f'''
+    (SELECT json_group_array(json_array(r.rank, p.id, p.name, p.price, c.name, {_PRIMARY_IMAGE_SQL}))
+     FROM related_products r
+     JOIN products p ON p.id = r.related_id
+     LEFT JOIN categories c ON p.category_id = c.id
+     WHERE r.product_id = d.id AND c.deleted_at IS NULL)
+'''
+
+# 前台详情：已软删除分类下的商品视为不存在
+PRODUCT_DETAIL_SQL = f'''
+    SELECT d.id, d.name, d.description, d.price, d.stock, d.category_id, d.comment_count,
+           dc.name AS category_name,
+           {_IMAGES_SQL} AS images,
+           {_RELATED_SQL} AS related
+    FROM products d
+    LEFT JOIN categories dc ON d.category_id = dc.id
+    WHERE d.id = ? AND dc.deleted_at IS NULL
+'''
+
+# 后台编辑：不需要相关商品
+PRODUCT_EDIT_SQL = f'''
+    SELECT d.id, d.name, d.description, d.price, d.stock, d.category_id, d.comment_count,
+           dc.name AS category_name,
+           {_IMAGES_SQL} AS images,
+           '[]' AS related
+    FROM products d
+    LEFT JOIN categories dc ON d.category_id = dc.id
+    WHERE d.id = ?
+'''
+
+CATEGORIES_SQL = 'SELECT * FROM categories WHERE deleted_at IS NULL ORDER BY name'
+
+def _fetch(row_type, sql, params=()):
+    """ 执行查询并把元组行直接构造为 row_type（跳过 sqlite3.Row） """
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    try:
+        return [row_type._make(row) for row in cursor.execute(sql, params)]
+    finally:
+        cursor.close()
+
+def _scalar_rows(sql, params=()):
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    try:
+        return cursor.execute(sql, params).fetchall()
+    finally:
+        cursor.close()
+
+# --- 筛选与分页 ---
+class ProductFilter:
+    """
+    商品列表的筛选条件：前台首页与后台商品列表共用。
+    条件按固定顺序由固定片段拼接，同样的筛选组合总是得到同样的 SQL 文本；
+    其它条件（分类、游标等）由调用方通过 add() 追加。
+    """
+    __slots__ = ('clauses', 'params')
+
+    def __init__(self, in_stock=None, search_query=None, search_description=False,
+                 min_price=None, max_price=None):
+        self.clauses = []
+        self.params = []
+        # 前台默认不过滤库存，但保留 stock 条件以使用 (…, stock) 复合索引
+        if in_stock is not None:
+            self.clauses.append('p.stock > 0' if in_stock else 'p.stock >= 0')
+        if search_query:
+            if search_description:
+                self.add('(p.name LIKE ? OR p.description LIKE ?)', f'%{search_query}%', f'%{search_query}%')
+            else:
+                self.add('p.name LIKE ?', f'%{search_query}%')
+        if min_price is not None:
+            self.add('p.price >= ?', min_price)
+        if max_price is not None:
+            self.add('p.price <= ?', max_price)
+
+    def add(self, clause, *params):
+        self.clauses.append(clause)
+        self.params.extend(params)
+        return self
+
+    def copy(self):
+        other = ProductFilter()
+        other.clauses = list(self.clauses)
+        other.params = list(self.params)
+        return other
+
+    @property
+    def where(self):
+        return ' AND '.join(self.clauses) or '1'
+
+def page_count(total, per_page):
+    return math.ceil(total / per_page)
+
+def page_offset(page, per_page):
+    return (max(page, 1) - 1) * per_page
+
+# --- 查询 ---
+def list_products(product_filter, order_by, limit, offset=0):
+    """ 一页商品（含分类名与首图），返回 [ProductSummary] """
+    sql = LISTING_SQL.format(where=product_filter.where, order_by=order_by)
+    return _fetch(ProductSummary, sql, product_filter.params + [limit, offset])
+
+def count_products(product_filter):
+    return _scalar_rows(COUNT_SQL.format(where=product_filter.where), product_filter.params)[0][0]
+
+def category_facets(product_filter):
+    """ 一次 GROUP BY 查询得到每个分类的匹配商品数：{category_id: count} """
+    sql = FACETS_SQL.format(where=product_filter.where)
+    return dict(_scalar_rows(sql, product_filter.params))
+
+def list_categories():
+    """ 未删除的分类，按名称排序 """
+    return get_db().execute(CATEGORIES_SQL).fetchall()
+
+def _decode_detail(row):
+    images = sorted(json.loads(row.images), key=lambda image: (-(image[2] or 0), image[3] or 0, image[0]))
+    related = sorted(json.loads(row.related))
+    return row._replace(images=[ProductImage(*image[:3]) for image in images],
+                        related=[RelatedProduct(*item[1:]) for item in related])
+
+def get_product_detail(product_id):
+    """
+    前台详情：商品、分类名、图片（主图在前）与相关商品，一次查询取回。不存在时返回 None。
+    """
+    rows = _fetch(ProductDetail, PRODUCT_DETAIL_SQL, (product_id,))
+    return _decode_detail(rows[0]) if rows else None
+
+def get_product_for_edit(product_id):
+    """
+    后台编辑：商品与全部图片（包括已软删除分类下的商品），一次查询取回。不存在时返回 None。
+    """
+    rows = _fetch(ProductDetail, PRODUCT_EDIT_SQL, (product_id,))
+    return _decode_detail(rows[0]) if rows else None
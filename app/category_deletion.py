@@ -0,0 +1,205 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.db import connect, get_db, begin_immediate, NOW_SQL
+from app import search, http_cache
+
+# 分类的后台分批删除：
+# 1. 请求内只做软删除（categories.deleted_at），分类及其商品立即对前台隐藏，并登记任务；
+# 2. 后台线程每批删除 CATEGORY_DELETE_BATCH_SIZE 个商品，每批一个短的 BEGIN IMMEDIATE 事务
+#    （图片与留言由外键级联删除），批与批之间让出写锁；
+# 3. 图片文件在该批事务提交之后才删除，事务回滚不会留下指向已删除文件的记录；
+# 4. 商品删完后删除分类本身。任务状态保存在 category_deletions 表中，进程重启后可继续；
+# 5. 每个任务先以租约（worker / lease_until）原子地认领，多个 worker 进程不会同时处理同一个分类。
+
+# 每批要删除的商品：绑定参数个数固定，不受分类大小影响
+_BATCH_SQL = 'SELECT id FROM products WHERE category_id = ? ORDER BY id LIMIT ?'
+
+# 可认领的任务：未被认领、由本进程持有，或租约已过期（持有的进程已退出）
+_CLAIMABLE_SQL = f"status = 'running' AND (worker IS NULL OR worker = ? OR lease_until < {NOW_SQL})"
+
+def _lease_sql(seconds):
+    return f"strftime('%Y-%m-%d %H:%M:%f', 'now', '+{int(seconds)} seconds')"
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def soft_delete_category(db, category_id):
+    """
+    隐藏分类并登记删除任务。返回该分类下待删除的商品数；分类不存在或已在删除中时返回 None。
+    对删除失败的分类再次调用会重新开始该任务。
+    """
+    category = db.execute('SELECT name, deleted_at FROM categories WHERE id = ?', (category_id,)).fetchone()
+    if category is None:
+        return None
+    if category['deleted_at'] is not None:
+        job = db.execute("SELECT total - deleted AS remaining FROM category_deletions "
+                         "WHERE category_id = ? AND status = 'failed'", (category_id,)).fetchone()
+        if job is None:
+            return None
+        db.execute("UPDATE category_deletions SET status = 'running', error = NULL, worker = NULL "
+                   "WHERE category_id = ?", (category_id,))
+        db.commit()
+        return max(job['remaining'], 0)
+
+    # 商品数取自触发器维护的汇总表，不扫描 products
+    stats = db.execute('SELECT product_count FROM category_stats WHERE category_id = ?', (category_id,)).fetchone()
+    total = stats['product_count'] if stats else 0
+
+    db.execute(f'UPDATE categories SET deleted_at = {NOW_SQL} WHERE id = ?', (category_id,))
+    db.execute(
+        'INSERT OR REPLACE INTO category_deletions (category_id, category_name, total) VALUES (?, ?, ?)',
+        (category_id, category['name'], total)
+    )
+    db.commit()
+    return total
+
+def claim(db, category_id, lease_seconds):
+    """
+    原子地认领（或续约）一个删除任务；已由其它进程持有且租约未到期时返回 False。
+    """
+    claimed = db.execute(
+        f'UPDATE category_deletions SET worker = ?, lease_until = {_lease_sql(lease_seconds)} '
+        f'WHERE category_id = ? AND {_CLAIMABLE_SQL}',
+        (_worker_id(), category_id, _worker_id())).rowcount
+    db.commit()
+    return claimed == 1
+
+def delete_batch(db, category_id, batch_size, lease_seconds=60):
+    """
+    在一个短事务中删除一批商品（同时续约），返回 (删除的商品数, 需要删除的图片 URL 列表)。
+    """
+    begin_immediate(db)
+    try:
+        image_urls = [row['image_url'] for row in db.execute(
+            f'SELECT image_url FROM product_images WHERE product_id IN ({_BATCH_SQL})',
+            (category_id, batch_size))]
+        deleted = db.execute(f'DELETE FROM products WHERE id IN ({_BATCH_SQL})',
+                             (category_id, batch_size)).rowcount
+        db.execute(f'UPDATE category_deletions SET deleted = deleted + ?, lease_until = {_lease_sql(lease_seconds)} '
+                   'WHERE category_id = ?', (deleted, category_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return deleted, image_urls
+
+def remove_files(image_urls, upload_folder):
+    """ 删除图片文件（在数据库事务提交之后调用） """
+    for image_url in image_urls:
+        image_path = os.path.join(upload_folder, os.path.basename(image_url))
+        try:
+            if os.path.exists(image_path):
+                os.remove(image_path)
+        except OSError as e:
+            print(f"无法删除图片文件 {image_path}: {e}")
+
+def run_deletion(app, db, category_id):
+    """
+    分批删除一个分类的全部商品，再删除分类本身。
+    任务已由其它进程认领时直接返回 None。
+    """
+    batch_size = app.config.get('CATEGORY_DELETE_BATCH_SIZE', 500)
+    pause = app.config.get('CATEGORY_DELETE_PAUSE', 0.05)
+    lease_seconds = app.config.get('CATEGORY_DELETE_LEASE', 60)
+    upload_folder = app.config['UPLOAD_FOLDER']
+
+    if not claim(db, category_id, lease_seconds):
+        return None
+    try:
+        while True:
+            deleted, image_urls = delete_batch(db, category_id, batch_size, lease_seconds)
+            remove_files(image_urls, upload_folder)
+            if deleted < batch_size:
+                break
+            time.sleep(pause)  # 让其它写请求有机会获取写锁
+
+        begin_immediate(db)
+        db.execute('DELETE FROM categories WHERE id = ?', (category_id,))
+        db.execute("UPDATE category_deletions SET status = 'done', finished_at = CURRENT_TIMESTAMP "
+                   "WHERE category_id = ?", (category_id,))
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        db.execute("UPDATE category_deletions SET status = 'failed', error = ?, worker = NULL WHERE category_id = ?",
+                   (str(e), category_id))
+        db.commit()
+        print(f"删除分类 {category_id} 失败: {e}")
+        return False
+
+    with app.app_context():
+        search.unindex_category(category_id)
+        http_cache.purge('listing', f'category-{category_id}')
+    print(f"分类 {category_id} 已删除。")
+    return True
+
+def _pending(db):
+    """ 本进程可以认领的未完成任务（其它进程正在执行的任务不在其中） """
+    return [row['category_id'] for row in db.execute(
+        f'SELECT category_id FROM category_deletions WHERE {_CLAIMABLE_SQL} ORDER BY started_at', (_worker_id(),))]
+
+# --- 后台删除线程（每个进程最多一个，处理完所有任务后退出） ---
+_worker = {'running': False, 'resumed_pid': None}
+_worker_lock = threading.Lock()
+
+def _work_loop(app):
+    db = None
+    try:
+        db = connect(app.config['DATABASE'])
+        while True:
+            for category_id in _pending(db):
+                run_deletion(app, db, category_id)
+            # 在锁内确认没有新任务后才退出：start_worker 在任务登记（提交）之后才检查 running
+            with _worker_lock:
+                if not _pending(db):
+                    _worker['running'] = False
+                    return
+    except sqlite3.Error as e:
+        print(f"后台删除分类失败: {e}")
+        with _worker_lock:
+            _worker['running'] = False
+    finally:
+        if db is not None:
+            db.close()
+
+def start_worker(app):
+    """
+    启动后台删除线程（已在运行则由它继续处理新登记的任务）。
+    """
+    with _worker_lock:
+        if _worker['running']:
+            return
+        _worker['running'] = True
+    threading.Thread(target=_work_loop, args=(app,), name='category-deletion', daemon=True).start()
+
+@click.command('delete-categories')
+@with_appcontext
+def delete_categories_command():
+    """
+    Flask CLI 命令：flask delete-categories
+    在前台完成所有未完成的分类删除任务（例如进程在删除过程中被重启之后）。
+    """
+    app = current_app._get_current_object()
+    db = get_db()
+    processed = sum(run_deletion(app, db, category_id) is not None for category_id in _pending(db))
+    click.echo(f'Processed {processed} category deletion(s).')
+
+def init_app(app):
+    """
+    注册命令；每个进程的第一个请求检查一次是否有未完成的删除任务并继续执行。
+    """
+    app.cli.add_command(delete_categories_command)
+
+    @app.before_request
+    def resume_deletions():
+        if not app.config.get('CATEGORY_DELETE_WORKER_ENABLED', True) or _worker['resumed_pid'] == os.getpid():
+            return
+        _worker['resumed_pid'] = os.getpid()
+        if _pending(get_db()):
+            start_worker(app)
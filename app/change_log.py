@@ -0,0 +1,80 @@
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.db import get_db, begin_immediate
+
+# 目录变更日志（change_log 表由触发器写入，见 db.CHANGE_LOG_SCHEMA）的读取与清理。
+# 消费者保存最后处理的 seq，之后用 since=<seq> 增量拉取；
+# 若 since 之后的记录已被清理（超出保留期），需全量同步一次，再从 latest 继续。
+
+class ChangesPruned(Exception):
+    """ since 之后的部分记录已被清理，无法增量同步 """
+    def __init__(self, oldest):
+        super().__init__(oldest)
+        self.oldest = oldest
+
+def latest_seq(db):
+    """ 已分配的最大 seq（记录全部被清理后仍然有效） """
+    row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row['seq'] if row else 0
+
+def fetch_changes(db, since, limit):
+    """
+    返回 seq > since 的至多 limit 条记录（按 seq 升序）。
+    since 之后的记录已被清理时抛出 ChangesPruned。
+    """
+    rows = db.execute(
+        'SELECT seq, entity, entity_id, op, product_id, changed_at FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+        (since, limit)).fetchall()
+    # 写入是串行的，回滚时 sqlite_sequence 一并回滚：seq 没有空洞，除非被清理
+    if rows and rows[0]['seq'] == since + 1:
+        return rows
+    if not rows and since >= latest_seq(db):
+        return rows
+    oldest = rows[0]['seq'] if rows else latest_seq(db) + 1
+    if oldest > since + 1:
+        raise ChangesPruned(oldest)
+    return rows
+
+def prune(db, retention_days):
+    """ 删除超过保留期的记录，返回删除的行数 """
+    begin_immediate(db)
+    try:
+        deleted = db.execute("DELETE FROM change_log WHERE changed_at < strftime('%Y-%m-%d %H:%M:%f', 'now', ?)",
+                             (f'-{retention_days} days',)).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return deleted
+
+_last_prune = {'pid': None, 'at': 0.0}
+
+def maybe_prune(app):
+    """ 每个进程每 CHANGE_LOG_PRUNE_INTERVAL 秒最多清理一次（由变更接口顺带触发） """
+    interval = app.config.get('CHANGE_LOG_PRUNE_INTERVAL', 3600)
+    now = time.monotonic()
+    if _last_prune['pid'] == os.getpid() and now - _last_prune['at'] < interval:
+        return
+    _last_prune.update(pid=os.getpid(), at=now)
+    deleted = prune(get_db(), app.config.get('CHANGE_LOG_RETENTION_DAYS', 7))
+    if deleted:
+        print(f"已清理 {deleted} 条过期的变更记录。")
+
+@click.command('prune-changes')
+@click.option('--days', type=int, default=None, help='保留天数（默认 CHANGE_LOG_RETENTION_DAYS）。')
+@with_appcontext
+def prune_changes_command(days):
+    """
+    Flask CLI 命令：flask prune-changes
+    删除超过保留期的变更记录。
+    """
+    days = days if days is not None else current_app.config.get('CHANGE_LOG_RETENTION_DAYS', 7)
+    deleted = prune(get_db(), days)
+    click.echo(f'Pruned {deleted} change log entr{"y" if deleted == 1 else "ies"} older than {days} day(s).')
+
+def init_app(app):
+    app.cli.add_command(prune_changes_command)
@@ -1,31 +1,93 @@
+import os
 import sqlite3
+import threading
 import click
 from flask import current_app, g
 from flask.cli import with_appcontext
 from werkzeug.security import generate_password_hash # 用于创建初始管理员
 
+def connect(database):
+    """
+    [新增] 创建一个新的数据库连接（行工厂、外键约束与 get_db 保持一致）。
+    供请求之外的场景使用，例如后台线程与 CLI 命令。
+    """
+    # async 视图在 asgiref 的事件循环线程中执行，而连接在请求结束时于原线程关闭；
+    # 连接始终只属于一个请求、不会被并发使用，因此关闭同线程检查
+    # [修改] 首页的每种筛选/排序组合各对应一条固定 SQL，预编译语句缓存大小由默认的 128 调高
+    db = sqlite3.connect(database, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                         cached_statements=256)
+    db.row_factory = sqlite3.Row
+    # 启用外键约束
+    db.execute("PRAGMA foreign_keys = ON")
+    return db
+
 def get_db():
     """
     获取当前应用上下文的数据库连接。
-    如果连接不存在，则创建一个新连接。
+    [修改] 优先复用连接池中的空闲连接：sqlite3 的预编译语句缓存属于连接，
+    连接跨请求复用后，固定的 SQL 文本（见 app/catalog.py）不必在每个请求中重新解析。
     """
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
-        # 启用外键约束
-        g.db.execute("PRAGMA foreign_keys = ON")  # 新增这行
+        g.db = _pool_acquire(current_app._get_current_object())
     return g.db
 
 def close_db(e=None):
     """
     关闭数据库连接。
+    [修改] 回滚未提交的事务后归还连接池；池已满时才真正关闭。
     """
     db = g.pop('db', None)
     if db is not None:
+        _pool_release(current_app._get_current_object(), db)
+
+# --- [新增] 请求级连接池（每个进程、每个数据库文件一个） ---
+# 连接在同一时刻只属于一个请求（请求开始时取出、结束时归还），与此前的“每请求一个连接”语义一致。
+# SQLite 连接不能跨 fork 使用：池记录创建它的进程，fork 出的进程中旧池整体作废（不关闭、不使用）。
+_pool_lock = threading.Lock()
+_stale_connections = []
+
+def _pool(app):
+    pool = app.extensions.get('db_pool')
+    database = app.config['DATABASE']
+    if pool is None or pool['pid'] != os.getpid() or pool['database'] != database:
+        if pool is not None and pool['pid'] != os.getpid():
+            # 继承自父进程的连接：保留引用，避免在子进程中被回收（关闭）
+            _stale_connections.extend(pool['idle'])
+        elif pool is not None:
+            for db in pool['idle']:
+                db.close()
+        pool = app.extensions['db_pool'] = {'pid': os.getpid(), 'database': database, 'idle': []}
+    return pool
+
+def _pool_acquire(app):
+    with _pool_lock:
+        idle = _pool(app)['idle']
+        db = idle.pop() if idle else None
+    return db or connect(app.config['DATABASE'])
+
+def _pool_release(app, db):
+    try:
+        if db.in_transaction:
+            db.rollback()
+    except sqlite3.Error:
         db.close()
+        return
+    with _pool_lock:
+        pool = _pool(app)
+        if len(pool['idle']) < app.config.get('DB_POOL_SIZE', 8):
+            pool['idle'].append(db)
+            return
+    db.close()
+
+def close_pool(app):
+    """
+    [新增] 关闭池中的所有空闲连接（gunicorn master 在 fork 之前调用）。
+    """
+    with _pool_lock:
+        pool = app.extensions.pop('db_pool', None)
+    if pool is not None and pool['pid'] == os.getpid():
+        for db in pool['idle']:
+            db.close()
 
 def query_db(query, args=(), one=False):
     """
@@ -36,6 +98,25 @@ def query_db(query, args=(), one=False):
     rv = cur.fetchall()
     return (rv[0] if rv else None) if one else rv
 
+def iter_db(query, args=()):
+    """
+    [新增] 逐行迭代查询结果（不 fetchall），供流式渲染的模板边读边输出。
+    """
+    cur = get_db().execute(query, args)
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+def begin_immediate(db):
+    """
+    [新增] 立即获取写锁：避免 deferred 事务在读后升级为写时失败 (SQLITE_BUSY)，
+    等待锁的时间由连接的 busy timeout 控制。
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute('BEGIN IMMEDIATE')
+
 def check_column_exists(db, table_name, column_name):
     """[新增] 辅助函数：检查列是否存在"""
     try:
@@ -46,11 +127,358 @@ def check_column_exists(db, table_name, column_name):
         print(f"检查列是否存在时出错: {e}")
         return False
 
+# [新增] 留言统计相关的索引与触发器（需在 comment_count 列迁移之后创建）
+# 级联删除（删除商品或用户）同样会触发 comments 的 DELETE 触发器
+COMMENT_COUNT_SCHEMA = '''
+    CREATE INDEX IF NOT EXISTS idx_comments_product_id ON comments (product_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_products_comment_count ON products (comment_count, id, stock);
+    CREATE INDEX IF NOT EXISTS idx_products_category_comment_count ON products (category_id, comment_count, id, stock);
+
+    CREATE TRIGGER IF NOT EXISTS trg_comments_count_insert AFTER INSERT ON comments
+    BEGIN
+        UPDATE products
+        SET comment_count = comment_count + 1,
+            last_comment_at = NEW.created_at
+        WHERE id = NEW.product_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_comments_count_delete AFTER DELETE ON comments
+    BEGIN
+        UPDATE products
+        SET comment_count = MAX(comment_count - 1, 0),
+            last_comment_at = (SELECT MAX(created_at) FROM comments WHERE product_id = OLD.product_id)
+        WHERE id = OLD.product_id;
+    END;
+'''
+
+# [新增] updated_at 维护（毫秒精度的 UTC 时间文本），用作 HTTP 缓存验证器：
+# 商品自身、图片、留言（经由 comment_count 更新）与分类的变化都会更新它
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+UPDATED_AT_SCHEMA = f'''
+    CREATE INDEX IF NOT EXISTS idx_products_updated_at ON products (updated_at);
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_touch_insert AFTER INSERT ON products
+    BEGIN
+        UPDATE products SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+    END;
+
+    /* 任何列的更新（包括触发器维护的 comment_count）都会刷新 updated_at；
+       WHEN 条件避免本触发器自身的 UPDATE 再次触发 */
+    CREATE TRIGGER IF NOT EXISTS trg_products_touch_update AFTER UPDATE ON products
+    WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN
+        UPDATE products SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_product_images_touch_insert AFTER INSERT ON product_images
+    BEGIN
+        UPDATE products SET updated_at = {NOW_SQL} WHERE id = NEW.product_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_images_touch_update AFTER UPDATE ON product_images
+    BEGIN
+        UPDATE products SET updated_at = {NOW_SQL} WHERE id IN (OLD.product_id, NEW.product_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_images_touch_delete AFTER DELETE ON product_images
+    BEGIN
+        UPDATE products SET updated_at = {NOW_SQL} WHERE id = OLD.product_id;
+    END;
+
+    /* 'product_pages' 版本号：商品详情页的任何变化（包括图片与留言，它们都会刷新 updated_at）都会递增，
+       站点地图等以 updated_at 为准的缓存使用它（'products' 版本号只覆盖影响列表的列） */
+    INSERT OR IGNORE INTO cache_versions (scope, version) VALUES ('product_pages', 0);
+    CREATE TRIGGER IF NOT EXISTS trg_product_pages_version_update AFTER UPDATE OF updated_at ON products
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE scope = 'product_pages';
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_pages_version_delete AFTER DELETE ON products
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE scope = 'product_pages';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_categories_touch_insert AFTER INSERT ON categories
+    BEGIN
+        UPDATE categories SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_categories_touch_update AFTER UPDATE ON categories
+    WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN
+        UPDATE categories SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+    END;
+'''
+
+# [新增] 管理后台仪表盘的汇总表，由触发器增量维护，仪表盘读取时不扫描大表：
+# catalog_stats 只有一行（全站汇总），category_stats 每个分类一行，comment_daily_stats 每天一行。
+# 低库存指 0 < stock <= LOW_STOCK_THRESHOLD（阈值写在触发器中，修改后需重建触发器并执行 recompute-stats）
+LOW_STOCK_THRESHOLD = 5
+
+def _stats_delta(sign, row):
+    """ 一行商品对汇总列的贡献，sign 为 '+' 或 '-' """
+    return f'''product_count = product_count {sign} 1,
+            out_of_stock_count = out_of_stock_count {sign} ({row}.stock <= 0),
+            low_stock_count = low_stock_count {sign} ({row}.stock > 0 AND {row}.stock <= {LOW_STOCK_THRESHOLD}),
+            inventory_value = inventory_value {sign} {row}.price * {row}.stock'''
+
+STATS_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS catalog_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        product_count INTEGER NOT NULL DEFAULT 0,
+        out_of_stock_count INTEGER NOT NULL DEFAULT 0,
+        low_stock_count INTEGER NOT NULL DEFAULT 0,
+        inventory_value REAL NOT NULL DEFAULT 0,
+        comment_count INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO catalog_stats (id) VALUES (1);
+
+    CREATE TABLE IF NOT EXISTS category_stats (
+        category_id INTEGER PRIMARY KEY,
+        product_count INTEGER NOT NULL DEFAULT 0,
+        out_of_stock_count INTEGER NOT NULL DEFAULT 0,
+        low_stock_count INTEGER NOT NULL DEFAULT 0,
+        inventory_value REAL NOT NULL DEFAULT 0
+    );
+
+    CREATE TABLE IF NOT EXISTS comment_daily_stats (
+        day TEXT PRIMARY KEY,
+        comment_count INTEGER NOT NULL DEFAULT 0
+    );
+
+    /* 低库存商品列表：部分索引只包含低库存的行 */
+    CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products (stock, id) WHERE stock <= {LOW_STOCK_THRESHOLD};
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_stats_insert AFTER INSERT ON products
+    BEGIN
+        UPDATE catalog_stats SET {_stats_delta('+', 'NEW')} WHERE id = 1;
+        UPDATE category_stats SET {_stats_delta('+', 'NEW')} WHERE category_id = NEW.category_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_products_stats_update AFTER UPDATE OF price, stock, category_id ON products
+    BEGIN
+        UPDATE catalog_stats SET {_stats_delta('-', 'OLD')} WHERE id = 1;
+        UPDATE catalog_stats SET {_stats_delta('+', 'NEW')} WHERE id = 1;
+        UPDATE category_stats SET {_stats_delta('-', 'OLD')} WHERE category_id = OLD.category_id;
+        UPDATE category_stats SET {_stats_delta('+', 'NEW')} WHERE category_id = NEW.category_id;
+    END;
+
+    /* 删除分类时级联删除的商品同样会触发 */
+    CREATE TRIGGER IF NOT EXISTS trg_products_stats_delete AFTER DELETE ON products
+    BEGIN
+        UPDATE catalog_stats SET {_stats_delta('-', 'OLD')} WHERE id = 1;
+        UPDATE category_stats SET {_stats_delta('-', 'OLD')} WHERE category_id = OLD.category_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_categories_stats_insert AFTER INSERT ON categories
+    BEGIN
+        INSERT OR IGNORE INTO category_stats (category_id) VALUES (NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_categories_stats_delete AFTER DELETE ON categories
+    BEGIN
+        DELETE FROM category_stats WHERE category_id = OLD.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_comments_stats_insert AFTER INSERT ON comments
+    BEGIN
+        UPDATE catalog_stats SET comment_count = comment_count + 1 WHERE id = 1;
+        INSERT OR IGNORE INTO comment_daily_stats (day) VALUES (date(NEW.created_at));
+        UPDATE comment_daily_stats SET comment_count = comment_count + 1 WHERE day = date(NEW.created_at);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_comments_stats_delete AFTER DELETE ON comments
+    BEGIN
+        UPDATE catalog_stats SET comment_count = MAX(comment_count - 1, 0) WHERE id = 1;
+        UPDATE comment_daily_stats SET comment_count = comment_count - 1 WHERE day = date(OLD.created_at);
+        DELETE FROM comment_daily_stats WHERE day = date(OLD.created_at) AND comment_count <= 0;
+    END;
+'''
+
+def _stats_aggregates():
+    """ 与 _stats_delta 对应的聚合表达式（p 为 products 别名） """
+    return f'''COUNT(p.id),
+               COALESCE(SUM(p.stock <= 0), 0),
+               COALESCE(SUM(p.stock > 0 AND p.stock <= {LOW_STOCK_THRESHOLD}), 0),
+               COALESCE(SUM(p.price * p.stock), 0)'''
+
+def recompute_stats(db):
+    """
+    从 products / comments 全量重新计算汇总表（修复偏差）。
+    返回与重算结果不一致的汇总行数。
+    """
+    def snapshot():
+        """ {(表名, 主键): 其余列}，金额按分比较 """
+        rows = {}
+        for table in ('catalog_stats', 'category_stats', 'comment_daily_stats'):
+            for row in db.execute(f'SELECT * FROM {table}'):
+                rows[(table, row[0])] = tuple(round(v, 2) if isinstance(v, float) else v for v in row[1:])
+        return rows
+
+    before = snapshot()
+
+    db.execute('''
+        UPDATE catalog_stats
+        SET (product_count, out_of_stock_count, low_stock_count, inventory_value) =
+                (SELECT ''' + _stats_aggregates() + ''' FROM products p),
+            comment_count = (SELECT COUNT(id) FROM comments)
+        WHERE id = 1
+    ''')
+    db.execute('DELETE FROM category_stats')
+    db.execute('''
+        INSERT INTO category_stats (category_id, product_count, out_of_stock_count, low_stock_count, inventory_value)
+        SELECT c.id, ''' + _stats_aggregates() + '''
+        FROM categories c LEFT JOIN products p ON p.category_id = c.id
+        GROUP BY c.id
+    ''')
+    db.execute('DELETE FROM comment_daily_stats')
+    db.execute('''
+        INSERT INTO comment_daily_stats (day, comment_count)
+        SELECT date(created_at), COUNT(id) FROM comments GROUP BY date(created_at)
+    ''')
+
+    after = snapshot()
+    return sum(1 for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+
+# [新增] 分块上传的进度（临时文件位于 UPLOAD_FOLDER/.partial，见 app/admin/uploads.py）
+UPLOAD_SESSIONS_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        id TEXT PRIMARY KEY,
+        product_id INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        sha256 TEXT,
+        received INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT ({NOW_SQL}),
+        updated_at TEXT NOT NULL DEFAULT ({NOW_SQL}),
+        FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_upload_sessions_product_id ON upload_sessions (product_id);
+    CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated_at ON upload_sessions (updated_at);
+'''
+
+# [新增] 目录变更日志（CDC）：商品、图片、分类与留言的每次写入由触发器追加一行，
+# seq 为 AUTOINCREMENT，单调递增且删除（按保留期清理）后不会重用。
+# 只记录实体与操作，消费者按 id 读取当前数据（已删除的实体读不到，即应删除）。
+# 商品只在业务列变化时记录（updated_at 与触发器维护的留言统计列的变化不记录，留言本身另有记录）。
+def _change_trigger(table, event, entity, product_id='NULL', columns=''):
+    row = 'OLD' if event == 'DELETE' else 'NEW'
+    of = f' OF {columns}' if columns else ''
+    return f'''
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_change_{event.lower()} AFTER {event}{of} ON {table}
+    BEGIN
+        INSERT INTO change_log (entity, entity_id, op, product_id)
+        VALUES ('{entity}', {row}.id, '{event.lower()}', {product_id.replace('ROW', row)});
+    END;'''
+
+CHANGE_LOG_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL, /* product / product_image / category / comment */
+        entity_id INTEGER NOT NULL,
+        op TEXT NOT NULL, /* insert / update / delete */
+        product_id INTEGER, /* 所属（或自身）商品 */
+        changed_at TEXT NOT NULL DEFAULT ({NOW_SQL})
+    );
+    CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log (changed_at);
+''' + ''.join([
+    _change_trigger('products', 'INSERT', 'product', 'ROW.id'),
+    _change_trigger('products', 'UPDATE', 'product', 'ROW.id', 'name, description, price, stock, category_id, image_url'),
+    _change_trigger('products', 'DELETE', 'product', 'ROW.id'),
+    _change_trigger('product_images', 'INSERT', 'product_image', 'ROW.product_id'),
+    _change_trigger('product_images', 'UPDATE', 'product_image', 'ROW.product_id'),
+    _change_trigger('product_images', 'DELETE', 'product_image', 'ROW.product_id'),
+    _change_trigger('categories', 'INSERT', 'category'),
+    _change_trigger('categories', 'UPDATE', 'category', columns='name, deleted_at'),
+    _change_trigger('categories', 'DELETE', 'category'),
+    _change_trigger('comments', 'INSERT', 'comment', 'ROW.product_id'),
+    _change_trigger('comments', 'DELETE', 'comment', 'ROW.product_id'),
+])
+
+# [新增] 分类的后台分批删除任务（进度显示在分类管理页面）
+CATEGORY_DELETION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS category_deletions (
+        category_id INTEGER PRIMARY KEY,
+        category_name TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running', /* running / done / failed */
+        total INTEGER NOT NULL DEFAULT 0,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP,
+        worker TEXT, /* 正在执行的进程（主机名:进程号），见 category_deletion.claim */
+        lease_until TEXT /* 租约到期时间；进程崩溃后到期即可由其它进程接手 */
+    );
+    CREATE INDEX IF NOT EXISTS idx_category_deletions_status ON category_deletions (status, started_at);
+'''
+
+# [新增] 预先计算的相关商品（由 'flask build-related' 离线生成），详情页按 (product_id, rank) 读取
+RELATED_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS related_products (
+        product_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        related_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (product_id, rank),
+        FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE,
+        FOREIGN KEY (related_id) REFERENCES products (id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    /* 删除商品时级联删除指向它的推荐，需要 related_id 上的索引 */
+    CREATE INDEX IF NOT EXISTS idx_related_products_related_id ON related_products (related_id);
+
+    /* 上一次计算的时间（增量刷新时只重新计算此后文本有变化的商品） */
+    CREATE TABLE IF NOT EXISTS related_builds (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        built_at TEXT NOT NULL,
+        product_count INTEGER NOT NULL DEFAULT 0
+    );
+
+    /* 影响相似度的列（名称、描述、分类）最后一次变化的时间。
+       不使用 products.updated_at：留言、库存、价格等变化也会刷新它 */
+    CREATE TABLE IF NOT EXISTS related_changes (
+        product_id INTEGER PRIMARY KEY,
+        changed_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_related_changes_changed_at ON related_changes (changed_at);
+
+    CREATE TRIGGER IF NOT EXISTS trg_related_changes_insert AFTER INSERT ON products
+    BEGIN
+        INSERT OR REPLACE INTO related_changes (product_id, changed_at) VALUES (NEW.id, {NOW_SQL});
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_related_changes_update AFTER UPDATE OF name, description, category_id ON products
+    WHEN NEW.name IS NOT OLD.name OR NEW.description IS NOT OLD.description
+         OR NEW.category_id IS NOT OLD.category_id
+    BEGIN
+        INSERT OR REPLACE INTO related_changes (product_id, changed_at) VALUES (NEW.id, {NOW_SQL});
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_related_changes_delete AFTER DELETE ON products
+    BEGIN
+        DELETE FROM related_changes WHERE product_id = OLD.id;
+    END;
+'''
+
+def repair_comment_counts(db):
+    """
+    按 comments 表重新计算 comment_count / last_comment_at，只更新有偏差的商品。
+    返回被修复的商品数量。
+    """
+    cursor = db.execute('''
+        UPDATE products
+        SET comment_count = (SELECT COUNT(id) FROM comments WHERE product_id = products.id),
+            last_comment_at = (SELECT MAX(created_at) FROM comments WHERE product_id = products.id)
+        WHERE comment_count != (SELECT COUNT(id) FROM comments WHERE product_id = products.id)
+           OR last_comment_at IS NOT (SELECT MAX(created_at) FROM comments WHERE product_id = products.id)
+    ''')
+    return cursor.rowcount
+
 def init_db():
     """
     [修改] 初始化数据库表的函数，包含安全迁移逻辑。
     """
     db = get_db()
+
+    # [新增] 新建的数据库使用增量 auto_vacuum（必须在建表之前设置；已有数据库见 'flask db-maintain --convert'）
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+    # [新增] WAL 模式（持久化在数据库文件中）：写事务进行时读请求不被阻塞
+    db.execute('PRAGMA journal_mode = WAL')
     
     # 1. 创建所有表（如果它们不存在）
     # 注意：这里的 users 表是旧结构，以确保 IF NOT EXISTS 正常工作
@@ -98,6 +526,91 @@ def init_db():
             FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
         );
+
+        /* [新增] 订单与订单明细：pending 订单即一次有期限的库存预留 */
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', /* pending / confirmed / cancelled / expired */
+            total REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER,
+            product_name TEXT NOT NULL,
+            unit_price REAL NOT NULL,
+            quantity INTEGER NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE SET NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id, id);
+        CREATE INDEX IF NOT EXISTS idx_orders_pending_expiry ON orders (status, expires_at);
+        CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+
+        /* [新增] 商品列表的排序/筛选索引：每种 (分类, 排序键, id) 组合都能走索引范围扫描，
+           末尾的 stock 列使库存筛选无需回表 */
+        CREATE INDEX IF NOT EXISTS idx_products_category_id ON products (category_id, id, stock);
+        CREATE INDEX IF NOT EXISTS idx_products_price ON products (price, id, stock);
+        CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (category_id, price, id, stock);
+        CREATE INDEX IF NOT EXISTS idx_product_images_product_id ON product_images (product_id, id);
+
+        /* [新增] 缓存版本号表：商品/分类每次写入都会递增对应的版本号，
+           进程内缓存据此失效（跨 gunicorn worker 同样有效） */
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO cache_versions (scope, version)
+        VALUES ('products', 0), ('categories', 0), ('product_names', 0);
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_version_insert AFTER INSERT ON products
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'products';
+        END;
+        /* 只有影响列表/搜索的列变化时才递增版本号（留言计数等反范式列除外） */
+        DROP TRIGGER IF EXISTS trg_products_version_update;
+        CREATE TRIGGER trg_products_version_update
+        AFTER UPDATE OF name, description, price, stock, category_id ON products
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'products';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_products_version_delete AFTER DELETE ON products
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'products';
+        END;
+        /* 搜索建议索引只关心商品的增删、名称与分类（分类决定是否可见），使用单独的版本号：
+           下单扣减库存、修改价格等不会触发各 worker 的索引更新 */
+        CREATE TRIGGER IF NOT EXISTS trg_product_names_version_insert AFTER INSERT ON products
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'product_names';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_product_names_version_update AFTER UPDATE OF name, category_id ON products
+        WHEN NEW.name IS NOT OLD.name OR NEW.category_id IS NOT OLD.category_id
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'product_names';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_product_names_version_delete AFTER DELETE ON products
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'product_names';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_categories_version_insert AFTER INSERT ON categories
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'categories';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_categories_version_update AFTER UPDATE ON categories
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'categories';
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_categories_version_delete AFTER DELETE ON categories
+        BEGIN
+            UPDATE cache_versions SET version = version + 1 WHERE scope = 'categories';
+        END;
     ''')
     
     # 2. [修改] 安全迁移逻辑，用于 users 表
@@ -121,6 +634,51 @@ def init_db():
             db.execute("ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'guest'")
             print("迁移：已成功添加 'role' 列到 'users' 表。")
 
+        # [新增] products 表的反范式留言统计列，由 comments 表上的触发器维护
+        if not check_column_exists(db, 'products', 'comment_count'):
+            db.execute('ALTER TABLE products ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0')
+            db.execute('ALTER TABLE products ADD COLUMN last_comment_at TIMESTAMP')
+            repaired = repair_comment_counts(db)
+            print(f"迁移：已添加 'comment_count'/'last_comment_at' 列，回填 {repaired} 个商品。")
+        db.executescript(COMMENT_COUNT_SCHEMA)
+
+        # [新增] products / categories 的 updated_at 列（HTTP 缓存验证器）
+        for table in ('products', 'categories'):
+            if not check_column_exists(db, table, 'updated_at'):
+                db.execute(f'ALTER TABLE {table} ADD COLUMN updated_at TEXT')
+                db.execute(f'UPDATE {table} SET updated_at = {NOW_SQL}')
+                print(f"迁移：已成功添加 'updated_at' 列到 '{table}' 表。")
+        db.executescript(UPDATED_AT_SCHEMA)
+
+        # [新增] 仪表盘汇总表：首次创建时从现有数据回填
+        stats_exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_stats'").fetchone()
+        db.executescript(STATS_SCHEMA)
+        if not stats_exists:
+            recompute_stats(db)
+            print("迁移：已创建仪表盘汇总表并回填。")
+
+        # [新增] 分类软删除：deleted_at 非空的分类及其商品对前台隐藏，由后台任务分批删除
+        if not check_column_exists(db, 'categories', 'deleted_at'):
+            db.execute('ALTER TABLE categories ADD COLUMN deleted_at TEXT')
+            print("迁移：已成功添加 'deleted_at' 列到 'categories' 表。")
+        db.executescript(CATEGORY_DELETION_SCHEMA)
+        # [新增] 删除任务的租约：同一任务只由一个进程执行
+        if not check_column_exists(db, 'category_deletions', 'worker'):
+            db.execute('ALTER TABLE category_deletions ADD COLUMN worker TEXT')
+            db.execute('ALTER TABLE category_deletions ADD COLUMN lease_until TEXT')
+            print("迁移：已成功添加 'worker'/'lease_until' 列到 'category_deletions' 表。")
+        # [新增] 相关商品的文本变更标记：首次创建时以 updated_at 回填，下一次增量刷新与之前的行为一致
+        related_changes_exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'related_changes'").fetchone()
+        db.executescript(RELATED_SCHEMA)
+        if not related_changes_exists:
+            db.execute(f'INSERT OR IGNORE INTO related_changes (product_id, changed_at) '
+                       f'SELECT id, COALESCE(updated_at, {NOW_SQL}) FROM products')
+            print("迁移：已创建相关商品的文本变更表并回填。")
+        db.executescript(UPLOAD_SESSIONS_SCHEMA)
+        db.executescript(CHANGE_LOG_SCHEMA)
+
         # 确保现有管理员被正确设置为 'admin' 角色
         db.execute("UPDATE users SET role = 'admin' WHERE username = 'admin' AND (role IS NULL OR role = 'guest')")
         
@@ -163,9 +721,35 @@ def init_db_command():
     init_db()
     click.echo('Initialized and/or migrated the database.')
 
+@click.command('repair-comment-counts')
+@with_appcontext
+def repair_comment_counts_command():
+    """
+    Flask CLI 命令：flask repair-comment-counts
+    回填/修复 products 表上的留言统计列。
+    """
+    db = get_db()
+    repaired = repair_comment_counts(db)
+    db.commit()
+    click.echo(f'Repaired comment counts for {repaired} product(s).')
+
+@click.command('recompute-stats')
+@with_appcontext
+def recompute_stats_command():
+    """
+    Flask CLI 命令：flask recompute-stats
+    全量重算仪表盘汇总表，修复增量维护产生的偏差。
+    """
+    db = get_db()
+    drifted = recompute_stats(db)
+    db.commit()
+    click.echo(f'Recomputed dashboard stats; {drifted} row(s) had drifted.')
+
 def init_app(app):
     """
     在应用工厂中注册数据库相关函数。
     """
     app.teardown_appcontext(close_db) # 注册应用上下文销毁时的回调
-    app.cli.add_command(init_db_command) # 注册 'flask init-db' 命令
\ No newline at end of file
+    app.cli.add_command(init_db_command) # 注册 'flask init-db' 命令
+    app.cli.add_command(repair_comment_counts_command)
+    app.cli.add_command(recompute_stats_command)
@@ -0,0 +1,285 @@
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import shutil
+import time
+from multiprocessing import Pool
+from urllib.parse import urlsplit, parse_qs
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.db import query_db
+from app.http_cache import templates_digest
+
+# 静态导出：将首页（全部/各分类的每一页）与所有商品详情页渲染为 HTML 文件，
+# 可直接放到 CDN 或离线托管。增量模式下依据 manifest 中记录的指纹，
+# 只重新渲染内容发生变化的页面。
+
+MANIFEST_NAME = '.freeze-manifest.json'
+
+_URL_ATTR_RE = re.compile(r'\b(href|src|action)="([^"]*)"')
+_PRODUCT_PATH_RE = re.compile(r'^/product/(\d+)$')
+
+# --- 页面路径映射 ---
+def listing_path(category_id=None, page=1):
+    """ 列表页在导出目录中的 URL 路径（以 / 结尾，对应 index.html） """
+    prefix = f'/category/{category_id}' if category_id else ''
+    if page > 1:
+        return f'{prefix}/page/{page}/'
+    return f'{prefix}/'
+
+def product_path(product_id):
+    return f'/product/{product_id}/'
+
+def output_file(url_path):
+    """ '/category/3/page/2/' -> 'category/3/page/2/index.html' """
+    return os.path.join(*[part for part in url_path.split('/') if part], 'index.html') \
+        if url_path.strip('/') else 'index.html'
+
+def rewrite_url(url, base_url='', origin=''):
+    """
+    将动态站点的链接改写为导出站点中的路径：
+    首页/分类/分页 -> 静态列表页，商品详情 -> 静态详情页，/static/ -> 拷贝后的静态资源。
+    其它动态链接（搜索、筛选、登录、留言等）指向 origin（若提供）。
+    """
+    if not url.startswith('/') or url.startswith('//'):
+        return url  # 外部链接、锚点、相对路径、javascript: 等保持不变
+
+    parts = urlsplit(url)
+    if parts.path.startswith('/static/'):
+        return base_url + url
+
+    query = parse_qs(parts.query)
+    query.pop('after', None)
+    query.pop('before', None)
+    if parts.path == '/' and set(query) <= {'category_id', 'page'}:
+        try:
+            category_id = int(query['category_id'][0]) if 'category_id' in query else None
+            page = max(int(query['page'][0]), 1) if 'page' in query else 1
+        except ValueError:
+            return origin + url
+        return base_url + listing_path(category_id, page)
+
+    match = _PRODUCT_PATH_RE.match(parts.path)
+    if match and not parts.query:
+        return base_url + product_path(int(match.group(1)))
+
+    return origin + url
+
+def rewrite_html(text, base_url='', origin=''):
+    def replace(match):
+        attr, url = match.group(1), html.unescape(match.group(2))
+        if attr == 'action':
+            # 表单（搜索、筛选、留言）总是提交到动态站点
+            rewritten = origin + url if url.startswith('/') and not url.startswith('//') else url
+        else:
+            rewritten = rewrite_url(url, base_url, origin)
+        return f'{attr}="{html.escape(rewritten)}"'
+
+    text = _URL_ATTR_RE.sub(replace, text)
+    if base_url:
+        # onerror 等内联脚本中的静态资源路径
+        text = text.replace("'/static/", f"'{base_url}/static/")
+    return text
+
+# --- 指纹：不渲染页面即可判断内容是否变化 ---
+def _digest(*values):
+    return hashlib.blake2b(repr(values).encode(), digest_size=12).hexdigest()
+
+def collect_pages(app, settings):
+    """
+    返回 [(动态 URL, 导出 URL 路径, 指纹)]，覆盖所有列表页与详情页。
+    """
+    from app.main.routes import HOME_PER_PAGE
+
+    base = _digest(templates_digest(app), settings)  # 模板源码变化时所有页面都需要重新渲染
+
+    # 1. 商品详情页：商品本身、分类名、图片、留言统计与相关商品
+    product_fps = {}
+    rows = query_db('''
+        SELECT p.id, p.name, p.description, p.price, p.stock, p.comment_count, p.last_comment_at,
+               c.name AS category_name,
+               (SELECT group_concat(image_url, '|') FROM product_images WHERE product_id = p.id) AS images,
+               (SELECT group_concat(rp.id || ':' || rp.name || ':' || rp.price, '|')
+                FROM related_products r JOIN products rp ON rp.id = r.related_id
+                WHERE r.product_id = p.id) AS related
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE c.deleted_at IS NULL
+    ''')
+    pages = []
+    for row in rows:
+        fingerprint = _digest(base, tuple(row))
+        product_fps[row['id']] = fingerprint
+        pages.append((f"/product/{row['id']}", product_path(row['id']), fingerprint))
+
+    # 2. 列表页：分类侧栏（名称与计数）+ 该页展示的商品
+    categories = [tuple(row) for row in query_db('SELECT id, name FROM categories WHERE deleted_at IS NULL ORDER BY name')]
+    # 已软删除（正在后台删除）的分类及其商品不导出
+    visible_sql = 'FROM products p LEFT JOIN categories c ON p.category_id = c.id WHERE p.stock >= 0 AND c.deleted_at IS NULL'
+    counts = [tuple(row) for row in query_db(
+        f'SELECT p.category_id, COUNT(p.id) {visible_sql} GROUP BY p.category_id ORDER BY p.category_id')]
+    listing_base = _digest(base, categories, counts)
+
+    listed = query_db(f'SELECT p.id, p.category_id {visible_sql} ORDER BY p.id DESC')
+    groups = {None: [row['id'] for row in listed]}
+    for category_id, _ in categories:
+        groups[category_id] = []
+    for row in listed:
+        # 无分类的商品已在“全部”列表（groups[None]）中，没有单独的分类页
+        if row['category_id'] is not None and row['category_id'] in groups:
+            groups[row['category_id']].append(row['id'])
+
+    for category_id, product_ids in groups.items():
+        total_pages = max(math.ceil(len(product_ids) / HOME_PER_PAGE), 1)
+        for page in range(1, total_pages + 1):
+            shown = product_ids[(page - 1) * HOME_PER_PAGE:page * HOME_PER_PAGE]
+            fingerprint = _digest(listing_base, category_id, page, [product_fps.get(pid) for pid in shown])
+            params = []
+            if category_id:
+                params.append(f'category_id={category_id}')
+            if page > 1:
+                params.append(f'page={page}')
+            url = '/?' + '&'.join(params) if params else '/'
+            pages.append((url, listing_path(category_id, page), fingerprint))
+
+    return pages
+
+# --- 多进程渲染 ---
+_worker = {}
+
+def _init_worker(config_name, overrides, output_dir, base_url, origin):
+    from app import create_app
+    app = create_app(config_name)
+    app.config.update(overrides)
+    app.config['RESERVATION_SWEEPER_ENABLED'] = False
+    app.config['CATEGORY_DELETE_WORKER_ENABLED'] = False
+    _worker.update(client=app.test_client(), output_dir=output_dir, base_url=base_url, origin=origin)
+
+def _render_page(job):
+    url, url_path = job
+    response = _worker['client'].get(url, buffered=True)
+    if response.status_code != 200:
+        return url_path, False
+
+    text = rewrite_html(response.get_data(as_text=True), _worker['base_url'], _worker['origin'])
+    target = os.path.join(_worker['output_dir'], output_file(url_path))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # 先写临时文件再替换，CDN 同步过程中不会读到半个文件
+    tmp_path = f'{target}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, target)
+    return url_path, True
+
+def copy_static(source_dir, target_dir):
+    """ 增量拷贝静态资源（含上传图片）：只复制新增或修改过的文件 """
+    copied = 0
+    for root, _, files in os.walk(source_dir):
+        relative = os.path.relpath(root, source_dir)
+        os.makedirs(os.path.join(target_dir, relative), exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_dir, relative, name)
+            src_stat = os.stat(src)
+            if os.path.exists(dst):
+                dst_stat = os.stat(dst)
+                if dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime >= src_stat.st_mtime:
+                    continue
+            shutil.copy2(src, dst)
+            copied += 1
+    return copied
+
+def freeze_catalog(app, output_dir, processes=None, base_url='', origin='', full=False):
+    """
+    导出静态目录，返回统计信息 dict。
+    """
+    started = time.perf_counter()
+    base_url = base_url.rstrip('/')
+    origin = origin.rstrip('/')
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    pages = collect_pages(app, {'base_url': base_url, 'origin': origin})
+    jobs = [(url, url_path) for url, url_path, fingerprint in pages
+            if manifest.get(url_path) != fingerprint
+            or not os.path.exists(os.path.join(output_dir, output_file(url_path)))]
+
+    rendered = set()
+    if jobs:
+        config_name = os.environ.get('FLASK_CONFIG', 'development')
+        overrides = {key: app.config[key] for key in ('DATABASE', 'UPLOAD_FOLDER')}
+        init_args = (config_name, overrides, output_dir, base_url, origin)
+        processes = processes or os.cpu_count() or 1
+        if processes > 1 and len(jobs) > processes:
+            with Pool(processes, initializer=_init_worker, initargs=init_args) as pool:
+                for url_path, ok in pool.imap_unordered(_render_page, jobs, chunksize=16):
+                    if ok:
+                        rendered.add(url_path)
+        else:
+            _init_worker(*init_args)
+            for job in jobs:
+                url_path, ok = _render_page(job)
+                if ok:
+                    rendered.add(url_path)
+
+    # 删除已不存在的商品/分页
+    current = {url_path for _, url_path, _ in pages}
+    removed = 0
+    for url_path in set(manifest) - current:
+        target = os.path.join(output_dir, output_file(url_path))
+        if os.path.exists(target):
+            os.remove(target)
+            removed += 1
+
+    new_manifest = {url_path: fingerprint for _, url_path, fingerprint in pages
+                    if url_path in rendered or manifest.get(url_path) == fingerprint}
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+    static_dir = os.path.join(app.root_path, '..', 'static')
+    copied = copy_static(static_dir, os.path.join(output_dir, 'static'))
+
+    return {
+        'pages': len(pages),
+        'rendered': len(rendered),
+        'failed': len(jobs) - len(rendered),
+        'removed': removed,
+        'static_copied': copied,
+        'elapsed': time.perf_counter() - started,
+    }
+
+@click.command('freeze-catalog')
+@click.option('--output', 'output_dir', default=None, help='导出目录（默认 FREEZE_OUTPUT_DIR）')
+@click.option('--processes', type=int, default=None, help='渲染进程数（默认 CPU 核数）')
+@click.option('--base-url', default='', help='导出站点的路径前缀，例如 /shop')
+@click.option('--origin', default='', help='动态站点地址，搜索/登录/留言等链接将指向这里')
+@click.option('--full', is_flag=True, help='忽略 manifest，全部重新渲染')
+@with_appcontext
+def freeze_catalog_command(output_dir, processes, base_url, origin, full):
+    """
+    Flask CLI 命令：flask freeze-catalog
+    将全部列表页与商品详情页导出为静态 HTML。
+    """
+    app = current_app._get_current_object()
+    output_dir = output_dir or app.config['FREEZE_OUTPUT_DIR']
+    stats = freeze_catalog(app, output_dir, processes, base_url, origin, full)
+    click.echo(f"Rendered {stats['rendered']}/{stats['pages']} page(s) "
+               f"({stats['failed']} failed, {stats['removed']} removed, "
+               f"{stats['static_copied']} static file(s) copied) "
+               f"into {output_dir} in {stats['elapsed']:.2f}s.")
+
+def init_app(app):
+    app.cli.add_command(freeze_catalog_command)
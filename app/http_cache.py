@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+import urllib.request
+from datetime import datetime, timezone
+from flask import current_app, g, request, session
+from werkzeug.utils import import_string
+
+from app.db import query_db
+
+# HTTP 缓存：
+# - 由 updated_at（触发器维护）与 cache_versions 计算廉价的验证器，不渲染页面即可判断是否返回 304；
+# - 未登录访客的页面允许 CDN 缓存 (s-maxage)，并带上 Surrogate-Key / Cache-Tag，
+#   管理后台写入后按键清除 CDN 缓存；清除目标由 CACHE_PURGER 配置（可插拔）。
+
+_templates_digest = {}
+
+def templates_digest(app):
+    """
+    所有模板源码的摘要（每个进程计算一次；调试模式下每次重新计算）：
+    部署新模板后验证器随之变化。
+    """
+    if app.debug or app.name not in _templates_digest:
+        sources = []
+        for name in sorted(set(app.jinja_env.list_templates())):
+            source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            sources.append((name, source))
+        _templates_digest[app.name] = hashlib.blake2b(repr(sources).encode(), digest_size=12).hexdigest()
+    return _templates_digest[app.name]
+
+def parse_timestamp(value):
+    """ 'YYYY-MM-DD HH:MM:SS.fff' (UTC) -> 带时区的 datetime """
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f').replace(tzinfo=timezone.utc)
+
+# --- 验证器 ---
+def _viewer():
+    """ 页面内容随登录的访客而变化（导航栏用户名、留言删除按钮） """
+    return session.get('user_id') if session.get('guest_logged_in') else None
+
+def is_cacheable():
+    """
+    有待显示的闪现消息时，页面内容是一次性的，不能缓存。
+    结果在请求内记住：渲染模板时闪现消息会被取走。
+    """
+    if 'http_cacheable' not in g:
+        g.http_cacheable = '_flashes' not in session
+    return g.http_cacheable
+
+def make_etag(*parts):
+    app = current_app._get_current_object()
+    payload = repr((templates_digest(app), _viewer()) + parts).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+def listing_state():
+    """
+    列表页的状态：商品/分类最近的修改时间，加上版本号（删除不会改变 MAX(updated_at)）。
+    只需一次索引查询。
+    """
+    row = query_db('''
+        SELECT (SELECT MAX(updated_at) FROM products) AS products_updated_at,
+               (SELECT MAX(updated_at) FROM categories) AS categories_updated_at,
+               (SELECT group_concat(scope || ':' || version) FROM cache_versions) AS versions
+    ''', one=True)
+    return tuple(row)
+
+def product_state(product_id):
+    """
+    详情页的状态：(商品 updated_at, 分类 updated_at, 分类 id, 相关商品状态)；
+    商品不存在（或所属分类正在删除）时返回 None。
+    相关商品状态包括上次 build-related 的时间与所推荐商品的最近修改时间。
+    """
+    row = query_db('''
+        SELECT p.updated_at, c.updated_at AS category_updated_at, p.category_id,
+               (SELECT built_at FROM related_builds WHERE id = 1) || '|' ||
+               COALESCE((SELECT MAX(rp.updated_at) FROM related_products r JOIN products rp ON rp.id = r.related_id
+                         WHERE r.product_id = p.id), '') AS related_state
+        FROM products p LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id = ? AND c.deleted_at IS NULL
+    ''', [product_id], one=True)
+    return tuple(row) if row else None
+
+# --- 响应 ---
+def not_modified(etag, last_modified=None):
+    """
+    若请求携带的验证器与当前一致，返回 304 响应；否则返回 None。
+    """
+    if not is_cacheable():
+        return None
+
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        matched = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        matched = False
+
+    if not matched:
+        return None
+    response = current_app.response_class(status=304)
+    return apply_headers(response, etag, last_modified)
+
+def apply_headers(response, etag, last_modified=None, surrogate_keys=()):
+    """
+    设置 ETag / Last-Modified / Cache-Control 以及 CDN 的缓存标签。
+    """
+    if is_cacheable():
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        if _viewer() is None:
+            # 浏览器每次都重新验证，CDN 可缓存 EDGE_CACHE_SECONDS 秒（写入时主动清除）
+            response.cache_control.public = True
+            response.cache_control.max_age = 0
+            response.cache_control.s_maxage = current_app.config.get('EDGE_CACHE_SECONDS', 300)
+        else:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+    else:
+        response.cache_control.no_store = True
+
+    if surrogate_keys:
+        keys = list(dict.fromkeys(surrogate_keys))
+        response.headers['Surrogate-Key'] = ' '.join(keys)  # Fastly 等
+        response.headers['Cache-Tag'] = ','.join(keys)      # Cloudflare
+    return response
+
+# --- CDN 缓存清除 ---
+class LocalPurger:
+    """
+    本地/测试用：只记录被清除的键。
+    """
+
+    def __init__(self, app):
+        self.purged = []
+
+    def purge(self, keys):
+        self.purged.append(list(keys))
+
+class CloudflarePurger:
+    """
+    调用 Cloudflare API 按 Cache-Tag 清除缓存（在后台线程中发送，不阻塞请求）。
+    需要配置 CLOUDFLARE_ZONE_ID 与 CLOUDFLARE_API_TOKEN。
+    """
+
+    API_URL = 'https://api.cloudflare.com/client/v4/zones/{zone_id}/purge_cache'
+
+    def __init__(self, app):
+        self.url = self.API_URL.format(zone_id=app.config.get('CLOUDFLARE_ZONE_ID'))
+        self.token = app.config.get('CLOUDFLARE_API_TOKEN')
+
+    def _send(self, keys):
+        body = json.dumps({'tags': keys}).encode()
+        req = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': 'application/json',
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                resp.read()
+        except Exception as e:
+            print(f"清除 CDN 缓存失败 {keys}: {e}")
+
+    def purge(self, keys):
+        threading.Thread(target=self._send, args=(list(keys),), daemon=True).start()
+
+def purge(*keys):
+    """
+    写入后清除 CDN 中带有这些标签的页面，例如 purge('product-3', 'category-1', 'listing')。
+    """
+    keys = [key for key in dict.fromkeys(keys) if key]
+    purger = current_app.extensions.get('cache_purger')
+    if not keys or purger is None:
+        return
+    try:
+        purger.purge(keys)
+    except Exception as e:
+        print(f"清除 CDN 缓存失败 {keys}: {e}")
+
+def init_app(app):
+    """
+    按 CACHE_PURGER（类的导入路径）创建清除器。
+    """
+    purger_path = app.config.get('CACHE_PURGER')
+    if purger_path:
+        app.extensions['cache_purger'] = import_string(purger_path)(app)
@@ -17,4 +17,4 @@ def inject_guest_session():
     )
 
 # 导入路由，确保蓝图在创建后能找到它们
-from . import routes
\ No newline at end of file
+from . import routes, cart, sitemap, changes
\ No newline at end of file
@@ -0,0 +1,158 @@
+from flask import render_template, request, redirect, url_for, flash, session, current_app
+
+from . import main_bp
+from .routes import guest_login_required
+from app.db import query_db, get_db
+from app import orders, http_cache
+
+# --- [新增] 购物车（保存在会话中） ---
+
+def _get_cart():
+    """ 会话中的购物车：{'商品ID': 数量}（会话 JSON 的键只能是字符串） """
+    return session.get('cart', {})
+
+def _save_cart(cart):
+    session['cart'] = {pid: quantity for pid, quantity in cart.items() if quantity > 0}
+
+def _load_cart_products(cart):
+    """
+    购物车中仍然存在的商品 {id: row}；已被删除的商品从会话中移除（否则结算时整单失败），
+    返回 (商品, 移除的数量)。
+    """
+    if not cart:
+        return {}, 0
+    placeholders = ','.join('?' for _ in cart)
+    products = {row['id']: row for row in query_db(
+        f'SELECT id, name, price, stock FROM products WHERE id IN ({placeholders})', [int(pid) for pid in cart])}
+    missing = [pid for pid in cart if int(pid) not in products]
+    if missing:
+        _save_cart({pid: quantity for pid, quantity in cart.items() if pid not in missing})
+    return products, len(missing)
+
+@main_bp.route('/cart')
+@guest_login_required
+def cart():
+    """
+    购物车页面。
+    """
+    cart = _get_cart()
+    products, removed = _load_cart_products(cart)
+    if removed:
+        flash(f'{removed} 件商品已下架，已从购物车中移除。', 'warning')
+    items = []
+    total = 0
+    for pid, quantity in cart.items():
+        product = products.get(int(pid))
+        if product is None:
+            continue
+        items.append({'product': product, 'quantity': quantity, 'subtotal': product['price'] * quantity})
+        total += product['price'] * quantity
+
+    return render_template('cart.html', items=items, total=total)
+
+@main_bp.route('/cart/add/<int:product_id>', methods=['POST'])
+@guest_login_required
+def add_to_cart(product_id):
+    quantity = request.form.get('quantity', 1, type=int)
+    if quantity < 1:
+        flash('数量必须大于 0。', 'danger')
+        return redirect(url_for('main.product_detail', product_id=product_id))
+
+    product = query_db('SELECT id, name FROM products WHERE id = ?', [product_id], one=True)
+    if product is None:
+        flash('未找到该产品。', 'warning')
+        return redirect(url_for('main.home'))
+
+    cart = _get_cart()
+    cart[str(product_id)] = cart.get(str(product_id), 0) + quantity
+    _save_cart(cart)
+    flash(f'已将 "{product["name"]}" 加入购物车。', 'success')
+    return redirect(url_for('main.cart'))
+
+@main_bp.route('/cart/update/<int:product_id>', methods=['POST'])
+@guest_login_required
+def update_cart(product_id):
+    """
+    修改数量；数量为 0 时移出购物车。只能修改购物车中已有且仍然存在的商品（加入购物车走 add_to_cart）。
+    """
+    quantity = request.form.get('quantity', 0, type=int)
+    cart = _get_cart()
+    if str(product_id) not in cart:
+        flash('购物车中没有该商品。', 'warning')
+        return redirect(url_for('main.cart'))
+    if quantity > 0 and query_db('SELECT id FROM products WHERE id = ?', [product_id], one=True) is None:
+        quantity = 0
+        flash('该商品已下架，已从购物车中移除。', 'warning')
+    cart[str(product_id)] = max(quantity, 0)
+    _save_cart(cart)
+    return redirect(url_for('main.cart'))
+
+# --- [新增] 结算与订单 ---
+
+@main_bp.route('/checkout', methods=['POST'])
+@guest_login_required
+def checkout():
+    """
+    结算：原子地预留库存并创建待确认订单。
+    """
+    cart = _get_cart()
+    if not cart:
+        flash('购物车为空。', 'warning')
+        return redirect(url_for('main.cart'))
+    # 打开购物车页面之后才下架的商品：移除后让用户确认新的购物车
+    _, removed = _load_cart_products(cart)
+    if removed:
+        flash(f'{removed} 件商品已下架，已从购物车中移除，请确认后重新结算。', 'warning')
+        return redirect(url_for('main.cart'))
+
+    ttl = current_app.config.get('RESERVATION_TTL_SECONDS', 900)
+    db = get_db()
+    try:
+        order_id = orders.reserve(db, session['user_id'], {int(pid): quantity for pid, quantity in cart.items()}, ttl)
+    except orders.InsufficientStock as e:
+        flash(f'{e} 请调整数量后重试。', 'danger')
+        return redirect(url_for('main.cart'))
+    except Exception as e:
+        flash(f'下单失败: {e}', 'danger')
+        return redirect(url_for('main.cart'))
+
+    session.pop('cart', None)
+    http_cache.purge(*(f'product-{pid}' for pid in cart))
+    flash(f'订单 #{order_id} 已创建，库存为您保留 {ttl // 60} 分钟，请在此时间内确认订单。', 'success')
+    return redirect(url_for('main.my_orders'))
+
+@main_bp.route('/orders')
+@guest_login_required
+def my_orders():
+    """
+    我的订单（含明细）。
+    """
+    user_orders = query_db('SELECT * FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT 50', [session['user_id']])
+    items_by_order = {}
+    if user_orders:
+        order_ids = [order['id'] for order in user_orders]
+        placeholders = ','.join('?' for _ in order_ids)
+        for item in query_db(f'SELECT * FROM order_items WHERE order_id IN ({placeholders}) ORDER BY id', order_ids):
+            items_by_order.setdefault(item['order_id'], []).append(item)
+
+    return render_template('orders.html', orders=user_orders, items_by_order=items_by_order)
+
+@main_bp.route('/orders/<int:order_id>/confirm', methods=['POST'])
+@guest_login_required
+def confirm_order(order_id):
+    if orders.confirm(get_db(), order_id, session['user_id']):
+        flash(f'订单 #{order_id} 已确认，我们会尽快与您联系！', 'success')
+    else:
+        flash(f'订单 #{order_id} 无法确认（可能已过期或已处理）。', 'danger')
+    return redirect(url_for('main.my_orders'))
+
+@main_bp.route('/orders/<int:order_id>/cancel', methods=['POST'])
+@guest_login_required
+def cancel_order(order_id):
+    if orders.release(get_db(), order_id, 'cancelled', user_id=session['user_id']):
+        http_cache.purge(*(f"product-{item['product_id']}"
+                           for item in query_db('SELECT product_id FROM order_items WHERE order_id = ?', [order_id])))
+        flash(f'订单 #{order_id} 已取消，库存已释放。', 'info')
+    else:
+        flash(f'订单 #{order_id} 无法取消（可能已过期或已处理）。', 'danger')
+    return redirect(url_for('main.my_orders'))
@@ -0,0 +1,75 @@
+import asyncio
+import hmac
+import time
+from flask import current_app, request, session, jsonify
+
+from . import main_bp
+from app.db import get_db
+from app import change_log
+
+# [新增] 目录变更订阅接口（CDC）：GET /api/changes?since=<seq>&limit=<n>&wait=<秒>
+# - 返回 seq > since 的变更，以及下一次请求使用的 next；more 为 true 时应立即继续拉取；
+# - 没有新变更时最多挂起 wait 秒（长轮询，上限 CHANGES_MAX_WAIT），期间只检查 PRAGMA data_version，
+#   其它连接提交写入后才重新查询；
+# - 不带 since 时只返回当前的 next（消费者全量同步后从这里开始）；
+# - since 之后的记录已超出保留期被清理时返回 410，since 大于已分配的最大 seq 时返回 409
+#   （例如消费者保存了其它数据库的序号），两种情况消费者都需重新全量同步。
+# 需要管理员会话，或请求头 Authorization: Bearer <CHANGES_API_TOKEN>。
+# 部署：挂起期间请求占用一个处理线程（WSGI 与 asgi.py 入口都在线程池中执行 Flask），
+# 默认的 gunicorn 同步 worker（GUNICORN_THREADS=1）下即占用整个 worker。
+# 因此 CHANGES_MAX_WAIT 默认较短；需要更长的挂起时，应让消费者访问单独的实例
+# （例如 GUNICORN_THREADS 较大的 gunicorn，或 ASGI_THREADS 较大的 asgi.py 入口），不与前台共用 worker。
+
+def _authorized():
+    if session.get('admin_logged_in'):
+        return True
+    token = current_app.config.get('CHANGES_API_TOKEN')
+    auth = request.headers.get('Authorization', '')
+    return bool(token) and auth.startswith('Bearer ') and hmac.compare_digest(auth[7:].strip(), token)
+
+def _serialize(row):
+    return {'seq': row['seq'], 'entity': row['entity'], 'id': row['entity_id'], 'op': row['op'],
+            'product_id': row['product_id'], 'changed_at': row['changed_at']}
+
+@main_bp.route('/api/changes')
+async def api_changes():
+    if not _authorized():
+        return jsonify(error='unauthorized'), 401
+
+    config = current_app.config
+    page_size = config.get('CHANGES_PAGE_SIZE', 500)
+    limit = max(1, min(request.args.get('limit', page_size, type=int), page_size))
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), config.get('CHANGES_MAX_WAIT', 25)))
+    interval = config.get('CHANGES_POLL_INTERVAL', 0.25)
+    since = request.args.get('since', type=int)
+
+    db = get_db()
+    change_log.maybe_prune(current_app._get_current_object())
+    if since is None:
+        return jsonify(changes=[], next=change_log.latest_seq(db), more=False)
+
+    latest = change_log.latest_seq(db)
+    if since > latest:
+        # 否则 next 会原样返回这个序号，消费者将跳过其下的所有变更
+        return jsonify(error='since is ahead of the change log; resync required', latest=latest), 409
+
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            rows = change_log.fetch_changes(db, since, limit)
+        except change_log.ChangesPruned as e:
+            return jsonify(error='since is older than the retained change log; resync required',
+                           oldest=e.oldest, latest=change_log.latest_seq(db)), 410
+        if rows or time.monotonic() >= deadline:
+            break
+        # 等待其它连接提交写入（本连接不写入，data_version 不变即没有新变更）
+        version = db.execute('PRAGMA data_version').fetchone()[0]
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+            if db.execute('PRAGMA data_version').fetchone()[0] != version:
+                break
+
+    changes = [_serialize(row) for row in rows]
+    response = jsonify(changes=changes, next=changes[-1]['seq'] if changes else since, more=len(changes) == limit)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -1,11 +1,15 @@
-from flask import render_template, request, redirect, url_for, flash, session, g
-import math
+from flask import (
+    render_template, stream_template, request, redirect, url_for, flash, session, g, jsonify,
+    current_app, make_response, get_flashed_messages
+)
+import asyncio
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 
 from . import main_bp
-from app.db import query_db, get_db
+from app.db import query_db, iter_db, get_db
+from app import cache, search, http_cache, catalog, writer
 from app.utils import send_contact_email
 
 # --- [新增] 访客登录装饰器 ---
@@ -18,7 +22,8 @@ def guest_login_required(f):
         if not session.get('guest_logged_in'):
             flash('您必须登录才能查看此页面。', 'warning')
             return redirect(url_for('main.guest_login'))
-        return f(*args, **kwargs)
+        # ensure_sync 使装饰器同时支持同步与 async 视图
+        return current_app.ensure_sync(f)(*args, **kwargs)
     return decorated_function
 
 # --- [新增] 访客用户认证路由 ---
@@ -33,27 +38,23 @@ def guest_register():
         email = request.form['email']
         password = request.form['password']
         
-        db = get_db()
         try:
-            db.execute(
+            # [修改] 经单写者队列写入（与同一时刻的其它小写入合并提交）
+            user_id = writer.execute(
                 "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, 'guest')",
                 (username, email, generate_password_hash(password))
             )
-            db.commit()
             
             # 注册后自动登录
-            user = query_db('SELECT * FROM users WHERE username = ?', [username], one=True)
             session['guest_logged_in'] = True
-            session['user_id'] = user['id']
-            session['username'] = user['username']
+            session['user_id'] = user_id
+            session['username'] = username
             
             flash('注册成功！', 'success')
             return redirect(url_for('main.home'))
         except sqlite3.IntegrityError:
-            db.rollback()
             flash('用户名或邮箱已存在。', 'danger')
         except Exception as e:
-            db.rollback()
             flash(f'注册失败: {e}', 'danger')
             
     return render_template('guest_register.html')
@@ -89,67 +90,244 @@ def guest_logout():
     return redirect(url_for('main.home'))
 
 
+# --- [新增] 首页辅助函数 ---
+def get_categories():
+    """
+    分类列表（按名称排序），缓存至分类发生写入为止。
+    [修改] 不包含正在后台删除（已软删除）的分类。
+    """
+    return cache.cached('categories', 'all', lambda: [dict(row) for row in catalog.list_categories()])
+
+def _category_facets(product_filter, cacheable=False):
+    """
+    每个分类的匹配商品数：{category_id: count}。
+    无搜索词时结果与请求无关，缓存至商品发生写入为止。
+    """
+    def load():
+        return catalog.category_facets(product_filter)
+
+    if cacheable:
+        return cache.cached('products', 'category_facets', load)
+    return load()
+
+def _coalesce(chunks, size):
+    """ 将 Jinja 生成的大量小片段合并为约 size 个字符的块再发送，减少写调用 """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def render_page(template_name, **context):
+    """
+    [新增] 渲染页面并返回响应。STREAM_TEMPLATES 开启时流式输出：<head> 与样式表链接
+    立即发送，商品列表与留言区边渲染（边从游标读取）边发送。
+    """
+    if not current_app.config.get('STREAM_TEMPLATES', True):
+        return make_response(render_template(template_name, **context))
+
+    # 会话在视图返回时就已保存，流式渲染期间取出闪现消息不会写回 Cookie，
+    # 因此先取出（结果保存在请求上下文中，模板中再次调用会得到同样的消息）
+    get_flashed_messages(with_categories=True)
+    chunks = _coalesce(stream_template(template_name, **context), current_app.config.get('STREAM_CHUNK_SIZE', 2048))
+    return current_app.response_class(chunks, mimetype='text/html')
+
+# 首页每页商品数（静态导出 freeze-catalog 按同样的分页生成列表页）
+HOME_PER_PAGE = 12
+
+# --- [新增] 排序方式：ORDER BY 子句，以及游标（keyset）翻页的条件 ---
+# 每种排序都有对应的复合索引 (见 init_db)，排序键 + id 保证顺序唯一；
+# after 用于下一页，before 与 reverse_order_by 用于上一页（反向扫描后再倒序）
+SORT_OPTIONS = {
+    'newest': {
+        'label': '最新上架',
+        'order_by': 'p.id DESC',
+        'reverse_order_by': 'p.id ASC',
+        'after': 'p.id < ?',
+        'before': 'p.id > ?',
+        'cursor_key': None,
+    },
+    'price_asc': {
+        'label': '价格从低到高',
+        'order_by': 'p.price ASC, p.id ASC',
+        'reverse_order_by': 'p.price DESC, p.id DESC',
+        'after': '(p.price, p.id) > (?, ?)',
+        'before': '(p.price, p.id) < (?, ?)',
+        'cursor_key': ('price', float),
+    },
+    'price_desc': {
+        'label': '价格从高到低',
+        'order_by': 'p.price DESC, p.id DESC',
+        'reverse_order_by': 'p.price ASC, p.id ASC',
+        'after': '(p.price, p.id) < (?, ?)',
+        'before': '(p.price, p.id) > (?, ?)',
+        'cursor_key': ('price', float),
+    },
+    # [新增] 按留言数排序，使用反范式列 comment_count（由触发器维护）
+    'most_discussed': {
+        'label': '讨论最多',
+        'order_by': 'p.comment_count DESC, p.id DESC',
+        'reverse_order_by': 'p.comment_count ASC, p.id ASC',
+        'after': '(p.comment_count, p.id) < (?, ?)',
+        'before': '(p.comment_count, p.id) > (?, ?)',
+        'cursor_key': ('comment_count', int),
+    },
+}
+
+def _encode_cursor(sort, product):
+    """ 将一页第一个（上一页）或最后一个（下一页）商品编码为游标字符串 """
+    cursor_key = SORT_OPTIONS[sort]['cursor_key']
+    if cursor_key is None:
+        return str(product.id)
+    return f"{getattr(product, cursor_key[0])!r}:{product.id}"
+
+def _decode_cursor(sort, cursor):
+    """ 解析游标为 SQL 参数列表；格式错误时返回 None（退回 OFFSET 分页） """
+    cursor_key = SORT_OPTIONS[sort]['cursor_key']
+    try:
+        if cursor_key is None:
+            return [int(cursor)]
+        value, product_id = cursor.split(':')
+        return [cursor_key[1](value), int(product_id)]
+    except (ValueError, AttributeError):
+        return None
+
 # --- 用户前台路由：首页 ---
 @main_bp.route('/')
 def home():
     """
-    前台首页：展示所有商品，支持分类筛选、分页和搜索。
+    前台首页：展示所有商品，支持分类筛选、价格/库存筛选、排序、分页和搜索。
     """
     page = request.args.get('page', 1, type=int)
     category_id = request.args.get('category_id', type=int)
     search_query = request.args.get('search_query', '').strip()
-    per_page = 12
-    
-    where_clauses = ['p.stock >= 0']
-    params = []
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    in_stock = request.args.get('in_stock', type=int) == 1
+    sort = request.args.get('sort', 'newest')
+    if sort not in SORT_OPTIONS:
+        sort = 'newest'
+    after = request.args.get('after')
+    before = request.args.get('before')
+    per_page = HOME_PER_PAGE
+
+    # [新增] 条件 GET：商品/分类自上次响应以来没有变化时直接返回 304，不执行列表查询与渲染
+    etag = http_cache.make_etag('home', http_cache.listing_state(), sorted(request.args.items(multi=True)))
+    not_modified = http_cache.not_modified(etag)
+    if not_modified is not None:
+        return not_modified
     
+    # [修改] 默认不过滤库存；勾选“仅看有货”时只显示 stock > 0 的商品
+    # [修改] 筛选条件由 catalog.ProductFilter 生成（与后台商品列表共用）
+    product_filter = catalog.ProductFilter(in_stock=in_stock, search_query=search_query,
+                                           min_price=min_price, max_price=max_price)
+
+    # [新增] 分面计数：忽略分类条件，统计当前筛选下每个分类的匹配数
+    unfiltered = not (search_query or in_stock or min_price is not None or max_price is not None)
+    category_counts = _category_facets(product_filter, cacheable=unfiltered)
+    categories = get_categories()
+
+    # [新增] 已软删除分类下的商品不计入（也不会出现在下面的列表中）
+    visible_ids = {category['id'] for category in categories}
+    category_counts = {cid: count for cid, count in category_counts.items() if cid is None or cid in visible_ids}
+
+    product_filter = product_filter.copy()
     if category_id:
-        where_clauses.append('p.category_id = ?')
-        params.append(category_id)
+        product_filter.add('p.category_id = ?', category_id)
+        total_products = category_counts.get(category_id, 0)
+    else:
+        total_products = sum(category_counts.values())
+    product_filter.add('c.deleted_at IS NULL')
 
-    if search_query:
-        where_clauses.append('p.name LIKE ?')
-        params.append(f'%{search_query}%')
-    
-    where_sql = 'WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''
+    total_pages = catalog.page_count(total_products, per_page)
 
-    count_sql = f'SELECT COUNT(p.id) FROM products p {where_sql}'
-    total_products_result = query_db(count_sql, params, one=True)
-    total_products = total_products_result['COUNT(p.id)'] if total_products_result else 0
-    total_pages = math.ceil(total_products / per_page)
-    
-    offset = (page - 1) * per_page
-    
-    products_sql = f"""
-        SELECT 
-            p.*, 
-            c.name AS category_name,
-            (SELECT image_url FROM product_images WHERE product_id = p.id ORDER BY id ASC LIMIT 1) AS primary_image_url
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        {where_sql}
-        ORDER BY p.id DESC 
-        LIMIT ? OFFSET ?
-    """
-    
-    product_params = params + [per_page, offset]
-    products = query_db(products_sql, product_params)
-    categories = query_db('SELECT * FROM categories ORDER BY name')
+    # [新增] 游标翻页：带 after / before 参数时按 (排序键, id) 做索引范围扫描，不使用 OFFSET
+    # （上一页反向扫描 before 之前的 per_page 行再倒序）；没有游标时（第一页、直接输入的 page）退回 OFFSET
+    sort_option = SORT_OPTIONS[sort]
+    order_by = sort_option['order_by']
+    after_params = _decode_cursor(sort, after) if after else None
+    before_params = _decode_cursor(sort, before) if before and not after_params else None
+    if after_params:
+        product_filter.add(sort_option['after'], *after_params)
+        offset = 0
+    elif before_params:
+        product_filter.add(sort_option['before'], *before_params)
+        order_by = sort_option['reverse_order_by']
+        offset = 0
+    else:
+        offset = catalog.page_offset(page, per_page)
 
-    return render_template('home.html', 
+    products = catalog.list_products(product_filter, order_by, per_page, offset)
+    if before_params:
+        products.reverse()
+
+    next_cursor = _encode_cursor(sort, products[-1]) if products and page < total_pages else None
+    prev_cursor = _encode_cursor(sort, products[0]) if products and page > 1 else None
+
+    # 分页、分类链接需要保留的筛选参数（None 值不会出现在 URL 中）
+    filter_params = {
+        'search_query': search_query or None,
+        'min_price': min_price,
+        'max_price': max_price,
+        'in_stock': 1 if in_stock else None,
+        'sort': sort if sort != 'newest' else None,
+    }
+
+    # 本页商品（最多 per_page 行）需要在发送响应头之前确定：用于游标与 CDN 缓存标签
+    response = render_page('home.html', 
                            products=products, 
                            categories=categories, 
+                           category_counts=category_counts,
                            current_category_id=category_id,
                            search_query=search_query,
+                           min_price=min_price,
+                           max_price=max_price,
+                           in_stock=in_stock,
+                           sort=sort,
+                           sort_options=SORT_OPTIONS,
+                           filter_params=filter_params,
+                           next_cursor=next_cursor,
+                           prev_cursor=prev_cursor,
                            current_page=page, 
                            total_pages=total_pages,
                            total_products=total_products)
 
+    # [新增] CDN 缓存标签：任一展示的商品或该分类变化时清除本页
+    surrogate_keys = ['listing']
+    if category_id:
+        surrogate_keys.append(f'category-{category_id}')
+    surrogate_keys.extend(f'product-{product.id}' for product in products)
+    return http_cache.apply_headers(response, etag, surrogate_keys=surrogate_keys)
+
+# --- [新增] 搜索建议（输入即提示） ---
+@main_bp.route('/search/suggest')
+def search_suggest():
+    """
+    返回前缀匹配的商品/分类建议，由进程内前缀索引提供，不访问 products 表。
+    """
+    q = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 8, type=int), 20)
+    suggestions = search.suggest(q, limit) if q else []
+    for item in suggestions:
+        if item['type'] == 'category':
+            item['url'] = url_for('main.home', category_id=item['id'])
+        else:
+            item['url'] = url_for('main.product_detail', product_id=item['id'])
+    return jsonify(query=q, suggestions=suggestions)
+
 # --- contact 路由：处理表单提交和发送 ---
 @main_bp.route('/contact', methods=['GET', 'POST'])
-def contact():
+async def contact():
     """
     联系页面，POST 请求时调用工具函数发送邮件。
+    [修改] 改为 async 视图。注意：Flask 在处理请求的线程中运行 async 视图直到其结束，
+    等待 Resend 期间该线程（同步 gunicorn worker 下即整个 worker）仍被占用，与同步视图相同；
+    只有一个 await 的视图不会因此提高并发。并发来自运行请求的线程数（GUNICORN_THREADS，
+    或 asgi.py 入口的 ASGI_THREADS），async 只在一个请求内同时等待多项 I/O 时有用（例如后台的多文件上传）。
     """
     if request.method == 'POST':
         try:
@@ -162,7 +340,8 @@ def contact():
             message_body = request.form.get('message')
 
             # 2. 调用重构后的邮件发送函数
-            send_contact_email(name, email, subject, company, phone, message_body)
+            # 在线程池中调用（resend SDK 为同步接口），上下文会随之复制
+            await asyncio.to_thread(send_contact_email, name, email, subject, company, phone, message_body)
             
             flash('您的消息已发送成功，我们会尽快与您联系！', 'success')
             return redirect(url_for('main.contact'))
@@ -182,21 +361,37 @@ def product_detail(product_id):
     """
     产品详情页。
     """
-    # [修改] 使用 LEFT JOIN 防止产品无分类时出错
-    product = query_db('SELECT p.*, c.name AS category_name FROM products p LEFT JOIN categories c ON p.category_id = c.id WHERE p.id = ?',
-                       [product_id], one=True)
+    # [新增] 条件 GET：由商品与分类的 updated_at 计算验证器（一次主键查询）
+    state = http_cache.product_state(product_id)
+    if state is None:
+        flash('未找到该产品。', 'warning')
+        return redirect(url_for('main.home'))
+    product_updated_at, category_updated_at, category_id, related_state = state
+    etag = http_cache.make_etag('product', product_id, product_updated_at, category_updated_at, related_state)
+    last_modified = max(filter(None, (http_cache.parse_timestamp(product_updated_at),
+                                      http_cache.parse_timestamp(category_updated_at))), default=None)
+    not_modified = http_cache.not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    # [修改] 商品、图片与相关商品（由 'flask build-related' 预先计算）一次查询取回
+    product = catalog.get_product_detail(product_id)
 
     if product is None:
         flash('未找到该产品。', 'warning')
         return redirect(url_for('main.home'))
 
-    images = query_db('SELECT image_url FROM product_images WHERE product_id = ? ORDER BY is_primary DESC, sort_order ASC',
-                      [product_id])
-    
     # --- [新增] 查询留言 ---
-    comments = query_db('SELECT * FROM comments WHERE product_id = ? ORDER BY created_at DESC', [product_id])
+    # [修改] 不 fetchall：模板渲染到留言区时才逐行读取（按 idx_comments_product_id 倒序扫描，无需排序）
+    comments = iter_db('SELECT * FROM comments WHERE product_id = ? ORDER BY created_at DESC', [product_id])
 
-    return render_template('product_detail.html', product=product, images=images, comments=comments)
+    response = render_page('product_detail.html', product=product, images=product.images, comments=comments,
+                           related_products=product.related)
+    surrogate_keys = [f'product-{product_id}']
+    if category_id:
+        surrogate_keys.append(f'category-{category_id}')
+    surrogate_keys.extend(f'product-{related.id}' for related in product.related)
+    return http_cache.apply_headers(response, etag, last_modified, surrogate_keys)
 
 # --- [新增] 留言路由 ---
 @main_bp.route('/product/<int:product_id>/comment', methods=['POST'])
@@ -211,15 +406,14 @@ def add_comment(product_id):
         return redirect(url_for('main.product_detail', product_id=product_id))
         
     try:
-        db = get_db()
-        db.execute(
+        # [修改] 经单写者队列写入，留言高峰时不再由各 worker 争抢写锁
+        writer.execute(
             'INSERT INTO comments (product_id, user_id, username, body) VALUES (?, ?, ?, ?)',
             (product_id, user_id, username, body)
         )
-        db.commit()
+        http_cache.purge(f'product-{product_id}')
         flash('留言成功！', 'success')
     except Exception as e:
-        db.rollback()
         flash(f'留言失败: {e}', 'danger')
         
     return redirect(url_for('main.product_detail', product_id=product_id))
@@ -246,6 +440,7 @@ def delete_comment(comment_id):
         db = get_db()
         db.execute('DELETE FROM comments WHERE id = ?', [comment_id])
         db.commit()
+        http_cache.purge(f"product-{comment['product_id']}")
         flash('评论已成功删除！', 'success')
     except Exception as e:
         db.rollback()
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import tempfile
+from xml.sax.saxutils import escape
+from flask import current_app, request, url_for, send_file, stream_with_context, abort
+
+from . import main_bp
+from app.db import query_db, iter_db
+from app import cache, http_cache
+
+# [新增] 站点地图：让搜索引擎直接抓取每个商品详情页，而不是用 OFFSET 逐页翻首页。
+# - /sitemap.xml 为索引：一个分类地图 + 按商品 id 区间划分的若干商品地图；
+# - 商品地图 k 覆盖 id ∈ [k * SITEMAP_PAGE_SIZE, (k + 1) * SITEMAP_PAGE_SIZE)，按主键范围顺序读取，
+#   边读边输出（内存占用与商品数无关），同时写入磁盘缓存；
+# - 每个区间的缓存文件以 (商品数, 最近修改时间) 命名，只有该区间的商品变化时才重新生成。
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+_VISIBLE_SQL = 'FROM products p LEFT JOIN categories c ON p.category_id = c.id WHERE c.deleted_at IS NULL'
+
+def _lastmod(timestamp):
+    """ 'YYYY-MM-DD HH:MM:SS.fff'（UTC）-> W3C 日期时间 """
+    if not timestamp:
+        return ''
+    return f'<lastmod>{str(timestamp)[:19].replace(" ", "T")}+00:00</lastmod>'
+
+def _base_url():
+    """ 站点地图中的 URL 必须是绝对地址（已做 XML 转义） """
+    return escape(current_app.config.get('SITEMAP_BASE_URL') or request.url_root.rstrip('/'))
+
+def _page_size():
+    return current_app.config.get('SITEMAP_PAGE_SIZE', 10000)
+
+def _buckets():
+    """
+    [(区间号, 商品数, 最近修改时间)]：一次 GROUP BY 扫描，缓存至商品或分类发生写入为止。
+    使用 'product_pages' 版本号：图片与留言的变化也会刷新 updated_at 与详情页内容，
+    而 'products' 版本号只在列表相关的列变化时递增。
+    """
+    size = _page_size()
+
+    def load():
+        return [tuple(row) for row in query_db(
+            f'SELECT p.id / ? AS bucket, COUNT(p.id), MAX(p.updated_at) {_VISIBLE_SQL} GROUP BY bucket ORDER BY bucket',
+            [size])]
+
+    return cache.cached('product_pages', ('sitemap', size, cache.get_version('categories')), load)
+
+def _respond(response, etag):
+    response.mimetype = 'application/xml'
+    # 商品写入时清除 'listing' 标签，CDN 上的站点地图随之失效
+    return http_cache.apply_headers(response, etag, surrogate_keys=['sitemap', 'listing'])
+
+@main_bp.route('/sitemap.xml')
+def sitemap_index():
+    base_url = _base_url()
+    buckets = _buckets()
+    etag = http_cache.make_etag('sitemap', base_url, buckets)
+    not_modified = http_cache.not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    entries = [(url_for('main.sitemap_categories'), max((lastmod for _, _, lastmod in buckets if lastmod), default=None))]
+    entries += [(url_for('main.sitemap_products', bucket=bucket), lastmod) for bucket, _, lastmod in buckets]
+    body = _XML_HEADER + '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    body += ''.join(f'<sitemap><loc>{base_url}{escape(loc)}</loc>{_lastmod(lastmod)}</sitemap>\n'
+                    for loc, lastmod in entries)
+    body += '</sitemapindex>\n'
+    return _respond(current_app.response_class(body), etag)
+
+@main_bp.route('/sitemap-categories.xml')
+def sitemap_categories():
+    """ 首页与各分类列表的第一页（之后的页面通过商品地图覆盖，不需要抓取） """
+    base_url = _base_url()
+    rows = query_db('''
+        SELECT c.id, MAX(COALESCE(c.updated_at, ''), COALESCE(MAX(p.updated_at), '')) AS lastmod
+        FROM categories c LEFT JOIN products p ON p.category_id = c.id
+        WHERE c.deleted_at IS NULL
+        GROUP BY c.id ORDER BY c.id
+    ''')
+    etag = http_cache.make_etag('sitemap-categories', base_url, [tuple(row) for row in rows])
+    not_modified = http_cache.not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    home_lastmod = max((bucket[2] for bucket in _buckets() if bucket[2]), default=None)
+    entries = [(url_for('main.home'), home_lastmod)]
+    entries += [(url_for('main.home', category_id=row['id']), row['lastmod']) for row in rows]
+    body = _XML_HEADER + '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    body += ''.join(f'<url><loc>{base_url}{escape(loc)}</loc>{_lastmod(lastmod)}</url>\n' for loc, lastmod in entries)
+    body += '</urlset>\n'
+    return _respond(current_app.response_class(body), etag)
+
+def _generate(base_url, bucket, size, cache_path):
+    """
+    按主键顺序逐行输出一个商品地图，同时写入临时文件；完整生成后才改名为缓存文件。
+    """
+    product_url = url_for('main.product_detail', product_id=0)[:-1]  # '/product/'
+    directory = os.path.dirname(cache_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    completed = False
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            chunk = [_XML_HEADER, '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+            rows = iter_db(f'SELECT p.id, p.updated_at {_VISIBLE_SQL} AND p.id >= ? AND p.id < ? ORDER BY p.id',
+                           [bucket * size, (bucket + 1) * size])
+            for row in rows:
+                chunk.append(f'<url><loc>{base_url}{product_url}{row[0]}</loc>{_lastmod(row[1])}</url>\n')
+                if len(chunk) >= 200:
+                    text = ''.join(chunk)
+                    f.write(text)
+                    yield text
+                    chunk = []
+            chunk.append('</urlset>\n')
+            text = ''.join(chunk)
+            f.write(text)
+            yield text
+        os.replace(temp_path, cache_path)
+        completed = True
+    finally:
+        if not completed:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+def _remove_stale(directory, prefix, keep):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith(prefix) and name != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+@main_bp.route('/sitemap-products-<int:bucket>.xml')
+def sitemap_products(bucket):
+    size = _page_size()
+    state = next((entry for entry in _buckets() if entry[0] == bucket), None)
+    if state is None:
+        abort(404)
+
+    base_url = _base_url()
+    etag = http_cache.make_etag('sitemap-products', base_url, size, state)
+    not_modified = http_cache.not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    directory = current_app.config['SITEMAP_CACHE_DIR']
+    prefix = f'products-{size}-{bucket}-'
+    cache_name = prefix + hashlib.sha1(etag.encode()).hexdigest()[:16] + '.xml'
+    cache_path = os.path.join(directory, cache_name)
+    if os.path.exists(cache_path):
+        return _respond(send_file(cache_path, mimetype='application/xml', etag=False, conditional=False), etag)
+
+    _remove_stale(directory, prefix, cache_name)
+    response = current_app.response_class(stream_with_context(_generate(base_url, bucket, size, cache_path)))
+    return _respond(response, etag)
@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.db import connect
+
+# 'flask db-maintain'：适合在低峰期由 cron 运行的数据库维护。
+# 每一步都有时间预算（超时的语句通过 progress handler 中断并回滚，不会长时间持有锁）：
+# 1. 对没有统计信息或行数变化较大的表运行 ANALYZE，再运行 PRAGMA optimize（analysis_limit 限制每个索引的采样行数）；
+# 2. 增量 vacuum：分批归还空闲页，每批一个短事务（需要 auto_vacuum = INCREMENTAL，见 --convert）；
+# 3. WAL 检查点：先 PASSIVE（不等待），再用几毫秒尝试 TRUNCATE 把 -wal 文件截断为 0（有读者时留到下次）；
+# 4. 完整性检查：默认 quick_check，--full-check 时为 integrity_check。
+# 前后各输出一次文件大小、空闲页与碎片率。
+
+_AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+# TRUNCATE 检查点等待读者期间会阻塞新的写入，只给它很短的等待时间
+_TRUNCATE_WAIT_MS = 5
+
+class BudgetExceeded(Exception):
+    pass
+
+@contextmanager
+def _budget(db, seconds):
+    """ 语句执行超过 seconds 秒时中断（sqlite3.OperationalError: interrupted -> BudgetExceeded） """
+    deadline = time.monotonic() + seconds
+    db.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+    try:
+        yield deadline
+    except sqlite3.OperationalError as e:
+        if 'interrupt' not in str(e):
+            raise
+        if db.in_transaction:
+            db.rollback()
+        raise BudgetExceeded() from e
+    finally:
+        db.set_progress_handler(None, 0)
+
+def _pragma(db, name):
+    return db.execute(f'PRAGMA {name}').fetchone()[0]
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def fragmentation(db, seconds):
+    """
+    B-tree 页的不连续比例：按树的遍历顺序，下一页不紧挨在上一页之后的比例（0 表示完全连续）。
+    需要 dbstat 虚拟表（SQLITE_ENABLE_DBSTAT_VTAB）；不可用或超出预算时返回 None。
+    """
+    try:
+        with _budget(db, seconds):
+            total, jumps = db.execute('''
+                SELECT COUNT(*), SUM(jump) FROM (
+                    SELECT pageno - LAG(pageno) OVER (PARTITION BY name ORDER BY path) <> 1 AS jump FROM dbstat
+                ) WHERE jump IS NOT NULL
+            ''').fetchone()
+    except (sqlite3.OperationalError, BudgetExceeded):
+        return None
+    return (jumps or 0) / total if total else 0.0
+
+def report(db, database, seconds):
+    page_size = _pragma(db, 'page_size')
+    page_count = _pragma(db, 'page_count')
+    freelist = _pragma(db, 'freelist_count')
+    return {
+        'file_size': _file_size(database),
+        'wal_size': _file_size(database + '-wal'),
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_pages': freelist,
+        'free_ratio': freelist / page_count if page_count else 0.0,
+        'fragmentation': fragmentation(db, seconds),
+        'auto_vacuum': _AUTO_VACUUM_MODES.get(_pragma(db, 'auto_vacuum'), '?'),
+    }
+
+def _format_report(stats):
+    fragmentation = stats['fragmentation']
+    return (f"db {stats['file_size'] / 1024:.0f} KiB, wal {stats['wal_size'] / 1024:.0f} KiB, "
+            f"{stats['page_count']} page(s) x {stats['page_size']} B, "
+            f"freelist {stats['freelist_pages']} ({stats['free_ratio']:.1%}), "
+            f"fragmentation {'n/a' if fragmentation is None else f'{fragmentation:.1%}'}, "
+            f"auto_vacuum={stats['auto_vacuum']}")
+
+def _stale_tables(db, threshold=0.25):
+    """
+    没有统计信息、或行数与统计时相差超过 threshold 的有索引表。
+    （SQLite 3.46 之前，PRAGMA optimize 只检查本连接查询过的表，对新打开的连接不起作用）
+    """
+    tables = [row[0] for row in db.execute(
+        "SELECT DISTINCT tbl_name FROM sqlite_schema WHERE type = 'index' AND tbl_name NOT LIKE 'sqlite_%'")]
+    try:
+        stats = dict(db.execute('SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl'))
+    except sqlite3.OperationalError:  # 从未运行过 ANALYZE
+        stats = {}
+    stale = []
+    for table in tables:
+        rows = db.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        analyzed = stats.get(table)
+        if analyzed is None and not rows:  # 空表的 ANALYZE 不写入统计行
+            continue
+        if analyzed is None or abs(rows - analyzed) > threshold * max(analyzed, 1):
+            stale.append(table)
+    return stale
+
+def optimize(db, seconds, analysis_limit, full_analyze=False):
+    """
+    对统计信息过期的表运行 ANALYZE，再运行 PRAGMA optimize（--analyze 时对所有表运行 ANALYZE）；
+    analysis_limit 为每个索引的采样行数，0 表示不限制。返回分析过的表。
+    """
+    db.execute(f'PRAGMA analysis_limit = {int(analysis_limit)}')
+    with _budget(db, seconds):
+        if full_analyze:
+            db.execute('ANALYZE')
+            analyzed = ['*']
+        else:
+            analyzed = _stale_tables(db)
+            for table in analyzed:
+                db.execute(f'ANALYZE "{table}"')
+            db.execute('PRAGMA optimize')
+        if db.in_transaction:
+            db.commit()
+    return analyzed
+
+def incremental_vacuum(db, seconds, batch_pages):
+    """ 分批归还空闲页直到没有空闲页或预算用完，返回归还的页数 """
+    if _pragma(db, 'auto_vacuum') != 2:
+        return None
+    released = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        before = _pragma(db, 'freelist_count')
+        if not before:
+            break
+        try:
+            with _budget(db, max(deadline - time.monotonic(), 0)):
+                # 每一步返回一行，必须取完才会执行全部步骤
+                db.execute(f'PRAGMA incremental_vacuum({int(batch_pages)})').fetchall()
+        except BudgetExceeded:
+            break
+        released += before - _pragma(db, 'freelist_count')
+    return released
+
+def convert_to_incremental(db):
+    """ 一次性把 auto_vacuum 改为 INCREMENTAL：需要完整 VACUUM（重写整个文件，期间独占数据库） """
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    db.execute('VACUUM')
+
+def checkpoint(db):
+    """
+    先做 PASSIVE 检查点（不等待读者与写者），再尝试 TRUNCATE，最多等待 _TRUNCATE_WAIT_MS 毫秒：
+    TRUNCATE 在等待读者结束期间会阻塞其它连接的写入，不能用整个步骤的时间预算。
+    返回 (模式, 仍未写回的 WAL 帧数)。
+    """
+    busy, log_frames, checkpointed = db.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    if log_frames == -1:  # 不是 WAL 模式
+        return 'n/a', 0
+    previous = _pragma(db, 'busy_timeout')
+    db.execute(f'PRAGMA busy_timeout = {_TRUNCATE_WAIT_MS}')
+    try:
+        busy, log_frames, checkpointed = db.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    finally:
+        db.execute(f'PRAGMA busy_timeout = {previous}')
+    if busy:
+        # 有读者仍在使用旧快照（例如流式页面的长读事务）：PASSIVE 已写回能写回的部分，下次 cron 运行时再截断
+        return 'passive', log_frames - checkpointed
+    return 'truncate', 0
+
+def integrity_check(db, seconds, full=False):
+    """ 返回问题列表（空列表表示通过） """
+    with _budget(db, seconds):
+        rows = db.execute('PRAGMA integrity_check' if full else 'PRAGMA quick_check').fetchall()
+    problems = [row[0] for row in rows]
+    return [] if problems == ['ok'] else problems
+
+@click.command('db-maintain')
+@click.option('--budget', type=float, default=None, help='每一步的时间预算，秒（默认 DB_MAINTAIN_STEP_BUDGET）。')
+@click.option('--analyze', 'full_analyze', is_flag=True, help='对所有表运行 ANALYZE，而不只是 PRAGMA optimize。')
+@click.option('--full-check', is_flag=True, help='运行 integrity_check（默认只运行较快的 quick_check）。')
+@click.option('--convert', is_flag=True,
+              help='把 auto_vacuum 改为 INCREMENTAL（运行一次完整 VACUUM，期间阻塞写入）。')
+@with_appcontext
+def db_maintain_command(budget, full_analyze, full_check, convert):
+    """
+    Flask CLI 命令：flask db-maintain
+    统计信息、增量 vacuum、WAL 检查点与完整性检查，每一步都有时间预算。
+    """
+    config = current_app.config
+    database = config['DATABASE']
+    budget = budget if budget is not None else config.get('DB_MAINTAIN_STEP_BUDGET', 30)
+    # 使用独立连接：progress handler 与 busy_timeout 的修改不影响连接池中的连接
+    db = connect(database)
+    failed = False
+    try:
+        click.echo('before: ' + _format_report(report(db, database, budget)))
+
+        def step(name, fn):
+            nonlocal failed
+            started = time.monotonic()
+            try:
+                result = fn()
+            except BudgetExceeded:
+                click.echo(f'{name}: stopped after {budget:g}s budget')
+                return None
+            except sqlite3.Error as e:
+                failed = True
+                click.echo(f'{name}: failed: {e}')
+                return None
+            click.echo(f'{name}: {result} ({(time.monotonic() - started) * 1000:.0f} ms)')
+            return result
+
+        def run_optimize():
+            analyzed = optimize(db, budget, config.get('DB_MAINTAIN_ANALYSIS_LIMIT', 1000), full_analyze)
+            return f"analyzed {', '.join(analyzed) or 'nothing (statistics are current)'}"
+
+        def run_convert():
+            convert_to_incremental(db)
+            return 'auto_vacuum=incremental'
+
+        def run_vacuum():
+            released = incremental_vacuum(db, budget, config.get('DB_MAINTAIN_VACUUM_BATCH', 256))
+            if released is None:
+                return 'skipped (auto_vacuum is not incremental; run once with --convert)'
+            return f'{released} page(s) released'
+
+        def run_checkpoint():
+            mode, remaining = checkpoint(db)
+            return f'{mode} ({remaining} frame(s) left)'
+
+        problems = []
+
+        def run_integrity_check():
+            problems.extend(integrity_check(db, budget, full_check))
+            return f'{len(problems)} problem(s)' if problems else 'ok'
+
+        step('optimize', run_optimize)
+        if convert:
+            step('convert', run_convert)
+        step('incremental_vacuum', run_vacuum)
+        step('wal_checkpoint', run_checkpoint)
+        step('integrity_check', run_integrity_check)
+        if problems:
+            failed = True
+            for problem in problems[:20]:
+                click.echo(f'  {problem}')
+
+        click.echo('after:  ' + _format_report(report(db, database, budget)))
+    finally:
+        db.close()
+    if failed:
+        raise click.ClickException('database maintenance reported problems')
+
+def init_app(app):
+    app.cli.add_command(db_maintain_command)
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+import click
+from flask.cli import with_appcontext
+
+from app.db import connect, get_db, begin_immediate
+
+# 订单与库存预留：
+# - 下单时在一个很短的 BEGIN IMMEDIATE 事务中，用条件更新
+#   UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?
+#   原子地扣减库存（不做“先读后写”），任何一件库存不足则整单回滚；
+# - 新订单为 pending 状态，即一次有期限 (expires_at) 的库存预留；
+# - 用户确认后变为 confirmed；取消或超时则变为 cancelled / expired 并归还库存。
+#   状态迁移都带 status = 'pending' 条件，多个进程同时清理也不会重复归还。
+
+class InsufficientStock(Exception):
+    """ 某件商品库存不足（或商品已下架） """
+
+    def __init__(self, product_name):
+        super().__init__(f'商品 "{product_name}" 库存不足。')
+        self.product_name = product_name
+
+def reserve(db, user_id, quantities, ttl_seconds):
+    """
+    为购物车 {product_id: quantity} 创建订单并预留库存，返回订单 id。
+    库存不足时抛出 InsufficientStock，不做任何修改。
+    """
+    product_ids = sorted(pid for pid, quantity in quantities.items() if quantity > 0)
+    if not product_ids:
+        raise ValueError('购物车为空。')
+
+    # 1. 事务之外读取名称与价格快照（读不需要写锁）
+    placeholders = ','.join('?' for _ in product_ids)
+    products = {row['id']: row for row in db.execute(
+        f'SELECT id, name, price FROM products WHERE id IN ({placeholders})', product_ids)}
+
+    items = []
+    for pid in product_ids:
+        product = products.get(pid)
+        if product is None:
+            # 购物车页面与结算前都会移除已删除的商品，这里只在两者之间被删除时触发
+            raise InsufficientStock(f'#{pid}')
+        items.append((pid, product['name'], product['price'], quantities[pid]))
+    total = sum(price * quantity for _, _, price, quantity in items)
+
+    # 2. 短事务：只包含条件扣减与订单写入
+    begin_immediate(db)
+    try:
+        for pid, name, _, quantity in items:
+            cursor = db.execute('UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+                                (quantity, pid, quantity))
+            if cursor.rowcount == 0:
+                raise InsufficientStock(name)
+
+        cursor = db.execute(
+            "INSERT INTO orders (user_id, status, total, expires_at) VALUES (?, 'pending', ?, datetime('now', ?))",
+            (user_id, total, f'+{int(ttl_seconds)} seconds')
+        )
+        order_id = cursor.lastrowid
+        db.executemany(
+            'INSERT INTO order_items (order_id, product_id, product_name, unit_price, quantity) VALUES (?, ?, ?, ?, ?)',
+            [(order_id, pid, name, price, quantity) for pid, name, price, quantity in items]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return order_id
+
+def release(db, order_id, new_status, user_id=None):
+    """
+    将 pending 订单置为 cancelled / expired 并归还库存。
+    返回是否发生了状态迁移（订单已处理过则返回 False）。
+    """
+    begin_immediate(db)
+    try:
+        sql = "UPDATE orders SET status = ? WHERE id = ? AND status = 'pending'"
+        args = [new_status, order_id]
+        if user_id is not None:
+            sql += ' AND user_id = ?'
+            args.append(user_id)
+        if db.execute(sql, args).rowcount == 0:
+            db.rollback()
+            return False
+
+        db.execute('''
+            UPDATE products
+            SET stock = stock + (SELECT SUM(quantity) FROM order_items
+                                 WHERE order_id = ? AND product_id = products.id)
+            WHERE id IN (SELECT product_id FROM order_items WHERE order_id = ?)
+        ''', (order_id, order_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return True
+
+def confirm(db, order_id, user_id):
+    """
+    在预留有效期内确认订单，返回是否成功。
+    """
+    cursor = db.execute(
+        "UPDATE orders SET status = 'confirmed' "
+        "WHERE id = ? AND user_id = ? AND status = 'pending' AND expires_at > CURRENT_TIMESTAMP",
+        (order_id, user_id)
+    )
+    db.commit()
+    return cursor.rowcount == 1
+
+def sweep_expired(db, batch_size=100):
+    """
+    释放已过期的预留，每个订单一个短事务。返回释放的订单数。
+    """
+    expired = [row['id'] for row in db.execute(
+        "SELECT id FROM orders WHERE status = 'pending' AND expires_at <= CURRENT_TIMESTAMP "
+        "ORDER BY expires_at LIMIT ?", (batch_size,))]
+    return sum(1 for order_id in expired if release(db, order_id, 'expired'))
+
+# --- 后台清理线程（每个进程一个；fork 之后在 worker 中重新启动） ---
+_sweeper = {'pid': None}
+_sweeper_lock = threading.Lock()
+
+def _sweep_loop(database, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            db = connect(database)
+            try:
+                released = sweep_expired(db)
+            finally:
+                db.close()
+            if released:
+                print(f"已释放 {released} 个过期的库存预留。")
+        except sqlite3.Error as e:
+            print(f"清理过期预留失败: {e}")
+
+def start_sweeper(app):
+    """
+    启动当前进程的后台清理线程（已启动则忽略）。
+    """
+    if not app.config.get('RESERVATION_SWEEPER_ENABLED', True) or _sweeper['pid'] == os.getpid():
+        return
+    with _sweeper_lock:
+        if _sweeper['pid'] == os.getpid():
+            return
+        _sweeper['pid'] = os.getpid()
+    thread = threading.Thread(
+        target=_sweep_loop,
+        args=(app.config['DATABASE'], app.config.get('RESERVATION_SWEEP_INTERVAL', 30)),
+        name='reservation-sweeper',
+        daemon=True,
+    )
+    thread.start()
+
+@click.command('sweep-reservations')
+@with_appcontext
+def sweep_reservations_command():
+    """
+    Flask CLI 命令：flask sweep-reservations
+    立即释放所有过期的库存预留（也可由 cron 调用）。
+    """
+    db = get_db()
+    total = 0
+    while True:
+        released = sweep_expired(db)
+        total += released
+        if released == 0:
+            break
+    click.echo(f'Released {total} expired reservation(s).')
+
+def init_app(app):
+    """
+    注册清理命令；在第一个请求到来时启动后台清理线程。
+    """
+    app.cli.add_command(sweep_reservations_command)
+
+    @app.before_request
+    def ensure_sweeper():
+        start_sweeper(app)
@@ -0,0 +1,134 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import request, session, g
+
+# 按需的单请求性能剖析（cProfile）。
+# - 只有 PROFILING_ENABLED 为真时才注册请求钩子；未启用时没有任何额外开销；
+# - 启用后，已登录的管理员在请求中带上 X-Profile: 1 头或 ?_profile=1 参数，
+#   或按 PROFILE_SAMPLE_RATE 的比例随机抽样，该请求从 before_request 到响应发送完毕（包括流式渲染）被剖析；
+# - 结果以 pstats 格式（.prof，可用 snakeviz / gprof2dot / flameprof 生成火焰图）与一个 .json 元数据
+#   写入 PROFILE_DIR，只保留最近的 PROFILE_MAX_FILES 个，管理后台 /admin/profiles 列出。
+# 注意：async 视图在 asgiref 的事件循环线程中执行，cProfile 只记录当前线程，视图内部的调用不在结果中。
+# Python 3.12 起同一进程同时只能有一个 cProfile 在运行：已有请求在剖析时，其它请求直接跳过（不排队、不报错）。
+
+_NAME_RE = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+_active = threading.Lock()
+
+def _trigger(app):
+    """ 返回触发方式（'admin' / 'sample'），不剖析时返回 None """
+    if (request.headers.get('X-Profile') or request.args.get('_profile')) and session.get('admin_logged_in'):
+        return 'admin'
+    rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+def _prune(directory, keep):
+    names = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:-keep] if keep > 0 else names:
+        for suffix in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+def _save(app, profiler, meta):
+    directory = app.config['PROFILE_DIR']
+    try:
+        os.makedirs(directory, exist_ok=True)
+        name = f"{int(meta['started_at'] * 1000)}-{uuid.uuid4().hex[:8]}"
+        # 先写 .prof 再写 .json：列表只列出有元数据的记录，不会看到写了一半的文件
+        profiler.dump_stats(os.path.join(directory, name + '.prof'))
+        with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        _prune(directory, app.config.get('PROFILE_MAX_FILES', 50))
+    except OSError as e:
+        print(f"保存性能剖析结果失败: {e}")
+
+def list_captures(directory, limit=None):
+    """ 最近的剖析记录（新的在前），每条为元数据 dict 加上 name 与格式化的 time（UTC） """
+    try:
+        names = sorted((name[:-5] for name in os.listdir(directory) if name.endswith('.json')), reverse=True)
+    except FileNotFoundError:
+        return []
+    captures = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(directory, name + '.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        started_at = datetime.fromtimestamp(meta.get('started_at', 0), timezone.utc)
+        captures.append(dict(meta, name=name, time=started_at.strftime('%Y-%m-%d %H:%M:%S')))
+    return captures
+
+def capture_path(directory, name):
+    """ 剖析文件的路径；名称不合法或文件不存在时返回 None """
+    if not _NAME_RE.match(name):
+        return None
+    path = os.path.join(directory, name + '.prof')
+    return path if os.path.isfile(path) else None
+
+def summary(path, sort='cumulative', limit=60):
+    """ pstats 的文本报告：按 sort 排序的前 limit 个函数 """
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.strip_dirs().sort_stats(sort if sort in SORT_KEYS else 'cumulative').print_stats(limit)
+    return stream.getvalue()
+
+def init_app(app):
+    """
+    PROFILING_ENABLED 为真时注册剖析钩子（在蓝图之前注册，最先执行的 before_request）。
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    @app.before_request
+    def start_profile():
+        trigger = _trigger(app)
+        if trigger is None or not _active.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # 其它剖析工具（例如调试器）正在运行
+            _active.release()
+            return
+        g._profile = (profiler, trigger, time.time(), time.perf_counter())
+
+    @app.after_request
+    def finish_profile(response):
+        state = g.pop('_profile', None)
+        if state is None:
+            return response
+        profiler, trigger, started_at, started = state
+        meta = {'method': request.method, 'url': request.full_path.rstrip('?'), 'endpoint': request.endpoint,
+                'status': response.status_code, 'trigger': trigger, 'started_at': started_at}
+
+        # 流式响应在 after_request 之后才生成内容：等响应发送完毕（关闭）时再停止
+        def stop():
+            profiler.disable()
+            _active.release()
+            meta['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            _save(app, profiler, meta)
+
+        response.call_on_close(stop)
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # 没有经过 after_request（例如未处理的异常）：停止剖析，不保存
+        state = g.pop('_profile', None)
+        if state is not None:
+            state[0].disable()
+            _active.release()
@@ -0,0 +1,205 @@
+import math
+import re
+import time
+from collections import Counter
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.db import get_db, begin_immediate, NOW_SQL
+from app.search import normalize
+
+# 相关商品（离线计算）：
+# - 商品名称与描述向量化为 TF-IDF（中日韩文字按二元组切分，名称的词权重加倍），行向量 L2 归一化；
+# - 余弦相似度在全部商品之间计算（跨分类），同分类的商品乘以 (1 + RELATED_CATEGORY_BOOST)；
+# - 按批次做稀疏矩阵乘法并取每行的 top-k，写入 related_products；
+# - 增量模式只重新计算上次运行之后名称、描述或分类有变化的商品（related_changes 表，由触发器维护），
+#   以及它们的近邻；留言、库存等其它修改不触发重新计算。
+# NumPy / SciPy（见 requirements.txt）只在此离线任务中导入，Web 进程不导入。
+
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+')
+_TOKEN_RE = re.compile(r'\w+')
+
+# 名称中的词在向量中的权重（相对描述）
+NAME_WEIGHT = 2
+
+def tokenize(text):
+    """
+    中日韩文字段切为相邻二字组（单字段保留单字），其余按单词切分并忽略单个字母。
+    """
+    text = normalize(text)
+    tokens = []
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in _TOKEN_RE.findall(_CJK_RE.sub(' ', text)):
+        if len(word) > 1 or word.isdigit():
+            tokens.append(word)
+    return tokens
+
+def _require_numpy():
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        raise click.ClickException('build-related 需要 numpy 与 scipy：pip install numpy scipy')
+    return numpy, sparse
+
+def vectorize(documents):
+    """
+    [(名称, 描述)] -> L2 归一化的 TF-IDF 稀疏矩阵 (CSR, float32)。
+    tf 取 1 + log(tf)，idf 取平滑的 log((1 + n) / (1 + df)) + 1。
+    """
+    np, sparse = _require_numpy()
+
+    vocabulary = {}
+    indptr, indices, data = [0], [], []
+    for name, description in documents:
+        counts = Counter(tokenize(description))
+        for token in tokenize(name):
+            counts[token] += NAME_WEIGHT
+        for token, tf in counts.items():
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+            data.append(1 + math.log(tf))
+        indptr.append(len(indices))
+
+    n = len(documents)
+    matrix = sparse.csr_matrix((np.array(data, dtype=np.float32), indices, indptr),
+                               shape=(n, max(len(vocabulary), 1)))
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+    matrix = (matrix @ sparse.diags(idf)).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags((1 / norms).astype(np.float32)) @ matrix).tocsr()
+
+def top_k(matrix, rows, categories, k, category_boost):
+    """
+    计算 rows（矩阵行号）与所有商品的相似度，返回每行的 [(列号, 分数)]，按分数降序，
+    不含自身与零相似度的商品。
+    相似度矩阵保持稀疏（只有共享词的商品才有非零项），逐行在非零项中取 top-k，不展开为 len(rows) x N 的稠密矩阵。
+    """
+    np, _ = _require_numpy()
+
+    scores = (matrix[rows] @ matrix.T).tocsr()
+    # 每个非零项所在的行（对应 rows 中的下标）与列
+    owner = np.repeat(np.arange(len(rows)), np.diff(scores.indptr))
+    cols = scores.indices
+    scores.data[cols == rows[owner]] = 0  # 排除自身
+    if category_boost:
+        row_categories = categories[rows][owner]
+        same = (row_categories == categories[cols]) & (row_categories >= 0)
+        scores.data[same] *= 1 + category_boost
+
+    results = []
+    for i in range(len(rows)):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        row_cols, row_scores = cols[start:end], scores.data[start:end]
+        keep = row_scores > 0
+        row_cols, row_scores = row_cols[keep], row_scores[keep]
+        if len(row_scores) > k:
+            candidates = np.argpartition(-row_scores, k - 1)[:k]
+            row_cols, row_scores = row_cols[candidates], row_scores[candidates]
+        order = np.lexsort((row_cols, -row_scores))  # 分数降序，同分时按列号
+        results.append([(int(col), float(score)) for col, score in zip(row_cols[order], row_scores[order])])
+    return results
+
+def build_related(db, full=False, k=None, batch_size=None, category_boost=None, log=print):
+    """
+    计算并保存相关商品。返回重新计算的商品数。
+    """
+    np, _ = _require_numpy()
+    config = current_app.config
+    k = k or config.get('RELATED_TOP_K', 6)
+    batch_size = batch_size or config.get('RELATED_BATCH_SIZE', 256)
+    category_boost = config.get('RELATED_CATEGORY_BOOST', 0.5) if category_boost is None else category_boost
+
+    started_at = db.execute(f'SELECT {NOW_SQL}').fetchone()[0]
+    state = db.execute('SELECT built_at FROM related_builds WHERE id = 1').fetchone()
+    since = None if full or state is None else state['built_at']
+
+    # 1. 全部可见商品（已软删除分类下的商品除外）
+    started = time.perf_counter()
+    products = db.execute('''
+        SELECT p.id, p.name, p.description, p.category_id
+        FROM products p LEFT JOIN categories c ON p.category_id = c.id
+        WHERE c.deleted_at IS NULL
+        ORDER BY p.id
+    ''').fetchall()
+    if not products:
+        log('没有商品。')
+        return 0
+
+    ids = np.array([row['id'] for row in products])
+    categories = np.array([row['category_id'] if row['category_id'] is not None else -1 for row in products])
+    matrix = vectorize([(row['name'], row['description'] or '') for row in products])
+    log(f'已向量化 {len(products)} 个商品，{matrix.shape[1]} 个词，用时 {time.perf_counter() - started:.2f}s')
+
+    # 2. 需要重新计算的商品：全量，或上次之后文本有变化的商品
+    if since is None:
+        targets = list(range(len(products)))
+    else:
+        changed = {row[0] for row in db.execute(
+            'SELECT product_id FROM related_changes WHERE changed_at > ?', (since,))}
+        targets = [i for i, row in enumerate(products) if row['id'] in changed]
+
+    def compute(rows):
+        """ 分批计算并写入，返回所有新的近邻行号 """
+        neighbours = set()
+        for start in range(0, len(rows), batch_size):
+            batch = np.array(rows[start:start + batch_size])
+            results = top_k(matrix, batch, categories, k, category_boost)
+
+            begin_immediate(db)
+            try:
+                db.executemany('DELETE FROM related_products WHERE product_id = ?', [(int(ids[i]),) for i in batch])
+                db.executemany(
+                    'INSERT INTO related_products (product_id, rank, related_id, score) VALUES (?, ?, ?, ?)',
+                    [(int(ids[i]), rank, int(ids[col]), score)
+                     for i, result in zip(batch, results)
+                     for rank, (col, score) in enumerate(result)]
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            for result in results:
+                neighbours.update(col for col, _ in result)
+        return neighbours
+
+    started = time.perf_counter()
+    neighbours = compute(targets)
+    computed = len(targets)
+
+    # 3. 增量模式：修改过的商品的近邻也重新计算，使新商品出现在它们的推荐中
+    if since is not None and targets:
+        extra = sorted(neighbours - set(targets))
+        compute(extra)
+        computed += len(extra)
+
+    db.execute('INSERT OR REPLACE INTO related_builds (id, built_at, product_count) VALUES (1, ?, ?)',
+               (started_at, len(products)))
+    # 本次开始之前的标记已处理（之后的写入保留到下一次）
+    db.execute('DELETE FROM related_changes WHERE changed_at <= ?', (started_at,))
+    db.commit()
+    log(f'已计算 {computed} 个商品的相关商品，用时 {time.perf_counter() - started:.2f}s')
+    return computed
+
+@click.command('build-related')
+@click.option('--full', is_flag=True, help='忽略上次运行时间，重新计算所有商品。')
+@click.option('--top-k', 'k', type=int, default=None, help='每个商品保存的相关商品数（默认 RELATED_TOP_K）。')
+@click.option('--batch-size', type=int, default=None, help='每批计算的商品数（默认 RELATED_BATCH_SIZE）。')
+@with_appcontext
+def build_related_command(full, k, batch_size):
+    """
+    Flask CLI 命令：flask build-related
+    离线计算相关商品（默认只刷新上次运行之后修改过的商品）。
+    """
+    computed = build_related(get_db(), full=full, k=k, batch_size=batch_size, log=click.echo)
+    click.echo(f'Built related products for {computed} product(s).')
+
+def init_app(app):
+    app.cli.add_command(build_related_command)
@@ -0,0 +1,291 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+import sqlite3
+from flask import current_app
+
+from app.db import query_db, get_db
+from app import cache, change_log
+
+# 拼音支持依赖 pypinyin（见 requirements.txt）：未安装时仅按原文前缀匹配，构建索引时提示一次
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# 键与引用之间的分隔符，例如 'shouji\x00p42' 表示商品 42，'\x00c3' 表示分类 3
+_SEP = '\x00'
+# 每段中日韩文字最多建立多少个后缀键，保证 "手机" 能匹配到 "苹果手机"
+MAX_CJK_SUFFIXES = 8
+
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+')
+_TOKEN_RE = re.compile(r'\w+')
+
+def normalize(text):
+    """
+    统一大小写与全角/半角，去掉分隔符本身。
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower().strip()
+    return text.replace(_SEP, '')
+
+def index_keys(text):
+    """
+    为一段文本生成所有可被前缀命中的键：
+    整体文本、各个单词、中日韩文字段的后缀，以及（可选）全拼与首字母：
+    整体文本、每个中日韩文字段及其每个后缀都有对应的全拼与首字母键，
+    因此 "shouji" / "sj" 能匹配到 "华为手机"。
+    """
+    text = normalize(text)
+    if not text:
+        return set()
+
+    keys = {text}
+    for token in _TOKEN_RE.findall(text):
+        keys.add(token)
+    cjk_keys = []
+    for run in _CJK_RE.findall(text):
+        cjk_keys.append(run)
+        for start in range(1, min(len(run), MAX_CJK_SUFFIXES + 1)):
+            cjk_keys.append(run[start:])
+    keys.update(cjk_keys)
+
+    if lazy_pinyin is not None and cjk_keys:
+        for source in [text] + cjk_keys:
+            keys.add(''.join(s for s in lazy_pinyin(source) if s.strip()))
+            keys.add(''.join(lazy_pinyin(source, style=Style.FIRST_LETTER)).replace(' ', ''))
+
+    return {key for key in keys if key}
+
+class PrefixIndex:
+    """
+    基于有序数组的前缀索引：所有 '键\\x00引用' 字符串保存在一个排序列表中，
+    查询时二分定位到第一个前缀匹配的位置，再顺序扫描直至前缀不再匹配。
+    """
+
+    def __init__(self):
+        self._entries = []   # 有序的 '键\x00引用' 字符串
+        self._labels = {}    # 引用 -> 显示名称
+        self._refs_keys = {} # 引用 -> 该引用的所有键（用于增量删除）
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def build(self, items):
+        """
+        用 (引用, 名称) 序列整体重建索引。先在局部变量中构建，再一次性替换。
+        """
+        entries = []
+        labels = {}
+        refs_keys = {}
+        for ref, label in items:
+            keys = index_keys(label)
+            labels[ref] = label
+            refs_keys[ref] = keys
+            entries.extend(f'{key}{_SEP}{ref}' for key in keys)
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._labels = labels
+            self._refs_keys = refs_keys
+
+    def add(self, ref, label):
+        """
+        增量插入（或替换）一个引用。
+        """
+        with self._lock:
+            self.remove(ref)
+            keys = index_keys(label)
+            for key in keys:
+                bisect.insort(self._entries, f'{key}{_SEP}{ref}')
+            self._labels[ref] = label
+            self._refs_keys[ref] = keys
+
+    def remove(self, ref):
+        """
+        增量删除一个引用的所有键。
+        """
+        with self._lock:
+            for key in self._refs_keys.pop(ref, ()):
+                entry = f'{key}{_SEP}{ref}'
+                pos = bisect.bisect_left(self._entries, entry)
+                if pos < len(self._entries) and self._entries[pos] == entry:
+                    del self._entries[pos]
+            self._labels.pop(ref, None)
+
+    def label(self, ref):
+        return self._labels.get(ref)
+
+    def suggest(self, prefix, limit=10):
+        """
+        返回前缀匹配的 [(引用, 名称)]，按键的字典序，同一引用只出现一次。
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        with self._lock:
+            entries = self._entries
+            pos = bisect.bisect_left(entries, prefix)
+            while pos < len(entries) and len(results) < limit:
+                entry = entries[pos]
+                if not entry.startswith(prefix):
+                    break
+                ref = entry.rsplit(_SEP, 1)[1]
+                if ref not in seen:
+                    seen.add(ref)
+                    results.append((ref, self._labels.get(ref, '')))
+                pos += 1
+        return results
+
+# --- 进程级索引实例 ---
+_index = PrefixIndex()
+_state = {'built': False, 'versions': None, 'seq': 0, 'checked_at': 0.0, 'rebuilding': False}
+_state_lock = threading.Lock()
+# 一次增量更新最多处理的商品数（变更日志中的商品，包括只改了库存的），超过时整体重建
+MAX_DELTA_PRODUCTS = 20000
+
+def _current_versions():
+    # 'product_names' 只在商品增删、名称或分类变化时递增（见 init_db），库存/价格变化不触发检查
+    return (cache.get_version('product_names'), cache.get_version('categories'))
+
+def _load_items():
+    for row in query_db('SELECT id, name FROM categories WHERE deleted_at IS NULL'):
+        yield f"c{row['id']}", row['name']
+    for row in query_db('SELECT p.id, p.name FROM products p LEFT JOIN categories c ON p.category_id = c.id '
+                        'WHERE c.deleted_at IS NULL'):
+        yield f"p{row['id']}", row['name']
+
+def build_index():
+    """
+    从数据库全量构建索引（应用启动时调用）。
+    """
+    try:
+        versions = _current_versions()
+        seq = change_log.latest_seq(get_db())
+        started = time.perf_counter()
+        _index.build(_load_items())
+    except sqlite3.Error as e:
+        print(f"构建搜索建议索引失败（数据库可能尚未初始化）: {e}")
+        return False
+
+    with _state_lock:
+        first_build = not _state['built']
+        _state.update(built=True, versions=versions, seq=seq, checked_at=time.monotonic())
+    print(f"搜索建议索引已构建：{len(_index)} 个键，用时 {time.perf_counter() - started:.2f}s")
+    if first_build and lazy_pinyin is None:
+        print("未安装 pypinyin：搜索建议不支持拼音与首字母匹配（pip install pypinyin）")
+    return True
+
+def _apply_changes(versions):
+    """
+    按变更日志（change_log）增量更新上次同步之后有变化的商品；名称未变的跳过。
+    无法增量（分类有变化、日志已被清理或变化的商品过多）时返回 False。
+    """
+    if versions[1] != _state['versions'][1]:
+        return False  # 分类改名/删除影响其下所有商品的可见性，整体重建
+    db = get_db()
+    since = _state['seq']
+    latest = change_log.latest_seq(db)
+    try:
+        change_log.fetch_changes(db, since, 1)
+    except change_log.ChangesPruned:
+        return False
+    product_ids = [row[0] for row in db.execute(
+        "SELECT DISTINCT entity_id FROM change_log WHERE seq > ? AND seq <= ? AND entity = 'product' LIMIT ?",
+        (since, latest, MAX_DELTA_PRODUCTS + 1))]
+    if len(product_ids) > MAX_DELTA_PRODUCTS:
+        return False
+
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        placeholders = ','.join('?' for _ in chunk)
+        names = {row['id']: row['name'] for row in query_db(
+            f'SELECT p.id, p.name FROM products p LEFT JOIN categories c ON p.category_id = c.id '
+            f'WHERE p.id IN ({placeholders}) AND c.deleted_at IS NULL', chunk)}
+        for product_id in chunk:
+            ref = f'p{product_id}'
+            name = names.get(product_id)
+            if name is None:
+                _index.remove(ref)
+            elif _index.label(ref) != name:
+                _index.add(ref, name)
+
+    with _state_lock:
+        _state.update(versions=versions, seq=latest)
+    return True
+
+def _refresh_in_background(app):
+    with app.app_context():
+        try:
+            versions = _current_versions()
+            if not _apply_changes(versions):
+                build_index()
+        except sqlite3.Error as e:
+            print(f"更新搜索建议索引失败: {e}")
+        finally:
+            with _state_lock:
+                _state['rebuilding'] = False
+
+def _ensure_fresh():
+    """
+    首次使用时构建索引；之后每隔 SUGGEST_INDEX_CHECK_SECONDS 秒检查一次版本号，
+    若有商品增删、改名（包括其它 worker 的写入），则在后台线程中按变更日志增量更新，
+    只有分类变化或无法增量时才整体重建；期间继续使用现有索引。
+    """
+    if not _state['built']:
+        build_index()
+        return
+
+    interval = current_app.config.get('SUGGEST_INDEX_CHECK_SECONDS', 60)
+    now = time.monotonic()
+    with _state_lock:
+        if _state['rebuilding'] or now - _state['checked_at'] < interval:
+            return
+        _state['checked_at'] = now
+
+    if _current_versions() != _state['versions']:
+        with _state_lock:
+            if _state['rebuilding']:
+                return
+            _state['rebuilding'] = True
+        app = current_app._get_current_object()
+        threading.Thread(target=_refresh_in_background, args=(app,), daemon=True).start()
+
+def suggest(prefix, limit=10):
+    """
+    返回搜索建议：[{'type': 'product'|'category', 'id': ..., 'name': ...}]
+    """
+    _ensure_fresh()
+    suggestions = []
+    for ref, label in _index.suggest(prefix, limit):
+        kind = 'category' if ref[0] == 'c' else 'product'
+        suggestions.append({'type': kind, 'id': int(ref[1:]), 'name': label})
+    return suggestions
+
+# --- 管理后台写入后的增量更新 ---
+# 只更新本进程的索引，不改动记录的版本号与变更日志位置：其它 worker 同一时间的写入
+# 在下一次检查时按变更日志补上（本进程的写入届时名称已一致，直接跳过）。
+def index_product(product_id, name):
+    if _state['built']:
+        _index.add(f'p{product_id}', name)
+
+def unindex_product(product_id):
+    if _state['built']:
+        _index.remove(f'p{product_id}')
+
+def index_category(category_id, name):
+    if _state['built']:
+        _index.add(f'c{category_id}', name)
+
+def unindex_category(category_id):
+    """
+    删除（或软删除）分类时，其下商品会一并删除/隐藏，因此这里直接重建索引。
+    """
+    if _state['built']:
+        build_index()
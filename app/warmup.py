@@ -0,0 +1,129 @@
+import gc
+import os
+import threading
+import time
+import click
+from flask.cli import with_appcontext
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+from app.db import query_db, close_pool
+from app import db, cache, search, orders, category_deletion, writer
+
+def compile_templates(app, force=False):
+    """
+    预编译所有模板（结果保存在 app.jinja_env 的模板缓存中，
+    并写入磁盘字节码缓存）。force=True 时先清空字节码缓存，强制重新编译。
+    返回 [(模板名, 耗时秒数)]。
+    """
+    if force:
+        app.jinja_env.cache.clear()
+        if app.jinja_env.bytecode_cache is not None:
+            app.jinja_env.bytecode_cache.clear()
+
+    timings = []
+    for name in sorted(set(app.jinja_env.list_templates())):
+        started = time.perf_counter()
+        app.jinja_env.get_template(name)
+        timings.append((name, time.perf_counter() - started))
+    return timings
+
+def prime_listings(app):
+    """
+    预热分类列表、分面计数与前几页商品列表：
+    经过完整的请求流程，使 SQLite 文件页进入操作系统缓存，进程内缓存被填充。
+    """
+    pages = app.config.get('WARMUP_LISTING_PAGES', 3)
+    max_categories = app.config.get('WARMUP_MAX_CATEGORIES', 20)
+
+    client = app.test_client()
+    urls = [f'/?page={page}' for page in range(1, pages + 1)]
+    with app.app_context():
+        category_ids = [row['id'] for row in query_db(
+            'SELECT id FROM categories WHERE deleted_at IS NULL ORDER BY id LIMIT ?', [max_categories])]
+    urls += [f'/?category_id={category_id}' for category_id in category_ids]
+
+    # 预热请求不应在 master 中启动后台线程（fork 之前进程应保持单线程）
+    thread_flags = ('RESERVATION_SWEEPER_ENABLED', 'CATEGORY_DELETE_WORKER_ENABLED')
+    saved = {flag: app.config.get(flag, True) for flag in thread_flags}
+    app.config.update({flag: False for flag in thread_flags})
+    try:
+        for url in urls:
+            # buffered=True：读完（流式渲染的）响应体，模板才会真正渲染
+            client.get(url, buffered=True)
+    finally:
+        app.config.update(saved)
+    return len(urls)
+
+def warmup(app):
+    """
+    在 worker 开始接收请求之前执行：编译模板、构建搜索索引、预热列表页。
+    使用 gunicorn preload_app 时只在 master 中执行一次，worker 通过 fork 的写时复制共享结果。
+    """
+    started = time.perf_counter()
+    templates = compile_templates(app)
+    with app.app_context():
+        search.build_index()
+    try:
+        urls = prime_listings(app)
+    except Exception as e:
+        # 数据库尚未初始化等情况下不应阻止启动
+        print(f"预热列表页失败: {e}")
+        urls = 0
+    # 预热请求归还到连接池的连接不能带入 fork 出的 worker
+    close_pool(app)
+    print(f"预热完成：{len(templates)} 个模板，{urls} 个列表页，用时 {time.perf_counter() - started:.2f}s")
+
+def freeze_for_fork():
+    """
+    将预热后的对象移出 GC 跟踪，避免 worker 中的垃圾回收写入这些对象的内存页，
+    从而最大化 fork 之后的写时复制共享。
+    """
+    gc.collect()
+    gc.freeze()
+
+def reinit_after_fork(app):
+    """
+    在 fork 出的 worker 中调用：
+    - 锁可能在 fork 时处于被持有状态，需重新创建；
+    - SQLite 连接不能跨 fork 使用：master 中不应有打开的连接，这里确保 worker 从新连接开始。
+    """
+    cache._lock = threading.Lock()
+    search._state_lock = threading.Lock()
+    search._index._lock = threading.RLock()  # master 预热时构建索引会持有它
+    search._state['rebuilding'] = False
+    orders._sweeper_lock = threading.Lock()
+    category_deletion._worker_lock = threading.Lock()
+    category_deletion._worker['running'] = False
+    db._pool_lock = threading.Lock()
+    writer._lock = threading.Lock()
+
+    # master 预热结束时已关闭连接池；即使池中仍有继承来的连接，也会因进程号不同而被整体作废，
+    # worker 中的第一个请求会通过 get_db() 打开属于自己的连接。
+    with app.app_context():
+        query_db('SELECT 1')
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """
+    Flask CLI 命令：flask compile-templates
+    重新编译所有模板并写入字节码缓存目录，新启动的 worker 直接加载编译结果。
+    """
+    app = current_app._get_current_object()
+    timings = compile_templates(app, force=True)
+    for name, elapsed in timings:
+        click.echo(f'{elapsed * 1000:8.1f} ms  {name}')
+    total = sum(elapsed for _, elapsed in timings)
+    click.echo(f'Compiled {len(timings)} template(s) in {total * 1000:.1f} ms '
+               f'into {app.config["JINJA_BYTECODE_CACHE_DIR"]}.')
+
+def init_app(app):
+    """
+    配置 Jinja 字节码缓存，并注册 'flask compile-templates' 命令。
+    """
+    cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    app.cli.add_command(compile_templates_command)
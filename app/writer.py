@@ -0,0 +1,224 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.db import connect, begin_immediate
+from config import DEFAULT_SECRET_KEY
+
+# 小写入（留言、注册）的单写者队列：
+# - 请求线程把一条写语句放入队列并等待结果（lastrowid 或 sqlite3 异常）；
+# - 写线程把 WRITE_BATCH_WINDOW 秒内到达的写入合并为一个事务提交（group commit），
+#   每条语句在各自的 SAVEPOINT 中执行，一条失败（例如唯一约束冲突）不影响同批的其它写入；
+# - 默认由独立的写进程（gunicorn master 启动，或 'flask writer'）统一执行，整台主机只有一个写者，
+#   worker 通过 WRITER_SOCKET（Unix socket，权限 0600）提交；写进程不可用时（例如开发服务器）
+#   退回本进程的写线程。
+# - socket 的认证密钥由 SECRET_KEY 派生：SECRET_KEY 为公开的开发默认值时不启动写进程，也不连接。
+
+_lock = threading.Lock()
+_client = threading.local()
+# 连接写进程失败后，多久之内直接使用本进程的写线程（秒）
+_RECONNECT_INTERVAL = 30
+
+class WriteTimeout(sqlite3.OperationalError):
+    """ 在 WRITE_TIMEOUT 内没有轮到执行：语句已从队列中取消，不会再写入 """
+
+def insecure_secret(app):
+    return app.config.get('SECRET_KEY') in (None, '', DEFAULT_SECRET_KEY)
+
+def _authkey(app):
+    return hashlib.sha256(('writer:' + str(app.config['SECRET_KEY'])).encode()).digest()
+
+def _commit_batch(db, batch):
+    """ 在一个事务中执行一批写入并提交，然后逐个设置结果 """
+    # 跳过等待超时已被取消的写入；其余标记为执行中，此后不能再取消
+    batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+    if not batch:
+        return
+    results = []
+    try:
+        begin_immediate(db)
+        for future, sql, params in batch:
+            db.execute('SAVEPOINT write')
+            try:
+                cursor = db.execute(sql, params)
+                results.append((future, cursor.lastrowid, None))
+            except Exception as e:
+                db.execute('ROLLBACK TO write')
+                results.append((future, None, e))
+            db.execute('RELEASE write')
+        db.commit()
+    except Exception as e:
+        # 事务本身失败（例如等待写锁超时）：整批都返回该错误
+        if db.in_transaction:
+            db.rollback()
+        for future, _, _ in batch:
+            future.set_exception(e)
+        return
+    for future, lastrowid, error in results:
+        if error is None:
+            future.set_result(lastrowid)
+        else:
+            future.set_exception(error)
+
+def _writer_loop(database, requests, window, max_batch):
+    db = connect(database)
+    try:
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + window
+            while len(batch) < max_batch:
+                try:
+                    batch.append(requests.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            _commit_batch(db, batch)
+    finally:
+        db.close()
+
+def _local_writer(app):
+    """ 本进程的写线程（fork 之后按进程号重新创建） """
+    with _lock:
+        writer = app.extensions.get('writer')
+        if writer is None or writer['pid'] != os.getpid():
+            requests = queue.Queue()
+            threading.Thread(
+                target=_writer_loop,
+                args=(app.config['DATABASE'], requests,
+                      app.config.get('WRITE_BATCH_WINDOW', 0.002), app.config.get('WRITE_BATCH_MAX', 200)),
+                name='db-writer', daemon=True
+            ).start()
+            writer = app.extensions['writer'] = {'pid': os.getpid(), 'requests': requests}
+    return writer
+
+def _submit_local(app, sql, params):
+    """
+    放入本进程的写队列并等待结果。超过 WRITE_TIMEOUT 仍未开始执行时取消并抛出 WriteTimeout（确定没有写入）；
+    已经开始执行的批次继续等待其提交或失败（受连接的 busy timeout 限制），不会在结果未知时返回。
+    """
+    future = Future()
+    _local_writer(app)['requests'].put((future, sql, tuple(params)))
+    try:
+        return future.result(timeout=app.config.get('WRITE_TIMEOUT', 10))
+    except FutureTimeout:
+        if future.cancel():
+            raise WriteTimeout('写入排队超时，未执行')
+    return future.result()
+
+def _remote_connection(app, address):
+    """ 当前线程到写进程的连接；连接不上时返回 None """
+    connection = getattr(_client, 'connection', None)
+    if connection is not None and _client.pid == os.getpid():
+        return connection
+    if time.monotonic() - getattr(_client, 'failed_at', -_RECONNECT_INTERVAL) < _RECONNECT_INTERVAL:
+        return None
+    try:
+        connection = Client(address, family='AF_UNIX', authkey=_authkey(app))
+    except (OSError, AuthenticationError) as e:
+        _client.failed_at = time.monotonic()
+        print(f"无法连接写进程 {address}，{_RECONNECT_INTERVAL} 秒内改为进程内写入: {e}")
+        return None
+    _client.connection, _client.pid = connection, os.getpid()
+    return connection
+
+def _submit_remote(app, connection, sql, params):
+    try:
+        connection.send((sql, tuple(params)))
+        status, value = connection.recv()
+    except (OSError, EOFError) as e:
+        # 语句可能已经执行，不能改为本地重试
+        _client.connection = None
+        raise sqlite3.OperationalError(f'写进程连接中断: {e}')
+    if status == 'ok':
+        return value
+    error_class, message = value
+    if error_class == WriteTimeout.__name__:
+        raise WriteTimeout(message)
+    raise getattr(sqlite3, error_class, sqlite3.Error)(message)
+
+def execute(sql, params=()):
+    """
+    提交一条写语句并等待其所在批次提交。返回 lastrowid；
+    语句失败时抛出对应的 sqlite3 异常（例如 sqlite3.IntegrityError）。
+    """
+    app = current_app._get_current_object()
+    address = app.config.get('WRITER_SOCKET')
+    if address and not insecure_secret(app):
+        connection = _remote_connection(app, address)
+        if connection is not None:
+            return _submit_remote(app, connection, sql, params)
+    return _submit_local(app, sql, params)
+
+# --- 写进程 ---
+def _serve_client(app, connection):
+    with connection:
+        while True:
+            try:
+                sql, params = connection.recv()
+            except (OSError, EOFError):
+                return
+            try:
+                reply = ('ok', _submit_local(app, sql, params))
+            except sqlite3.Error as e:
+                reply = ('error', (type(e).__name__, str(e)))
+            except Exception as e:
+                reply = ('error', ('OperationalError', f'写入失败: {e}'))
+            try:
+                connection.send(reply)
+            except OSError:
+                return
+
+def serve(app, address=None):
+    """
+    运行写进程：在 Unix socket 上接收各 worker 提交的写入，由本进程唯一的写线程批量提交。
+    SECRET_KEY 为开发默认值时抛出 RuntimeError（认证密钥可被猜出）。
+    """
+    if insecure_secret(app):
+        raise RuntimeError('SECRET_KEY 为开发默认值，拒绝启动写进程（请设置 SECRET_KEY）')
+    address = address or app.config['WRITER_SOCKET']
+    os.makedirs(os.path.dirname(address) or '.', exist_ok=True)
+    if os.path.exists(address):
+        os.remove(address)
+    # socket 文件创建时即为 0600：只有运行应用的用户能连接
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family='AF_UNIX', authkey=_authkey(app))
+    finally:
+        os.umask(umask)
+    with listener:
+        print(f"写进程已启动：{address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                # 认证失败等单个连接的错误不应终止写进程
+                print(f"写进程拒绝连接: {e}")
+                continue
+            threading.Thread(target=_serve_client, args=(app, connection), daemon=True).start()
+
+@click.command('writer')
+@click.option('--socket', 'address', default=None, help='Unix socket 路径（默认 WRITER_SOCKET）。')
+@with_appcontext
+def writer_command(address):
+    """
+    Flask CLI 命令：flask writer
+    运行本机唯一的数据库写进程（各 worker 需配置相同的 WRITER_SOCKET）。
+    """
+    app = current_app._get_current_object()
+    address = address or app.config.get('WRITER_SOCKET')
+    if not address:
+        raise click.ClickException('请通过 --socket 或 WRITER_SOCKET 指定 Unix socket 路径。')
+    if insecure_secret(app):
+        raise click.ClickException('SECRET_KEY 为开发默认值，拒绝启动写进程：请先设置 SECRET_KEY。')
+    serve(app, address)
+
+def init_app(app):
+    app.cli.add_command(writer_command)
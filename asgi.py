@@ -0,0 +1,16 @@
+from app import create_app
+from app.warmup import warmup
+from app.asgi import make_asgi_app
+import os
+
+# [新增] ASGI 入口：uvicorn / hypercorn 会查找名为 'application' 的可调用对象
+# 例如：uvicorn asgi:application --workers 4
+# 每个请求在线程池（ASGI_THREADS 个线程）中执行：一个请求等待邮件发送、文件保存时，
+# 同一 worker 的其它线程继续处理请求。与 gunicorn 的 gthread worker（GUNICORN_THREADS）相同，
+# 并发度取决于线程数，而不是视图是否为 async。
+config_name = os.environ.get('FLASK_CONFIG', 'production')
+flask_app = create_app(config_name)
+application = make_asgi_app(flask_app)
+
+# 启动时预热（模板编译、搜索建议索引、分类与首批列表页）
+warmup(flask_app)
@@ -0,0 +1,68 @@
+"""
+并发下单：多个进程同时抢购同一件库存有限的热门商品，验证不会超卖，并统计吞吐。
+每个进程使用独立的 SQLite 连接（与多个 gunicorn worker 相同）。
+
+    python -m benchmarks.bench_checkout
+"""
+import multiprocessing
+import sqlite3
+import time
+
+from app import orders
+from app.db import connect
+from benchmarks.harness import make_app
+
+STOCK = 200
+PROCESSES = 8
+ATTEMPTS_PER_PROCESS = 60
+USER_ID = 1 # init_db 创建的默认管理员
+
+def buyer(database, product_id, results):
+    db = connect(database)
+    sold = rejected = errors = 0
+    for _ in range(ATTEMPTS_PER_PROCESS):
+        try:
+            orders.reserve(db, USER_ID, {product_id: 1}, ttl_seconds=600)
+            sold += 1
+        except orders.InsufficientStock:
+            rejected += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    results.put((sold, rejected, errors))
+
+def main():
+    app = make_app(products=1)
+    database = app.config['DATABASE']
+    db = connect(database)
+    db.execute('UPDATE products SET stock = ? WHERE id = 1', (STOCK,))
+    db.commit()
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=buyer, args=(database, 1, results)) for _ in range(PROCESSES)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    sold = sum(o[0] for o in outcomes)
+    rejected = sum(o[1] for o in outcomes)
+    errors = sum(o[2] for o in outcomes)
+    stock = db.execute('SELECT stock FROM products WHERE id = 1').fetchone()[0]
+    reserved = db.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = 1').fetchone()[0]
+
+    attempts = PROCESSES * ATTEMPTS_PER_PROCESS
+    print(f'{PROCESSES} 个进程共 {attempts} 次下单，初始库存 {STOCK}：')
+    print(f'成功 {sold}，库存不足 {rejected}，锁超时 {errors}，剩余库存 {stock}，订单明细数量合计 {reserved}')
+    print(f'用时 {elapsed:.2f}s，{attempts / elapsed:.0f} 次/秒')
+
+    assert stock >= 0, '库存为负：发生超卖'
+    assert sold == reserved == STOCK - stock, '订单数量与库存扣减不一致'
+    assert sold == STOCK, '库存未被完全售出'
+    print('OK：没有超卖。')
+
+if __name__ == '__main__':
+    main()
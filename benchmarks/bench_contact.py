@@ -0,0 +1,73 @@
+"""
+对比：相同线程数下，多线程 WSGI worker（gunicorn gthread，GUNICORN_THREADS）与 ASGI 入口（ASGI_THREADS）
+处理 /contact 的并发能力，另以单线程 WSGI worker（gunicorn 默认的 sync worker）作参照。
+用 time.sleep 模拟一个缓慢的邮件服务（Resend API 每次耗时 EMAIL_DELAY 秒）。
+
+预期：两种多线程入口的吞吐相近，都约为单线程的 THREADS 倍。并发来自线程数，
+async 视图本身在等待期间仍占用处理请求的线程，不额外提高 /contact 的并发。
+
+    python -m benchmarks.bench_contact
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import resend
+
+from app.asgi import make_asgi_app
+from benchmarks.harness import make_app, wsgi_request, asgi_request
+
+EMAIL_DELAY = 0.2
+CONCURRENCY = 20
+THREADS = 20  # 两个多线程入口使用相同的线程数
+
+FORM = {
+    'name': 'Bench', 'email': 'bench@example.com', 'subject': 'Hi',
+    'company': '', 'phone': '', 'message': 'hello',
+}
+
+def slow_send(params):
+    time.sleep(EMAIL_DELAY)
+    return {'id': 'bench'}
+
+def main():
+    resend.Emails.send = slow_send
+    app = make_app()
+
+    def post(_):
+        status, _, _ = wsgi_request(app, 'POST', '/contact', form=FORM)
+        assert status == 302, status
+
+    # 1. 单线程 WSGI worker（gunicorn sync worker）：请求只能依次处理
+    started = time.perf_counter()
+    for i in range(CONCURRENCY):
+        post(i)
+    sync_elapsed = time.perf_counter() - started
+
+    # 2. 多线程 WSGI worker（gunicorn gthread worker，THREADS 个线程）
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        started = time.perf_counter()
+        list(pool.map(post, range(CONCURRENCY)))
+        threaded_elapsed = time.perf_counter() - started
+
+    # 3. ASGI 入口（asgi.py，THREADS 个线程）
+    app.config['ASGI_THREADS'] = THREADS
+    asgi_app = make_asgi_app(app)
+
+    async def burst():
+        return await asyncio.gather(*(asgi_request(asgi_app, 'POST', '/contact', form=FORM)
+                                      for _ in range(CONCURRENCY)))
+
+    started = time.perf_counter()
+    results = asyncio.run(burst())
+    asgi_elapsed = time.perf_counter() - started
+    assert all(status == 302 for status, _, _ in results)
+
+    print(f'模拟邮件延迟 {EMAIL_DELAY * 1000:.0f}ms，{CONCURRENCY} 个并发 POST /contact')
+    for title, elapsed in (('WSGI 单线程', sync_elapsed),
+                           (f'WSGI {THREADS} 线程', threaded_elapsed),
+                           (f'ASGI {THREADS} 线程', asgi_elapsed)):
+        print(f'{title:<12} {elapsed:.2f}s ({CONCURRENCY / elapsed:.1f} req/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+对比：整页渲染 (render_template) 与流式渲染 (STREAM_TEMPLATES) 的首字节时间。
+详情页带有大量留言（留言区由游标逐行读取），首页为默认排序的第一页。
+
+    python -m benchmarks.bench_streaming
+"""
+from app.db import get_db
+from benchmarks.harness import make_app, wsgi_request, report
+
+PRODUCTS = 2000
+COMMENTS = 3000
+ROUNDS = 50
+
+def seed_comments(app, product_id, count):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO users (username, email, password_hash, role) VALUES ('bench', 'bench@example.com', '', 'guest')")
+        user_id = db.execute("SELECT id FROM users WHERE username = 'bench'").fetchone()['id']
+        db.executemany(
+            'INSERT INTO comments (product_id, user_id, username, body) VALUES (?, ?, ?, ?)',
+            [(product_id, user_id, 'bench', f'第 {i} 条留言\n第二行') for i in range(count)]
+        )
+        db.commit()
+
+def main():
+    app = make_app(products=PRODUCTS)
+    app.config['RESERVATION_SWEEPER_ENABLED'] = False
+    seed_comments(app, 1, COMMENTS)
+
+    pages = [('首页', '/'), (f'详情页 ({COMMENTS} 条留言)', '/product/1')]
+    for stream in (False, True):
+        app.config['STREAM_TEMPLATES'] = stream
+        mode = '流式渲染' if stream else '整页渲染'
+        for title, path in pages:
+            wsgi_request(app, 'GET', path)  # 预热模板与缓存
+            timings = [wsgi_request(app, 'GET', path) for _ in range(ROUNDS)]
+            assert all(status == 200 for status, _, _ in timings)
+            report(f'{mode} {title}', timings)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+留言高峰：多个进程（相当于多个 gunicorn worker，每个若干线程）同时写留言。
+对比各自连接直接 INSERT + COMMIT 与经写进程合并提交（WRITER_SOCKET）的吞吐与失败数。
+
+    python -m benchmarks.bench_writer
+"""
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+from app import writer
+from app.db import connect
+from benchmarks.harness import make_app
+
+PROCESSES = 8
+THREADS = 4
+COMMENTS_PER_THREAD = 50
+SQL = 'INSERT INTO comments (product_id, user_id, username, body) VALUES (1, 1, ?, ?)'
+
+def direct(app, errors):
+    db = connect(app.config['DATABASE'])
+    for i in range(COMMENTS_PER_THREAD):
+        try:
+            db.execute(SQL, ('bench', f'留言 {i}'))
+            db.commit()
+        except sqlite3.OperationalError:
+            db.rollback()
+            errors.append(i)
+    db.close()
+
+def queued(app, errors):
+    with app.app_context():
+        for i in range(COMMENTS_PER_THREAD):
+            try:
+                writer.execute(SQL, ('bench', f'留言 {i}'))
+            except sqlite3.OperationalError:
+                errors.append(i)
+
+def run_process(app, target, results):
+    errors = []
+    threads = [threading.Thread(target=target, args=(app, errors)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(len(errors))
+
+def run(app, target):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    started = time.perf_counter()
+    processes = [context.Process(target=run_process, args=(app, target, results)) for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    errors = sum(results.get() for _ in processes)
+    total = PROCESSES * THREADS * COMMENTS_PER_THREAD
+    return total, errors, elapsed
+
+def main():
+    app = make_app(products=1)
+    app.config['RESERVATION_SWEEPER_ENABLED'] = False
+    app.config['SECRET_KEY'] = 'bench-writer'  # 写进程拒绝使用开发默认密钥
+
+    for title, target in (('各 worker 直接提交', direct), ('写进程合并提交', queued)):
+        if target is queued:
+            app.config['WRITER_SOCKET'] = os.path.join(os.path.dirname(app.config['DATABASE']), 'writer.sock')
+            server = multiprocessing.get_context('fork').Process(target=writer.serve, args=(app,), daemon=True)
+            server.start()
+            time.sleep(0.5)
+        total, errors, elapsed = run(app, target)
+        print(f'{title:<12} {total} 条留言  失败 {errors:>4}  用时 {elapsed:.2f}s  {(total - errors) / elapsed:8.0f} 条/秒')
+    server.terminate()
+
+if __name__ == '__main__':
+    main()
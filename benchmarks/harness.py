@@ -0,0 +1,139 @@
+"""
+基准测试公共工具：临时数据库、造数，以及在进程内驱动 WSGI / ASGI 应用并计时。
+不经过网络，结果反映应用本身（而非服务器/网络）的开销。
+
+在项目根目录运行，例如：python -m benchmarks.bench_contact
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.db import init_db, get_db
+
+def make_app(products=0, categories=5, config_name='development'):
+    """
+    创建一个使用临时数据库的应用，并写入指定数量的测试商品。
+    """
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    app = create_app(config_name)
+    app.config['DATABASE'] = os.path.join(workdir, 'bench.db')
+    app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.makedirs(app.config['UPLOAD_FOLDER'])
+
+    with app.app_context():
+        init_db()
+        seed(get_db(), products, categories)
+    return app
+
+def seed(db, products, categories):
+    db.executemany('INSERT INTO categories (name) VALUES (?)',
+                   [(f'分类 {i}',) for i in range(categories)])
+    db.executemany(
+        'INSERT INTO products (name, description, price, stock, category_id) VALUES (?, ?, ?, ?, ?)',
+        [(f'测试商品 {i}', f'商品 {i} 的描述\n第二行', 1 + (i * 7919) % 1000, i % 20, 1 + i % categories)
+         for i in range(products)]
+    )
+    db.commit()
+
+def _environ(method, path, query=None, form=None):
+    body = urlencode(form or {}).encode()
+    return {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': urlencode(query or {}),
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+def wsgi_request(app, method='GET', path='/', query=None, form=None):
+    """
+    调用一次 WSGI 应用，返回 (状态码, 首字节时间, 总时间)，单位秒。
+    """
+    status = {}
+
+    def start_response(status_line, headers, exc_info=None):
+        status['code'] = int(status_line.split()[0])
+
+    started = time.perf_counter()
+    first_byte = None
+    result = app.wsgi_app(_environ(method, path, query, form), start_response)
+    try:
+        for chunk in result:
+            if chunk and first_byte is None:
+                first_byte = time.perf_counter() - started
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    total = time.perf_counter() - started
+    return status.get('code'), first_byte if first_byte is not None else total, total
+
+async def asgi_request(asgi_app, method='GET', path='/', query=None, form=None):
+    """
+    调用一次 ASGI 应用，返回 (状态码, 首字节时间, 总时间)，单位秒。
+    """
+    body = urlencode(form or {}).encode()
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(query or {}).encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 50000),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = {}
+    started = time.perf_counter()
+    timings = {}
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        elif message['type'] == 'http.response.body' and message.get('body'):
+            timings.setdefault('first_byte', time.perf_counter() - started)
+
+    await asgi_app(scope, receive, send)
+    total = time.perf_counter() - started
+    return status.get('code'), timings.get('first_byte', total), total
+
+def report(title, timings):
+    """
+    打印一组 (状态码, 首字节, 总时间) 结果的统计。
+    """
+    first_bytes = sorted(t[1] for t in timings)
+    totals = sorted(t[2] for t in timings)
+    n = len(timings)
+    print(f'{title}: n={n} '
+          f'ttfb p50={first_bytes[n // 2] * 1000:.1f}ms p95={first_bytes[int(n * 0.95)] * 1000:.1f}ms '
+          f'total p50={totals[n // 2] * 1000:.1f}ms p95={totals[int(n * 0.95)] * 1000:.1f}ms')
@@ -9,6 +9,9 @@ load_dotenv()
 # os.path.dirname(__file__) 获取 config.py 所在的目录 (即项目根目录)
 PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 
+# 未设置 SECRET_KEY 时使用的开发密钥（公开可知：依赖密钥的功能，例如写进程的认证，在此密钥下拒绝启动）
+DEFAULT_SECRET_KEY = 'development-fallback-key-please-change-me'
+
 class Config:
     """
     基础配置类。
@@ -17,7 +20,7 @@ class Config:
     
     # 1. 安全与密钥
     # 强烈建议从环境变量加载，'development-fallback-key' 仅用于开发
-    SECRET_KEY = os.environ.get('SECRET_KEY', 'development-fallback-key-please-change-me')
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
     
     # 2. 数据库配置
     # 使用绝对路径确保无论从哪里运行脚本，数据库路径都正确
@@ -48,6 +51,106 @@ class Config:
         'strict_transport_security': False # 生产中应由 Cloudflare 或 Nginx 处理
     }
 
+    # 6. [新增] 搜索建议索引
+    # 每隔多少秒检查一次其它 worker 是否写入过商品/分类（若是则后台重建索引）
+    SUGGEST_INDEX_CHECK_SECONDS = int(os.environ.get('SUGGEST_INDEX_CHECK_SECONDS', 60))
+
+    # 7. [新增] ASGI 入口 (asgi.py) 每个 worker 处理请求的线程数
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+    # 8. [新增] 启动预热：预热前几页商品列表，以及前多少个分类的首页
+    WARMUP_LISTING_PAGES = int(os.environ.get('WARMUP_LISTING_PAGES', 3))
+    WARMUP_MAX_CATEGORIES = int(os.environ.get('WARMUP_MAX_CATEGORIES', 20))
+
+    # 9. [新增] Jinja 模板字节码缓存目录（由 'flask compile-templates' 预先填充）
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR',
+                                              os.path.join(PROJECT_ROOT, 'instance', 'jinja_cache'))
+
+    # 10. [新增] 静态导出 ('flask freeze-catalog') 的默认输出目录
+    FREEZE_OUTPUT_DIR = os.environ.get('FREEZE_OUTPUT_DIR', os.path.join(PROJECT_ROOT, 'frozen'))
+
+    # 11. [新增] 下单库存预留：有效期（秒）与后台清理间隔（秒）
+    RESERVATION_TTL_SECONDS = int(os.environ.get('RESERVATION_TTL_SECONDS', 15 * 60))
+    RESERVATION_SWEEP_INTERVAL = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 30))
+    RESERVATION_SWEEPER_ENABLED = True
+
+    # 12. [新增] HTTP 缓存：CDN 对匿名页面的缓存时间（秒），以及写入后清除 CDN 缓存的实现
+    # CACHE_PURGER 为类的导入路径，例如 'app.http_cache.CloudflarePurger'（需同时配置 zone 与 token）
+    EDGE_CACHE_SECONDS = int(os.environ.get('EDGE_CACHE_SECONDS', 300))
+    CACHE_PURGER = os.environ.get('CACHE_PURGER', 'app.http_cache.LocalPurger')
+    CLOUDFLARE_ZONE_ID = os.environ.get('CLOUDFLARE_ZONE_ID')
+    CLOUDFLARE_API_TOKEN = os.environ.get('CLOUDFLARE_API_TOKEN')
+
+    # 13. [新增] 首页与详情页流式渲染（先发送 <head>，再边渲染边发送），以及合并发送的块大小（字符数）
+    STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', '1') == '1'
+    STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 2048))
+
+    # 14. [新增] 分类后台删除：每批删除的商品数，批与批之间的停顿（秒），
+    # 以及任务租约的时长（秒，每批续约；执行进程崩溃后到期由其它进程接手）
+    CATEGORY_DELETE_BATCH_SIZE = int(os.environ.get('CATEGORY_DELETE_BATCH_SIZE', 500))
+    CATEGORY_DELETE_PAUSE = float(os.environ.get('CATEGORY_DELETE_PAUSE', 0.05))
+    CATEGORY_DELETE_LEASE = int(os.environ.get('CATEGORY_DELETE_LEASE', 60))
+    CATEGORY_DELETE_WORKER_ENABLED = True
+
+    # 15. [新增] 相关商品 ('flask build-related')：每个商品保存的数量、每批计算的商品数、同分类加权
+    RELATED_TOP_K = int(os.environ.get('RELATED_TOP_K', 6))
+    RELATED_BATCH_SIZE = int(os.environ.get('RELATED_BATCH_SIZE', 256))
+    RELATED_CATEGORY_BOOST = float(os.environ.get('RELATED_CATEGORY_BOOST', 0.5))
+
+    # 16. [新增] 每个进程保留的空闲数据库连接数（连接跨请求复用，预编译语句缓存随之保留）
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+
+    # 17. [新增] 单写者队列：合并提交的等待窗口（秒）、每批最多语句数、请求等待结果的超时（秒）；
+    # 写入默认由本机唯一的写进程执行（gunicorn master 启动，或 'flask writer'），worker 经 WRITER_SOCKET
+    # （Unix socket 路径）提交；设为空字符串时每个进程使用自己的写线程
+    WRITE_BATCH_WINDOW = float(os.environ.get('WRITE_BATCH_WINDOW', 0.002))
+    WRITE_BATCH_MAX = int(os.environ.get('WRITE_BATCH_MAX', 200))
+    WRITE_TIMEOUT = float(os.environ.get('WRITE_TIMEOUT', 10))
+    WRITER_SOCKET = os.environ.get('WRITER_SOCKET', os.path.join(PROJECT_ROOT, 'instance', 'writer.sock'))
+
+    # 18. [新增] 分块上传 (/admin/uploads)：单块上限（需小于 MAX_CONTENT_LENGTH）、单个文件上限（字节），
+    # 以及没有进展的上传保留多久（秒）
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+    UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 64 * 1024 * 1024))
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+
+    # 19. [新增] 站点地图 (/sitemap.xml)：每个商品地图覆盖的 id 区间大小（协议上限 50000 个 URL）、
+    # 商品地图的磁盘缓存目录，以及 URL 前缀（为空时使用请求的主机名）
+    SITEMAP_PAGE_SIZE = int(os.environ.get('SITEMAP_PAGE_SIZE', 10000))
+    SITEMAP_CACHE_DIR = os.environ.get('SITEMAP_CACHE_DIR', os.path.join(PROJECT_ROOT, 'instance', 'sitemaps'))
+    SITEMAP_BASE_URL = os.environ.get('SITEMAP_BASE_URL', '')
+
+    # 20. [新增] 目录变更日志 (/api/changes)：保留天数、顺带清理的最小间隔（秒）、每页条数上限、
+    # 长轮询的最长等待与检查间隔（秒），以及非管理员访问所需的令牌（为空时只允许管理员会话）
+    CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', 7))
+    CHANGE_LOG_PRUNE_INTERVAL = int(os.environ.get('CHANGE_LOG_PRUNE_INTERVAL', 3600))
+    CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+    # 挂起的长轮询占用处理线程（同步 worker 下为整个 worker），默认只挂起几秒，见 app/main/changes.py
+    CHANGES_MAX_WAIT = float(os.environ.get('CHANGES_MAX_WAIT', 5))
+    CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 0.25))
+    CHANGES_API_TOKEN = os.environ.get('CHANGES_API_TOKEN')
+
+    # 21. [新增] 'flask db-maintain'：每一步的时间预算（秒）、ANALYZE 每个索引的采样行数（0 为不限）、
+    # 增量 vacuum 每批归还的页数
+    DB_MAINTAIN_STEP_BUDGET = float(os.environ.get('DB_MAINTAIN_STEP_BUDGET', 30))
+    DB_MAINTAIN_ANALYSIS_LIMIT = int(os.environ.get('DB_MAINTAIN_ANALYSIS_LIMIT', 1000))
+    DB_MAINTAIN_VACUUM_BATCH = int(os.environ.get('DB_MAINTAIN_VACUUM_BATCH', 256))
+
+    # 22. [新增] 'flask backup' / 'flask restore'：快照目录（最好与上传目录在同一文件系统，才能使用硬链接）、
+    # 保留的快照数、在线备份每步复制的页数与步间休眠（秒），以及备份期间因写入重新开始的次数上限
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(PROJECT_ROOT, 'instance', 'backups'))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 14))
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', 1024))
+    BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', 0.01))
+    BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', 3))
+
+    # 23. [新增] 单请求性能剖析 (/admin/profiles)：是否启用（未启用时不注册任何钩子）、随机抽样比例（0~1，
+    # 0 为只剖析管理员带 _profile=1 的请求）、结果目录与保留的记录数
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(PROJECT_ROOT, 'instance', 'profiles'))
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+
 class DevelopmentConfig(Config):
     DEBUG = True
     TALISMAN_CONFIG = Config.TALISMAN_CONFIG.copy()
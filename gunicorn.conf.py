@@ -0,0 +1,45 @@
+import multiprocessing
+import os
+
+# [新增] 生产启动配置：gunicorn -c gunicorn.conf.py
+# 应用在 master 中初始化并预热一次（preload_app），之后 fork 出的 worker
+# 通过写时复制共享已导入的模块、WhiteNoise 文件索引、已编译的模板和搜索索引。
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+preload_app = True
+
+# [新增] 由 master 启动本机唯一的写进程（留言、注册等小写入在其中合并提交）；
+# WRITER_SOCKET 为空，或 SECRET_KEY 未设置时不启动，各 worker 使用自己的写线程
+_writer_process = None
+
+def on_starting(server):
+    global _writer_process
+    from wsgi import application
+    from app import writer
+    if not application.config.get('WRITER_SOCKET'):
+        return
+    if writer.insecure_secret(application):
+        print("SECRET_KEY 为开发默认值，不启动写进程（各 worker 使用自己的写线程）")
+        return
+    import multiprocessing
+    _writer_process = multiprocessing.get_context('fork').Process(
+        target=writer.serve, args=(application,), name='db-writer', daemon=True)
+    _writer_process.start()
+
+def on_exit(server):
+    if _writer_process is not None:
+        _writer_process.terminate()
+
+def when_ready(server):
+    # master 已完成导入与预热，冻结现有对象后再 fork worker
+    from app.warmup import freeze_for_fork
+    freeze_for_fork()
+
+def post_fork(server, worker):
+    from wsgi import application
+    from app.warmup import reinit_after_fork
+    reinit_after_fork(application)
@@ -0,0 +1,136 @@
+/**
+ * Chunked Upload - 大图片的分块、可续传上传（编辑商品页）
+ * 按服务器返回的块大小切片上传，每块附带 SHA-256 校验；网络中断后从服务器确认的位置继续，
+ * 上传 ID 保存在 localStorage 中，刷新页面后重新选择同一文件即可续传。
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const section = document.getElementById('chunked-upload');
+    if (!section) {
+        return;
+    }
+
+    const input = section.querySelector('input[type="file"]');
+    const button = section.querySelector('button');
+    const progress = section.querySelector('progress');
+    const status = section.querySelector('.upload-status');
+    const createUrl = section.getAttribute('data-create-url');
+    const productId = section.getAttribute('data-product-id');
+    const MAX_RETRIES = 5;
+
+    // crypto.subtle 只在安全上下文 (HTTPS / localhost) 中可用，否则不附带校验
+    async function sha256Hex(buffer) {
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function requestJson(url, options) {
+        const response = await fetch(url, Object.assign({ credentials: 'same-origin' }, options));
+        const data = response.status === 204 ? {} : await response.json().catch(() => ({}));
+        return { status: response.status, data: data };
+    }
+
+    async function startOrResume(file, storageKey) {
+        const savedUrl = localStorage.getItem(storageKey);
+        if (savedUrl) {
+            const result = await requestJson(savedUrl, { method: 'GET' });
+            if (result.status === 200) {
+                return { url: savedUrl, state: result.data };
+            }
+            localStorage.removeItem(storageKey);
+        }
+        const result = await requestJson(createUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                product_id: productId,
+                filename: file.name,
+                size: file.size,
+                sha256: await sha256Hex(await file.arrayBuffer())
+            })
+        });
+        if (result.status !== 201) {
+            throw new Error(result.data.error || '无法创建上传。');
+        }
+        const url = createUrl + '/' + result.data.id;
+        localStorage.setItem(storageKey, url);
+        return { url: url, state: result.data };
+    }
+
+    async function upload(file) {
+        const storageKey = ['chunked-upload', productId, file.name, file.size, file.lastModified].join(':');
+        const session = await startOrResume(file, storageKey);
+        let offset = session.state.offset;
+        const chunkSize = session.state.chunk_size;
+        let retries = 0;
+
+        progress.max = file.size;
+        while (true) {
+            progress.value = offset;
+            status.textContent = `已上传 ${(offset / 1048576).toFixed(1)} / ${(file.size / 1048576).toFixed(1)} MB`;
+
+            const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+            const headers = { 'Content-Type': 'application/octet-stream', 'Upload-Offset': String(offset) };
+            const checksum = await sha256Hex(chunk);
+            if (checksum) {
+                headers['Upload-Checksum'] = 'sha256 ' + checksum;
+            }
+
+            let result;
+            try {
+                result = await requestJson(session.url, { method: 'PATCH', headers: headers, body: chunk });
+            } catch (error) {
+                // 网络中断：稍后向服务器确认进度后继续
+                if (++retries > MAX_RETRIES) {
+                    throw new Error('网络连接中断，请稍后重新选择该文件继续上传。');
+                }
+                await sleep(1000 * retries);
+                const state = await requestJson(session.url, { method: 'GET' }).catch(() => null);
+                if (state && state.status === 200) {
+                    offset = state.data.offset;
+                }
+                continue;
+            }
+
+            if (result.status === 200 && result.data.complete) {
+                localStorage.removeItem(storageKey);
+                progress.value = file.size;
+                return;
+            }
+            if (result.status === 200) {
+                offset = result.data.offset;
+                retries = 0;
+            } else if ((result.status === 409 || result.status === 400 || result.status === 422)
+                       && result.data.offset !== undefined && ++retries <= MAX_RETRIES) {
+                offset = result.data.offset;
+            } else {
+                localStorage.removeItem(storageKey);
+                throw new Error(result.data.error || `上传失败 (HTTP ${result.status})`);
+            }
+        }
+    }
+
+    button.addEventListener('click', async function() {
+        const file = input.files[0];
+        if (!file) {
+            status.textContent = '请先选择图片。';
+            return;
+        }
+        button.disabled = true;
+        try {
+            await upload(file);
+            status.textContent = '上传完成，正在刷新页面…';
+            window.location.reload();
+        } catch (error) {
+            status.textContent = error.message;
+            button.disabled = false;
+        }
+    });
+});
@@ -0,0 +1,50 @@
+/**
+ * Search Suggest - 输入即提示
+ * 调用 /search/suggest 接口，将结果填充到搜索框关联的 <datalist>。
+ * 外部脚本文件，符合 CSP 安全策略。
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.querySelector('input[data-suggest-url]');
+    if (!input) {
+        return;
+    }
+
+    const datalist = document.getElementById(input.getAttribute('list'));
+    const suggestUrl = input.getAttribute('data-suggest-url');
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener('input', function() {
+        const query = input.value.trim();
+        clearTimeout(timer);
+
+        if (!query) {
+            datalist.innerHTML = '';
+            return;
+        }
+
+        // 1. 简单防抖：停止输入 120ms 后再请求
+        timer = setTimeout(function() {
+            // 2. 取消尚未返回的上一次请求
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+
+            fetch(suggestUrl + '?q=' + encodeURIComponent(query), { signal: controller.signal })
+                .then(response => response.json())
+                .then(data => {
+                    // 3. 重新填充候选项
+                    datalist.innerHTML = '';
+                    data.suggestions.forEach(item => {
+                        const option = document.createElement('option');
+                        option.value = item.name;
+                        option.label = item.type === 'category' ? '分类' : '产品';
+                        datalist.appendChild(option);
+                    });
+                })
+                .catch(() => {});
+        }, 120);
+    });
+});
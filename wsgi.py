@@ -1,7 +1,12 @@
 from app import create_app
+from app.warmup import warmup
 import os
 
 # Gunicorn/uWSGI 会查找名为 'application' 的可调用对象
 # 我们从环境变量加载生产配置
 config_name = os.environ.get('FLASK_CONFIG', 'production')
-application = create_app(config_name)
\ No newline at end of file
+application = create_app(config_name)
+
+# [修改] 启动时预热（模板编译、搜索建议索引、分类与首批列表页），
+# 避免首个请求承担这些开销。配合 gunicorn.conf.py 的 preload_app 只在 master 中执行一次。
+warmup(application)